@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Stripe Connect: stores partitioned by connected account.
+
+Requests carrying a ``Stripe-Account`` header are answered from that
+account's own :class:`StripeMockAPI`; the others from the platform's::
+
+    accounts = ConnectedAccounts(fixture=add_plans)
+    accounts['acct_1'].add_customer('cus_1')
+    accounts.sync()
+
+    stripe.Customer.retrieve('cus_1', stripe_account='acct_1')
+
+Partitions (stores, search indexes, event log and routes) are created on
+first use, by a request or by item access, and can be evicted, either
+explicitly or least recently used first past ``max_accounts``. They are
+compact by default (see :mod:`stripe_mock.records`), so every account's
+objects share the same per-type defaults, and an account keeps only what
+sets it apart.
+"""
+import collections
+import threading
+
+import responses
+
+from .mock_api import StripeMockAPI
+from .router import install
+
+#: header selecting the connected account of a request
+ACCOUNT_HEADER = 'Stripe-Account'
+
+
+def _header(headers, name):
+    """Return a header, looked up case-insensitively."""
+    if not headers:
+        return None
+    value = headers.get(name)
+    if value is None:
+        value = headers.get(name.lower())
+    if value is None and not hasattr(headers, 'lower_items'):
+        lower = name.lower()
+        for key, header_value in headers.items():
+            if key.lower() == lower:
+                return header_value
+    return value
+
+
+class ConnectedAccounts(object):
+
+    """Platform and connected account partitions, routed by header.
+
+    Can be used wherever a :class:`StripeMockAPI` dispatches requests:
+    :meth:`sync` for :mod:`responses`, or with
+    :class:`~stripe_mock.server.StripeMockServer` and
+    :mod:`~stripe_mock.transports`.
+
+    :param fixture: called with (api, account id) to fill each partition
+        as it's created, including again after an eviction
+    :type fixture: callable
+    :param max_accounts: evict the least recently used partition past this
+        many; unbounded by default
+    :type max_accounts: int
+    :param platform: answers requests without a ``Stripe-Account`` header;
+        a new one by default
+    :type platform: :class:`StripeMockAPI`
+    :param api_kwargs: for the partitions' :class:`StripeMockAPI`,
+        ``compact=True`` unless given
+    """
+
+    def __init__(self, fixture=None, max_accounts=None, platform=None,
+                 **api_kwargs):
+        api_kwargs.setdefault('compact', True)
+        self.fixture = fixture
+        self.max_accounts = max_accounts
+        self.api_kwargs = api_kwargs
+        self.platform = platform or StripeMockAPI(**api_kwargs)
+        #: partitions by account id, least recently used first
+        self.accounts = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, account_id):
+        return self.account(account_id)
+
+    def __contains__(self, account_id):
+        return account_id in self.accounts
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def account(self, account_id):
+        """Return the partition of an account, creating it if needed.
+
+        :param account_id: e.g. 'acct_1032D82eZvKYlo2C'
+        :type account_id: string
+        :rtype: :class:`StripeMockAPI`
+        """
+        # the recency order is changed under the lock, like evictions
+        with self._lock:
+            api = self.accounts.get(account_id)
+            if api is not None:
+                self.accounts.move_to_end(account_id)
+            else:
+                api = StripeMockAPI(**self.api_kwargs)
+                if self.fixture is not None:
+                    self.fixture(api, account_id)
+                self.accounts[account_id] = api
+                if (self.max_accounts is not None and
+                        len(self.accounts) > self.max_accounts):
+                    self.accounts.popitem(last=False)
+        return api
+
+    def evict(self, account_id):
+        """Drop an account's partition; it's recreated on next use.
+
+        :returns: whether there was a partition to drop
+        :rtype: bool
+        """
+        with self._lock:
+            return self.accounts.pop(account_id, None) is not None
+
+    def api_for(self, request):
+        """Return the partition a request is answered from.
+
+        :rtype: :class:`StripeMockAPI`
+        """
+        account_id = _header(
+            getattr(request, 'headers', None), ACCOUNT_HEADER)
+        if account_id is None:
+            return self.platform
+        return self.account(account_id)
+
+    def matches(self, request):
+        return self.api_for(request).matches(request)
+
+    def dispatch(self, request):
+        """Answer a request from its account's partition, see
+        :meth:`StripeMockAPI.dispatch`."""
+        return self.api_for(request).dispatch(request)
+
+    def refresh(self, workers=None):
+        """Rebuild the routes of the platform and every partition.
+
+        Partitions created later build theirs on first use.
+        """
+        self.platform.refresh(workers=workers)
+        for api in list(self.accounts.values()):
+            api.refresh(workers=workers)
+
+    def sync(self, workers=None):
+        """Clear the :mod:`responses` mock and serve every partition
+        through it, see :meth:`StripeMockAPI.sync`."""
+        responses.reset()
+        self.refresh(workers=workers)
+        install(self, ('GET', 'POST', 'DELETE'))
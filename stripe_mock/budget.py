@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""Count stripe calls by route, and hold code to a budget of them.
+
+Performance regressions in billing code tend to show as extra round
+trips to stripe: a ``Customer.retrieve`` per item of a loop, a list
+fetched twice. A :class:`CallCounter` counts the requests answered
+through :mod:`responses` (see :data:`stripe_mock.router.listeners`)
+while it's entered, by route name::
+
+    with CallCounter() as calls:
+        sync_billing()
+    calls.check(total=5, customer_retrieve=1)
+
+Route names are the resources of the url path, singular, and the
+action: ``customer_retrieve``, ``customer_list``, ``customer_search``,
+``customer_create``, ``customer_update``, ``customer_delete``,
+``customer_source_list``, ``checkout_session_retrieve``... Other
+requests to a sub-path of an object are named after it, e.g.
+``invoice_pay``.
+
+See :mod:`stripe_mock.pytest_plugin` for per-test budgets.
+"""
+import collections
+import threading
+from urllib.parse import urlsplit
+
+from . import router
+
+# path segments grouping resources, not followed by ids
+_NAMESPACES = frozenset([
+    'billing_portal',
+    'checkout',
+    'identity',
+    'issuing',
+    'radar',
+    'reporting',
+    'terminal',
+    'test_helpers',
+    'treasury',
+])
+
+_ACTIONS = {
+    'collection': {'GET': 'list', 'POST': 'create', 'DELETE': 'delete'},
+    'id': {'GET': 'retrieve', 'POST': 'update', 'DELETE': 'delete'},
+    'singular': {'GET': 'retrieve', 'DELETE': 'delete'},
+}
+
+
+class BudgetExceeded(AssertionError):
+
+    """Raised when code made more stripe calls than its budget.
+
+    :param overruns: (route name or 'total', calls made, budget)
+    :type overruns: list[(string, int, int)]
+    """
+
+    def __init__(self, overruns):
+        self.overruns = overruns
+        super().__init__('Stripe call budget exceeded: {}'.format(', '.join(
+            '{} made {} calls, budget {}'.format(*overrun)
+            for overrun in overruns)))
+
+
+def _singular(segment):
+    if segment.endswith('ies'):
+        return '{}y'.format(segment[:-3])
+    if segment.endswith('s'):
+        return segment[:-1]
+    return segment
+
+
+def route_name(method, url):
+    """Return the name of the route of a stripe request.
+
+    :param method: GET, POST, DELETE, etc.
+    :type method: string
+    :param url: requested url, the query string is ignored
+    :type url: string
+    :returns: e.g. 'customer_retrieve' for ``GET /v1/customers/cus_1``
+    :rtype: string
+    """
+    segments = [segment for segment in urlsplit(url).path.split('/')
+                if segment]
+    if segments[:1] == ['v1']:
+        del segments[0]
+
+    nouns = []
+    last = None
+    for segment in segments:
+        if last == 'collection' and segment != 'search':
+            last = 'id'
+        elif segment == 'search':
+            last = 'search'
+        elif segment in _NAMESPACES:
+            nouns.append(segment)
+            last = 'namespace'
+        else:
+            nouns.append(_singular(segment))
+            last = 'collection' if segment.endswith('s') else 'singular'
+
+    if last == 'search':
+        action = 'search'
+    else:
+        action = _ACTIONS.get(last, {}).get(method)
+    if action is not None:
+        nouns.append(action)
+    return '_'.join(nouns) or method.lower()
+
+
+class CallCounter(object):
+
+    """Stripe calls by route name, counted while the counter is entered.
+
+    Usable from several threads; counters can be nested, each counts
+    every call.
+    """
+
+    def __init__(self):
+        #: calls by route name, see :func:`route_name`
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        """Number of calls, over all routes."""
+        return sum(self.counts.values())
+
+    def record(self, request):
+        """Count a request, as a :data:`stripe_mock.router.listeners`.
+
+        :param request: anything with ``method`` and ``url`` attributes
+        """
+        name = route_name(request.method, request.url)
+        with self._lock:
+            self.counts[name] += 1
+
+    def reset(self):
+        """Forget the calls counted so far."""
+        with self._lock:
+            self.counts.clear()
+
+    def overruns(self, total=None, **routes):
+        """Return how the calls counted exceed a budget.
+
+        :param total: calls allowed over all routes, None for no limit
+        :type total: int
+        :param routes: calls allowed per route name
+        :returns: (route name or 'total', calls made, budget), routes
+            first, by name
+        :rtype: list[(string, int, int)]
+        """
+        with self._lock:
+            counts = dict(self.counts)
+        overruns = [
+            (name, counts.get(name, 0), budget)
+            for name, budget in sorted(routes.items())
+            if counts.get(name, 0) > budget
+        ]
+        calls = sum(counts.values())
+        if total is not None and calls > total:
+            overruns.append(('total', calls, total))
+        return overruns
+
+    def check(self, total=None, **routes):
+        """Assert the calls counted fit a budget, see :meth:`overruns`.
+
+        :raises: :class:`BudgetExceeded` if they don't
+        """
+        overruns = self.overruns(total, **routes)
+        if overruns:
+            raise BudgetExceeded(overruns)
+
+    def format_counts(self, limit=None):
+        """Return the routes called most, e.g.
+        'customer_retrieve=12, customer_list=1'.
+
+        :param limit: number of routes, None for all
+        :type limit: int
+        :rtype: string
+        """
+        with self._lock:
+            most_common = self.counts.most_common(limit)
+        return ', '.join(
+            '{}={}'.format(name, calls) for name, calls in most_common)
+
+    def __enter__(self):
+        router.listeners.append(self.record)
+        return self
+
+    def __exit__(self, *exc_info):
+        router.listeners.remove(self.record)
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""Command line interface, ``python -m stripe_mock``.
+
+Subcommands:
+
+- ``generate``: write a generated dataset (see :mod:`stripe_mock.dataset`)
+- ``stats``: object counts, memory per store and JSON size per resource
+- ``bench``: time sync() and the lookup / list / search workload
+- ``bench-render``: time rendering objects through their byte templates
+- ``serve``: serve a dataset, and fixture files reloaded as they change,
+  over HTTP
+- ``codegen``: generate :mod:`stripe_mock.generated` from the OpenAPI spec
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import timeit
+
+import requests
+import responses
+
+from . import codegen
+from .dataset import load_dataset, read_dataset, write_dataset
+from .encoding import encode_json
+from .fixtures import FixtureFiles
+from .generate import generate_objects
+from .mock_api import StripeMockAPI
+from .patterns import API_BASE
+from .profiling import Profiler
+from .server import DEFAULT_PORT, StripeMockServer
+from .templates import TEMPLATES
+from .timeindex import TimeIndex
+
+#: (label, attribute) of the stores reported by ``stats``
+STORES = (
+    ('customers', 'customers'),
+    ('plans', 'plans'),
+    ('coupons', 'coupons'),
+    ('subscriptions', 'customer_subscriptions'),
+    ('sources', 'customer_sources'),
+    ('cards', 'customer_source_cards'),
+    ('bank_accounts', 'customer_source_bank_accounts'),
+    ('invoices', 'invoices'),
+    ('charges', 'charges'),
+)
+
+
+BENCH_ROW = '{:<24}{:>10}{:>12.0f}{:>10.3f}{:>10.3f}{:>10.3f}'
+
+#: (object type, ids, overrides) rendered by ``bench-render``
+RENDER_CASES = (
+    ('customer', ('cus_bench', ), {}),
+    ('customer', ('cus_bench', ), {'email': 'bench@example.com'}),
+    ('subscription', ('cus_bench', 'sub_bench'), {}),
+    ('subscription', ('cus_bench', 'sub_bench'), {'status': 'past_due'}),
+    ('card', ('cus_bench', 'card_bench'), {}),
+    ('bank_account', ('cus_bench', 'ba_bench'), {}),
+    ('source', ('cus_bench', 'src_bench'), {}),
+    ('plan', ('plan_bench', ), {}),
+    ('coupon', ('coupon_bench', ), {}),
+)
+RENDER_ROW = '{:<16}{:<24}{:>12.2f}{:>12.2f}{:>9.1f}x'
+
+
+def deep_sizeof(obj, seen=None):
+    """Return the memory held by obj and everything it references.
+
+    Objects already in ``seen`` (by id) are not counted again, so passing
+    the same set across calls attributes shared objects to the first
+    caller.
+
+    :rtype: int
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            for cls in type(obj).__mro__:
+                for slot in cls.__dict__.get('__slots__', ()):
+                    if hasattr(obj, slot):
+                        stack.append(getattr(obj, slot))
+    return size
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """Return the given percentiles (nearest rank) of a list of samples.
+
+    :rtype: list[float]
+    """
+    ordered = sorted(samples)
+    return [
+        ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))]
+        for point in points
+    ]
+
+
+def _load(path, compact=False):
+    api = StripeMockAPI(compact=compact)
+    started = time.perf_counter()
+    count = load_dataset(api, path)
+    return api, count, time.perf_counter() - started
+
+
+def cmd_generate(args):
+    started = time.perf_counter()
+    count = write_dataset(
+        generate_objects(
+            args.customers,
+            subscriptions=args.subscriptions,
+            sources=args.sources,
+            seed=args.seed,
+            invoices=args.invoices,
+        ),
+        args.output,
+    )
+    print('wrote {} objects to {} in {:.2f}s'.format(
+        count, args.output, time.perf_counter() - started))
+
+
+def cmd_stats(args):
+    api, count, elapsed = _load(args.dataset, args.compact)
+    print('loaded {} objects in {:.2f}s'.format(count, elapsed))
+
+    print()
+    print('{:<16}{:>12}{:>16}'.format('store', 'objects', 'memory (bytes)'))
+    seen = set()
+    for label, attribute in STORES:
+        store = getattr(api, attribute)
+        if isinstance(store, TimeIndex):
+            objects = list(store)
+            store = vars(store)  # entries, and their indexes
+        elif isinstance(store, list):
+            objects = store
+        else:
+            objects = [obj for objs in store.values() for obj in objs]
+        print('{:<16}{:>12}{:>16}'.format(
+            label, len(objects), deep_sizeof(store, seen)))
+
+    sizes = {}
+    for obj in read_dataset(args.dataset):
+        encoded = len(json.dumps(obj))
+        total, largest = sizes.get(obj['object'], (0, 0))
+        sizes[obj['object']] = (total + encoded, max(largest, encoded))
+
+    print()
+    print('{:<16}{:>16}{:>12}'.format('resource', 'json (bytes)', 'largest'))
+    for object_type, (total, largest) in sorted(sizes.items()):
+        print('{:<16}{:>16}{:>12}'.format(object_type, total, largest))
+
+
+def _time_requests(session, urls):
+    latencies = []
+    started = time.perf_counter()
+    for url in urls:
+        request_started = time.perf_counter()
+        session.get(url).content
+        latencies.append(time.perf_counter() - request_started)
+    return time.perf_counter() - started, latencies
+
+
+def cmd_bench(args):
+    api, count, elapsed = _load(args.dataset, args.compact)
+    print('loaded {} objects in {:.2f}s'.format(count, elapsed))
+
+    rng = random.Random(args.seed)
+    customer_ids = [c['id'] for c in api.customers]
+    subscription_ids = [sub['id'] for sub in api.subscriptions]
+    emails = [c['email'] for c in api.customers]
+    base = API_BASE
+
+    workloads = []
+    if customer_ids:
+        workloads.append(('customer.retrieve', [
+            '{}/v1/customers/{}'.format(base, rng.choice(customer_ids))
+            for _ in range(args.requests)
+        ]))
+        workloads.append(('customer.search', [
+            "{}/v1/customers/search?query=email:'{}'".format(
+                base, rng.choice(emails)) for _ in range(args.requests)
+        ]))
+        workloads.append(('customer.list', [
+            '{}/v1/customers'.format(base)
+        ] * args.list_requests))
+    if subscription_ids:
+        workloads.append(('subscription.retrieve', [
+            '{}/v1/subscriptions/{}'.format(
+                base, rng.choice(subscription_ids))
+            for _ in range(args.requests)
+        ]))
+        workloads.append(('subscription.list', [
+            '{}/v1/subscriptions'.format(base)
+        ] * args.list_requests))
+
+    if args.profile or args.cprofile:
+        api.profiler = Profiler(cprofile=bool(args.cprofile))
+
+    # sync() registers its mocks on the module-level responses mock
+    responses.start()
+    try:
+        started = time.perf_counter()
+        api.sync(workers=args.workers)
+        print('sync() in {:.2f}s'.format(time.perf_counter() - started))
+
+        print()
+        print('{:<24}{:>10}{:>12}{:>10}{:>10}{:>10}'.format(
+            'workload', 'requests', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms'))
+        with requests.Session() as session:
+            for label, urls in workloads:
+                total, latencies = _time_requests(session, urls)
+                p50, p90, p99 = percentiles(latencies)
+                print(BENCH_ROW.format(
+                    label, len(urls), len(urls) / total, p50 * 1000,
+                    p90 * 1000, p99 * 1000))
+    finally:
+        responses.stop()
+        responses.reset()
+
+    if api.profiler is not None:
+        print()
+        print(api.profiler.format_stats())
+    if args.profile:
+        api.profiler.write_folded(args.profile)
+    if args.cprofile:
+        api.profiler.cprofile.dump_stats(args.cprofile)
+
+
+def cmd_bench_render(args):
+    print('{:<16}{:<24}{:>12}{:>12}{:>10}'.format(
+        'object', 'overrides', 'dict+json us', 'template us', 'speedup'))
+    for object_type, ids, overrides in RENDER_CASES:
+        template = TEMPLATES[object_type]
+        if template.render(*ids, **overrides) != encode_json(
+                template.factory(*ids, **overrides)):
+            sys.exit('{} template renders differently'.format(object_type))
+        slow = timeit.timeit(
+            lambda: encode_json(template.factory(*ids, **overrides)),
+            number=args.number) / args.number
+        fast = timeit.timeit(
+            lambda: template.render(*ids, **overrides),
+            number=args.number) / args.number
+        print(RENDER_ROW.format(
+            object_type, ','.join(overrides) or '-', slow * 1e6, fast * 1e6,
+            slow / fast))
+
+
+def _print_reload(path, changes):
+    print('reloaded {}: {} added, {} updated, {} removed'.format(
+        path, *map(len, changes)))
+
+
+def cmd_serve(args):
+    api = StripeMockAPI(compact=args.compact)
+    if args.dataset:
+        load_dataset(api, args.dataset)
+    fixtures = None
+    if args.fixtures:
+        fixtures = FixtureFiles(api, args.fixtures)
+        fixtures.load()
+    server = StripeMockServer(
+        api, (args.host, args.port), workers=args.workers)
+    if fixtures is not None:
+        fixtures.listeners.append(_print_reload)
+        fixtures.start(args.poll)
+    print('serving {} customers on http://{}:{}'.format(
+        len(api.customers), *server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if fixtures is not None:
+            fixtures.stop()
+        server.server_close()
+
+
+def cmd_codegen(args):
+    up_to_date = codegen.write(args.spec, args.output, check=args.check)
+    if args.check and not up_to_date:
+        sys.exit('{} is out of date with {}'.format(args.output, args.spec))
+    print('{} {}'.format(
+        args.output, 'up to date' if up_to_date else 'written'))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m stripe_mock',
+        description='Generate, inspect, benchmark and serve stripe fixtures.',
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    generate = subparsers.add_parser(
+        'generate', help='write a generated dataset')
+    generate.add_argument('output', help='dataset path (.jsonl or .jsonl.gz)')
+    generate.add_argument('-n', '--customers', type=int, default=1000)
+    generate.add_argument(
+        '--subscriptions', type=int, default=1,
+        help='subscriptions per customer')
+    generate.add_argument(
+        '--sources', type=int, default=1, help='sources per customer')
+    generate.add_argument(
+        '--invoices', type=int, default=0,
+        help='invoices (and charges) per subscription')
+    generate.add_argument('--seed', type=int, default=0)
+    generate.set_defaults(func=cmd_generate)
+
+    stats = subparsers.add_parser(
+        'stats', help='object counts, memory and serialized size')
+    stats.add_argument('dataset')
+    stats.add_argument(
+        '--compact', action='store_true',
+        help='store objects as __slots__ records')
+    stats.set_defaults(func=cmd_stats)
+
+    bench = subparsers.add_parser(
+        'bench', help='throughput and latency of the standard workload')
+    bench.add_argument('dataset')
+    bench.add_argument(
+        '--requests', type=int, default=100,
+        help='requests per lookup / search workload')
+    bench.add_argument(
+        '--list-requests', type=int, default=10,
+        help='requests per list workload')
+    bench.add_argument('--seed', type=int, default=0)
+    bench.add_argument(
+        '--compact', action='store_true',
+        help='store objects as __slots__ records')
+    bench.add_argument(
+        '--workers', type=int, help='processes rendering the responses')
+    bench.add_argument(
+        '--profile', metavar='PATH',
+        help='write the time per phase as flame graph folded stacks')
+    bench.add_argument(
+        '--cprofile', metavar='PATH',
+        help='write a cProfile of sync() and the requests')
+    bench.set_defaults(func=cmd_bench)
+
+    bench_render = subparsers.add_parser(
+        'bench-render', help='per-object rendering time, templates vs json')
+    bench_render.add_argument(
+        '--number', type=int, default=20000, help='renders per case')
+    bench_render.set_defaults(func=cmd_bench_render)
+
+    serve = subparsers.add_parser('serve', help='serve a dataset over HTTP')
+    serve.add_argument('dataset', nargs='?')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve.add_argument(
+        '--compact', action='store_true',
+        help='store objects as __slots__ records')
+    serve.add_argument(
+        '--workers', type=int, help='processes rendering the responses')
+    serve.add_argument(
+        '--fixtures', nargs='+', metavar='PATH',
+        help='fixture files (.yaml, .json, .jsonl), reloaded on change')
+    serve.add_argument(
+        '--poll', type=float, default=0.5,
+        help='seconds between checks of the fixture files')
+    serve.set_defaults(func=cmd_serve)
+
+    generate_code = subparsers.add_parser(
+        'codegen', help='generate factories and routes from the OpenAPI spec')
+    generate_code.add_argument(
+        '--spec', default=codegen.SPEC_PATH, help='spec3.json to read')
+    generate_code.add_argument(
+        '--output', default=codegen.OUTPUT_PATH, help='module to write')
+    generate_code.add_argument(
+        '--check', action='store_true',
+        help='exit with an error if the module is out of date')
+    generate_code.set_defaults(func=cmd_codegen)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
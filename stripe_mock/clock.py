@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""Simulated clock driving subscription billing cycles.
+
+Loosely modeled on stripe's test clocks
+(https://stripe.com/docs/billing/testing/test-clocks): time only moves
+forward, and advancing it walks every subscription through the renewals,
+trial ends and period-end cancellations that fell due in between.
+"""
+import calendar
+import functools
+import heapq
+from datetime import datetime, timezone
+
+from .records import peek
+
+#: the fake factories' timestamps are from around this time
+DEFAULT_FROZEN_TIME = 1513273056
+
+_INTERVAL_SECONDS = {
+    'day': 86400,
+    'week': 7 * 86400,
+}
+
+
+@functools.lru_cache(maxsize=2**16)
+def add_interval(timestamp, interval, interval_count=1):
+    """Move a unix timestamp forward by a plan's billing interval.
+
+    Months and years keep the day of month, clamped to the end of shorter
+    months, like stripe's billing cycle anchor. Memoized, since billing
+    anchors of large fixtures tend to cluster.
+
+    :param timestamp: unix timestamp
+    :type timestamp: int
+    :param interval: 'day', 'week', 'month' or 'year'
+    :type interval: string
+    :param interval_count: number of intervals
+    :type interval_count: int
+    :rtype: int
+    """
+    if interval in _INTERVAL_SECONDS:
+        return timestamp + _INTERVAL_SECONDS[interval] * interval_count
+
+    months = interval_count * (12 if interval == 'year' else 1)
+    dt = datetime.fromtimestamp(timestamp, timezone.utc)
+    month_index = dt.month - 1 + months
+    year = dt.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(dt.day, calendar.monthrange(year, month)[1])
+    return calendar.timegm(dt.replace(year=year, month=month,
+                                      day=day).utctimetuple())
+
+
+def next_event_time(subscription):
+    """Return when a subscription next changes state, or None if never.
+
+    :param subscription: subscription data
+    :type subscription: dict
+    :rtype: int or None
+    """
+    status = subscription.get('status')
+    if status == 'trialing' and subscription.get('trial_end'):
+        return subscription['trial_end']
+    if status in ('active', 'past_due'):
+        return subscription.get('current_period_end')
+    return None
+
+
+def _advance_subscription(subscription, event_time):
+    """Apply the transition due at event_time to a subscription in place.
+
+    Subscriptions canceled at period end are canceled when their trial
+    ends, like stripe does.
+    """
+    if subscription.get('cancel_at_period_end'):
+        subscription.update({
+            'status': 'canceled',
+            'canceled_at': subscription.get('canceled_at') or event_time,
+            'ended_at': event_time,
+        })
+        return
+    if subscription['status'] == 'trialing':
+        subscription['status'] = 'active'
+        period_start = event_time
+    else:
+        period_start = subscription['current_period_end']
+
+    plan = peek(subscription, 'plan')
+    if plan is None or isinstance(plan, str):
+        # no plan, or the id of one that isn't stored: monthly
+        plan = {}
+    subscription['current_period_start'] = period_start
+    subscription['current_period_end'] = add_interval(
+        period_start,
+        plan.get('interval', 'month'),
+        plan.get('interval_count') or 1,
+    )
+
+
+class TestClock(object):
+
+    """Min-heap of subscriptions keyed by when they next change state.
+
+    Advancing the clock only pops subscriptions whose event is due, so the
+    cost is proportional to the number of transitions, not to the number
+    of subscriptions.
+
+    Rescheduling a subscription pushes a new heap entry and leaves the old
+    one behind; stale entries are recognized and dropped when popped.
+
+    :param frozen_time: current simulated unix timestamp
+    :type frozen_time: int
+    """
+
+    __test__ = False  # keep pytest from collecting this class
+
+    def __init__(self, frozen_time=DEFAULT_FROZEN_TIME):
+        self.frozen_time = frozen_time
+        self._heap = []
+        self._scheduled = {}
+        self._subscriptions = {}
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def schedule(self, subscription):
+        """(Re)schedule a subscription's next transition.
+
+        Call whenever a subscription is added or its status / period
+        fields change.
+
+        :param subscription: subscription data, kept by reference
+        :type subscription: dict
+        """
+        subscription_id = subscription['id']
+        event_time = next_event_time(subscription)
+        if event_time is None:
+            self.unschedule(subscription_id)
+            return
+
+        self._subscriptions[subscription_id] = subscription
+        if self._scheduled.get(subscription_id) != event_time:
+            self._scheduled[subscription_id] = event_time
+            heapq.heappush(self._heap, (event_time, subscription_id))
+
+    def unschedule(self, subscription_id):
+        """Stop tracking a subscription, e.g. after deleting it.
+
+        :param subscription_id: id of subscription
+        :type subscription_id: string
+        """
+        self._scheduled.pop(subscription_id, None)
+        self._subscriptions.pop(subscription_id, None)
+
+    def advance(self, frozen_time):
+        """Move the clock forward, applying every transition that falls due.
+
+        A subscription may transition several times in one call, e.g. twelve
+        renewals when jumping a year on a monthly plan.
+
+        :param frozen_time: unix timestamp to move to
+        :type frozen_time: int
+        :raises: :class:`ValueError` if frozen_time is in the past
+        :returns: subscriptions that changed, each listed once
+        :rtype: list[dict]
+        """
+        if frozen_time < self.frozen_time:
+            raise ValueError(
+                'Cannot move clock backwards from {} to {}'.format(
+                    self.frozen_time, frozen_time))
+
+        heap = self._heap
+        scheduled = self._scheduled
+        changed = {}
+        while heap and heap[0][0] <= frozen_time:
+            event_time, subscription_id = heapq.heappop(heap)
+            if scheduled.get(subscription_id) != event_time:
+                continue  # stale entry, rescheduled or unscheduled since
+
+            # catch up on every transition due for this subscription before
+            # going back to the heap, instead of one push / pop per period
+            subscription = self._subscriptions[subscription_id]
+            next_time = event_time
+            while next_time is not None and next_time <= frozen_time:
+                _advance_subscription(subscription, next_time)
+                next_time = next_event_time(subscription)
+            changed[subscription_id] = subscription
+
+            if next_time is None:
+                self.unschedule(subscription_id)
+            else:
+                scheduled[subscription_id] = next_time
+                heapq.heappush(heap, (next_time, subscription_id))
+
+        self.frozen_time = frozen_time
+        return list(changed.values())
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""Generate ``fake_*`` factories and routes from stripe's OpenAPI spec.
+
+The factories of :mod:`stripe_mock.fake` are written by hand for the
+resources :class:`StripeMockAPI` models in depth. Every other resource of
+the spec gets a generated factory, returning the resource with default
+values for each of its fields, and the spec's GET routes to list and
+retrieve it. They are written to :mod:`stripe_mock.generated` as plain
+Python, so importing them doesn't parse the spec::
+
+    python -m stripe_mock codegen
+
+regenerates the module from the spec vendored in
+``stripe_mock/openapi/spec3.json``; pass ``--spec`` to generate from
+another copy, e.g. the full ``spec3.json`` of github.com/stripe/openapi,
+and ``--check`` to fail if the module is out of date.
+
+Defaults are derived from the field schemas: None for nullable fields,
+the first value of enums, the id of expandable fields, the defaults of
+nested object schemas, and zero values otherwise.
+"""
+import json
+import os
+import re
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+#: the vendored spec
+SPEC_PATH = os.path.join(_HERE, 'openapi', 'spec3.json')
+#: the generated module
+OUTPUT_PATH = os.path.join(_HERE, 'generated.py')
+
+#: default of ``unix-time`` fields, the ``created`` of the fake factories
+DEFAULT_TIMESTAMP = 1513262366
+#: default of ``currency`` fields
+DEFAULT_CURRENCY = 'usd'
+
+_REF_PREFIX = '#/components/schemas/'
+_INDENT = '    '
+_MAX_LINE = 79
+
+_ZERO_VALUES = {
+    'array': [],
+    'boolean': False,
+    'integer': 0,
+    'number': 0.0,
+    'string': '',
+}
+
+
+class _Name(str):
+
+    """A variable name, emitted bare rather than as a string literal."""
+
+    def __repr__(self):
+        return str(self)
+
+
+def load_spec(path=SPEC_PATH):
+    """Read an OpenAPI spec.
+
+    :param path: spec3.json file
+    :type path: string
+    :rtype: dict
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def _schema(spec, ref):
+    if not ref.startswith(_REF_PREFIX):
+        raise ValueError('Unsupported $ref: {}'.format(ref))
+    return spec['components']['schemas'][ref[len(_REF_PREFIX):]]
+
+
+def resources(spec):
+    """Return the resource schemas of a spec, by object type.
+
+    :rtype: dict
+    """
+    return {
+        schema['x-resourceId']: schema
+        for schema in spec['components']['schemas'].values()
+        if 'x-resourceId' in schema
+    }
+
+
+def default_value(spec, schema, seen=frozenset()):
+    """Return the default value of a field.
+
+    :param spec: the spec the schema's references point into
+    :type spec: dict
+    :param schema: the field's schema
+    :type schema: dict
+    :param seen: references being expanded, nested self references
+        default to None
+    :type seen: frozenset
+    """
+    if schema.get('nullable'):
+        return None
+    if 'enum' in schema:
+        return schema['enum'][0]
+
+    if 'anyOf' in schema:
+        variants = schema['anyOf']
+        # expandable fields default to the id of the object
+        for variant in variants:
+            if variant.get('type') == 'string':
+                return default_value(spec, variant, seen)
+        return default_value(spec, variants[0], seen)
+
+    if '$ref' in schema:
+        ref = schema['$ref']
+        if ref in seen:
+            return None
+        return default_value(spec, _schema(spec, ref), seen | {ref})
+
+    schema_type = schema.get('type', 'object')
+    if schema_type == 'object':
+        return {
+            key: default_value(spec, field, seen)
+            for key, field in sorted(schema.get('properties', {}).items())
+        }
+    if schema_type == 'integer' and schema.get('format') == 'unix-time':
+        return DEFAULT_TIMESTAMP
+    if schema_type == 'string':
+        if schema.get('format') == 'currency':
+            return DEFAULT_CURRENCY
+        # list urls
+        if schema.get('pattern', '').startswith('^/'):
+            return schema['pattern'][1:]
+    return _ZERO_VALUES[schema_type]
+
+
+def default_object(spec, object_type, object_id):
+    """Return a resource with default values.
+
+    :param object_type: e.g. 'product', see :func:`resources`
+    :type object_type: string
+    :param object_id: value of the ``id`` field
+    :rtype: dict
+    """
+    obj = default_value(spec, resources(spec)[object_type])
+    obj['id'] = object_id
+    return obj
+
+
+def routes(spec):
+    """Return the GET routes listing and retrieving resources.
+
+    A list route answers with a list of a resource, a retrieve route is
+    the list route's path followed by one path parameter and answers
+    with the resource. Routes of sub-resources (e.g. a checkout session's
+    line items) are left out.
+
+    :returns: (method, path, object type, 'list' or 'retrieve'), sorted
+    :rtype: list[tuple]
+    """
+    types = {
+        '{}{}'.format(_REF_PREFIX, name): schema['x-resourceId']
+        for name, schema in spec['components']['schemas'].items()
+        if 'x-resourceId' in schema
+    }
+
+    def response_schema(operation):
+        content = operation['responses'].get('200', {}).get('content', {})
+        return content.get('application/json', {}).get('schema', {})
+
+    lists = {}
+    for path, operations in spec['paths'].items():
+        if '{' in path or 'get' not in operations:
+            continue
+        data = response_schema(operations['get']).get(
+            'properties', {}).get('data', {})
+        object_type = types.get(data.get('items', {}).get('$ref'))
+        if object_type is not None:
+            lists[path] = object_type
+
+    table = []
+    for path, operations in spec['paths'].items():
+        if 'get' not in operations:
+            continue
+        if path in lists:
+            table.append(('GET', path, lists[path], 'list'))
+            continue
+        match = re.match(r'(.*)/\{\w+\}$', path)
+        if match is None or match.group(1) not in lists:
+            continue
+        object_type = types.get(
+            response_schema(operations['get']).get('$ref'))
+        if object_type == lists[match.group(1)]:
+            table.append(('GET', path, object_type, 'retrieve'))
+    return sorted(table)
+
+
+def factory_name(object_type):
+    """Return the name of a resource's factory, e.g. 'fake_tax_rate'.
+
+    :rtype: string
+    """
+    return 'fake_{}'.format(re.sub(r'\W', '_', object_type))
+
+
+def _literal(value, indent):
+    """Return the source of a value, nested dicts and lists one item per
+    line, the way :mod:`stripe_mock.fake` lays them out."""
+    if isinstance(value, dict) and value:
+        inner = _INDENT * (indent + 1)
+        lines = ['{']
+        for key, item in value.items():
+            lines.append('{}{!r}: {},'.format(
+                inner, key, _literal(item, indent + 1)))
+        lines.append('{}}}'.format(_INDENT * indent))
+        return '\n'.join(lines)
+    if isinstance(value, list) and value:
+        inner = _INDENT * (indent + 1)
+        lines = ['[']
+        for item in value:
+            lines.append('{}{},'.format(inner, _literal(item, indent + 1)))
+        lines.append('{}]'.format(_INDENT * indent))
+        return '\n'.join(lines)
+    return repr(value)
+
+
+def _factory_source(spec, object_type):
+    argument = '{}_id'.format(re.sub(r'\W', '_', object_type.split('.')[-1]))
+    obj = default_object(spec, object_type, _Name(argument))
+    return '\n'.join([
+        'def {}({}, **kwargs):'.format(factory_name(object_type), argument),
+        '    return {',
+        '        **{},'.format(_literal(obj, 2)),
+        '        **kwargs',
+        '    }',
+    ])
+
+
+def generate(spec, spec_name='spec3.json'):
+    """Return the source of the generated module.
+
+    :param spec: the OpenAPI spec
+    :type spec: dict
+    :param spec_name: name of the spec file, for the module's header
+    :type spec_name: string
+    :raises: :class:`ValueError` if a generated line is longer than 79
+        characters
+    :rtype: string
+    """
+    object_types = sorted(resources(spec))
+    parts = [
+        '# -*- coding: utf-8 -*-\n'
+        '# Generated by ``python -m stripe_mock codegen`` from {}, do not '
+        'edit.\n'
+        '"""Factories and routes of the resources of stripe\'s OpenAPI spec.'
+        '\n\nSee :mod:`stripe_mock.codegen`.\n"""\n\n'
+        '#: version of the spec generated from\n'
+        'SPEC_VERSION = {!r}\n'.format(spec_name, spec['info']['version'])
+    ]
+    for object_type in object_types:
+        parts.append('\n\n{}\n'.format(_factory_source(spec, object_type)))
+
+    parts.append('\n\n#: factory by the ``object`` of the resources\n')
+    parts.append('FACTORIES = {\n')
+    for object_type in object_types:
+        parts.append('    {!r}: {},\n'.format(
+            object_type, factory_name(object_type)))
+    parts.append('}\n')
+
+    parts.append(
+        '\n#: (method, path, object type, action) of the routes listing '
+        'and\n#: retrieving resources\n')
+    parts.append('ROUTES = (\n')
+    for route in routes(spec):
+        parts.append('    {!r},\n'.format(route))
+    parts.append(')\n')
+
+    source = ''.join(parts)
+    for number, line in enumerate(source.splitlines(), 1):
+        if len(line) > _MAX_LINE:
+            raise ValueError(
+                'Generated line {} is too long: {}'.format(number, line))
+    return source
+
+
+def write(spec_path=SPEC_PATH, output_path=OUTPUT_PATH, check=False):
+    """Generate the module from a spec file.
+
+    :param spec_path: spec3.json file
+    :type spec_path: string
+    :param output_path: module to write
+    :type output_path: string
+    :param check: compare with the module instead of writing it
+    :type check: bool
+    :returns: whether the module was up to date
+    :rtype: bool
+    """
+    source = generate(load_spec(spec_path), os.path.basename(spec_path))
+    try:
+        with open(output_path) as f:
+            current = f.read()
+    except FileNotFoundError:
+        current = None
+    if current == source or check:
+        return current == source
+    with open(output_path, 'w') as f:
+        f.write(source)
+    return False
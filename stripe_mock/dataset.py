@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""On-disk datasets: one stripe object per line, JSON encoded.
+
+Paths ending in ``.gz`` are gzip compressed. Datasets are read and written
+an object at a time, so they can be larger than memory on either side.
+"""
+import gzip
+import json
+
+from .records import to_json_default
+
+
+def open_dataset(path, mode):
+    """Open a file of JSON lines as text, gzip compressed if its path ends
+    in ``.gz``, e.g. to stream objects to it.
+
+    :param path: file path
+    :type path: string or :class:`pathlib.Path`
+    :param mode: 'r', 'w' or 'a'
+    :type mode: string
+    :rtype: file object
+    """
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def write_dataset(objects, path):
+    """Write stripe objects to a dataset file.
+
+    :param objects: stripe objects
+    :type objects: iterable[dict]
+    :param path: file to write, gzip compressed if it ends in .gz
+    :type path: string
+    :returns: number of objects written
+    :rtype: int
+    """
+    count = 0
+    with open_dataset(path, 'w') as f:
+        for obj in objects:
+            f.write(
+                json.dumps(
+                    obj, separators=(',', ':'), default=to_json_default))
+            f.write('\n')
+            count += 1
+    return count
+
+
+def read_dataset(path):
+    """Yield the stripe objects of a dataset file, one at a time.
+
+    :param path: file to read, gzip compressed if it ends in .gz
+    :type path: string
+    :rtype: iterator[dict]
+    """
+    with open_dataset(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_dataset(api, path):
+    """Load a dataset file into a :class:`StripeMockAPI`'s stores.
+
+    :returns: number of objects loaded
+    :rtype: int
+    """
+    return api.bulk_load(read_dataset(path))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Coupon redemption, see :meth:`StripeMockAPI.apply_coupon`.
+
+A coupon's ``times_redeemed`` is checked against ``max_redemptions`` and
+``redeem_by``, and incremented, under one lock, so concurrent redemptions
+(threads, or :class:`~stripe_mock.server.StripeMockServer` connections)
+can't redeem it past its limit.
+"""
+import threading
+
+from .clock import add_interval
+
+
+class CouponRedemptionError(ValueError):
+
+    """Raised when a coupon can't be redeemed."""
+    pass
+
+
+class CouponRedemptions(object):
+
+    """Redeems coupons, atomically."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def redeem(self, coupon, now):
+        """Count a redemption of a coupon.
+
+        Coupons that reach ``max_redemptions``, or are redeemed past their
+        ``redeem_by``, are marked no longer ``valid``.
+
+        :param coupon: the stored coupon
+        :type coupon: dict
+        :param now: unix timestamp of the redemption
+        :type now: int
+        :raises: :class:`CouponRedemptionError` if the coupon expired or
+            was redeemed the most times it can be
+        """
+        with self._lock:
+            redeem_by = coupon['redeem_by']
+            max_redemptions = coupon['max_redemptions']
+            if redeem_by is not None and now > redeem_by:
+                coupon['valid'] = False
+                raise CouponRedemptionError(
+                    'Coupon expired: {}'.format(coupon['id']))
+            if (max_redemptions is not None and
+                    coupon['times_redeemed'] >= max_redemptions):
+                coupon['valid'] = False
+                raise CouponRedemptionError(
+                    'Coupon {} has reached its max_redemptions'.format(
+                        coupon['id']))
+            if not coupon['valid']:
+                raise CouponRedemptionError(
+                    'Coupon is no longer valid: {}'.format(coupon['id']))
+
+            coupon['times_redeemed'] += 1
+            if (max_redemptions is not None and
+                    coupon['times_redeemed'] >= max_redemptions):
+                coupon['valid'] = False
+
+
+def discount_end(coupon, start):
+    """Return when a discount starting at start ends, None if it doesn't.
+
+    :rtype: int or None
+    """
+    if coupon['duration'] != 'repeating':
+        return None
+    return add_interval(start, 'month', coupon['duration_in_months'] or 1)
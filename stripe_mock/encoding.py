@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""JSON encoding of response bodies.
+
+Every stripe object is encoded once, when the routes are built
+(:meth:`StripeMockAPI.build_router`). List bodies are not encoded as a
+whole: a :class:`JSONList` keeps the encoded envelope and references to the
+encoded objects, and produces the body a chunk at a time. A list of 100k
+objects then costs a pointer per object rather than another copy of them
+all, and serving it holds one chunk in memory.
+
+Subscriptions embed their plan twice (``plan`` and the plan of their
+item). Stored subscriptions reference the stored plan, and
+:func:`encode_subscription` splices in the plan's encoding from a
+:class:`FragmentCache` rather than encoding it again for each of them.
+
+Bodies are byte-identical to ``json.dumps`` of the equivalent dict.
+"""
+import io
+import json
+from collections.abc import Mapping
+
+from .records import as_dict, to_json_default
+
+#: target size of the chunks a :class:`JSONList` is served in
+CHUNK_SIZE = 64 * 1024
+
+_ITEM_SEPARATOR = b', '
+_DATA_PLACEHOLDER = '\x00stripe_mock:data\x00'
+_PLAN_PLACEHOLDER = '\x00stripe_mock:plan\x00'
+
+# json.dumps() builds a new encoder per call when given a default hook
+_ENCODER = json.JSONEncoder(default=to_json_default)
+
+
+def encode_json(obj):
+    """Encode a stripe object or response body.
+
+    Same output as ``json.dumps(obj, default=to_json_default)``.
+
+    :rtype: bytes
+    """
+    return _ENCODER.encode(obj).encode('utf-8')
+
+
+class FragmentCache(object):
+
+    """Encoded objects, cached by id, e.g. the plans subscriptions embed.
+
+    An entry is reused for as long as the object with its id is the same
+    object; :meth:`invalidate` it when that object is changed in place.
+    """
+
+    def __init__(self):
+        self._fragments = {}
+
+    def get(self, obj):
+        """Return the encoded object, encoding it if it isn't cached.
+
+        :rtype: bytes
+        """
+        object_id = obj['id']
+        entry = self._fragments.get(object_id)
+        if entry is None or entry[0] is not obj:
+            entry = (obj, encode_json(obj))
+            self._fragments[object_id] = entry
+        return entry[1]
+
+    def invalidate(self, object_id):
+        self._fragments.pop(object_id, None)
+
+
+_ENCODED_PLAN_PLACEHOLDER = encode_json(_PLAN_PLACEHOLDER)
+
+
+def encode_subscription(subscription, plans):
+    """Encode a subscription, taking its plan's encoding from a cache.
+
+    Same output as :func:`encode_json`.
+
+    :param subscription: stored subscription
+    :type subscription: dict
+    :param plans: encoded plans
+    :type plans: :class:`FragmentCache`
+    :rtype: bytes
+    """
+    plan = subscription.get('plan')
+    if not isinstance(plan, Mapping) or 'id' not in plan:
+        return encode_json(subscription)
+
+    view = dict(as_dict(subscription), plan=_PLAN_PLACEHOLDER)
+    items = view.get('items')
+    if items and items.get('data'):
+        data = []
+        for item in items['data']:
+            item = as_dict(item)
+            if item.get('plan') is plan:
+                item = dict(item, plan=_PLAN_PLACEHOLDER)
+            data.append(item)
+        view['items'] = dict(items, data=data)
+    return encode_json(view).replace(
+        _ENCODED_PLAN_PLACEHOLDER, plans.get(plan))
+
+
+class JSONList(object):
+
+    """A list body, assembled from already encoded objects.
+
+    :param envelope: the list as returned by a ``fake_*_list`` factory; its
+        ``data`` is left out, only the other fields are encoded
+    :type envelope: dict
+    :param fragments: the encoded objects of ``data``, see
+        :func:`encode_json`
+    :type fragments: list[bytes]
+    """
+
+    def __init__(self, envelope, fragments):
+        encoded = encode_json(dict(envelope, data=_DATA_PLACEHOLDER))
+        self.head, self.tail = encoded.split(
+            encode_json(_DATA_PLACEHOLDER), 1)
+        self.fragments = fragments
+        self.length = (
+            len(self.head) + len(self.tail) + 2 +
+            sum(len(fragment) for fragment in fragments) +
+            len(_ITEM_SEPARATOR) * max(len(fragments) - 1, 0))
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        """Yield the body in chunks of about :data:`CHUNK_SIZE` bytes."""
+        chunk = [self.head, b'[']
+        size = len(self.head) + 1
+        for i, fragment in enumerate(self.fragments):
+            if i:
+                chunk.append(_ITEM_SEPARATOR)
+            chunk.append(fragment)
+            size += len(fragment)
+            if size >= CHUNK_SIZE:
+                yield b''.join(chunk)
+                chunk = []
+                size = 0
+        chunk.append(b']')
+        chunk.append(self.tail)
+        yield b''.join(chunk)
+
+    def getvalue(self):
+        """Return the whole body at once.
+
+        :rtype: bytes
+        """
+        return b''.join(self)
+
+
+class _ChunkReader(io.RawIOBase):
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def iter_body(body):
+    """Yield a response body (bytes or :class:`JSONList`) in chunks.
+
+    :rtype: iterator[bytes]
+    """
+    if isinstance(body, JSONList):
+        yield from body
+    else:
+        yield body
+
+
+def body_reader(body):
+    """Return a response body as a file-like object, read lazily.
+
+    :rtype: :class:`io.BufferedReader`
+    """
+    return io.BufferedReader(_ChunkReader(iter_body(body)), CHUNK_SIZE)
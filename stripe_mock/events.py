@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""Stripe event log, and a worker delivering it to a webhook endpoint."""
+import hashlib
+import hmac
+import http.client
+import queue
+import threading
+import time
+from urllib.parse import urlsplit
+
+from .encoding import encode_json
+from .fake import fake_event
+from .records import as_dict
+
+_STOP = object()
+
+
+class EventLog(object):
+
+    """Append-only log of stripe events, oldest first.
+
+    Each event embeds a shallow copy of the object at the time of the event.
+    Listeners (e.g. :meth:`WebhookDispatcher.submit`) are called with every
+    new event.
+
+    :param clock: clock stamping ``created``, wall time if None
+    :type clock: :class:`~stripe_mock.clock.TestClock`
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock
+        self.enabled = True
+        self.events = []
+        self.listeners = []
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.events)
+
+    def append(self, event_type, obj, previous_attributes=None, created=None):
+        """Record an event, unless the log is disabled.
+
+        :param event_type: e.g. 'customer.created'
+        :type event_type: string
+        :param obj: stripe object the event is about
+        :type obj: dict
+        :param previous_attributes: attributes an update overwrote
+        :type previous_attributes: dict
+        :param created: event timestamp, defaults to the clock's time
+        :type created: int
+        :returns: the event, or None if the log is disabled
+        :rtype: dict or None
+        """
+        if not self.enabled:
+            return None
+
+        if created is None:
+            created = self.clock.frozen_time if self.clock else int(
+                time.time())
+
+        with self._lock:
+            position = len(self.events)
+            event = fake_event(
+                'evt_{:010d}'.format(position),
+                event_type,
+                dict(as_dict(obj)),
+                created=created,
+                pending_webhooks=len(self.listeners),
+            )
+            if previous_attributes:
+                event['data']['previous_attributes'] = previous_attributes
+            self.events.append(event)
+            self._positions[event['id']] = position
+
+        for listener in self.listeners:
+            listener(event)
+        return event
+
+    def get(self, event_id):
+        """Return an event by id.
+
+        :raises: :class:`KeyError` if there's no such event
+        :rtype: dict
+        """
+        return self.events[self._positions[event_id]]
+
+    def page(self, limit=10, starting_after=None, ending_before=None,
+             event_type=None):
+        """Return one page of events, newest first, like ``/v1/events``.
+
+        Cursors are resolved to log positions in O(1), so the cost is
+        proportional to the page (plus events skipped by the type filter),
+        not to the size of the log.
+
+        :param limit: page size
+        :type limit: int
+        :param starting_after: return events older than this event id
+        :type starting_after: string
+        :param ending_before: return events newer than this event id
+        :type ending_before: string
+        :param event_type: exact type, or a prefix wildcard like
+            'customer.*'
+        :type event_type: string
+        :raises: :class:`KeyError` if a cursor is not a known event id
+        :returns: (events, has_more)
+        :rtype: (list[dict], bool)
+        """
+        events = self.events
+        if event_type is None:
+            matches = None
+        elif event_type.endswith('*'):
+            prefix = event_type[:-1]
+
+            def matches(event):
+                return event['type'].startswith(prefix)
+        else:
+
+            def matches(event):
+                return event['type'] == event_type
+
+        if ending_before is not None:
+            positions = range(self._positions[ending_before] + 1, len(events))
+        elif starting_after is not None:
+            positions = range(self._positions[starting_after] - 1, -1, -1)
+        else:
+            positions = range(len(events) - 1, -1, -1)
+
+        data = []
+        has_more = False
+        for position in positions:
+            event = events[position]
+            if matches is not None and not matches(event):
+                continue
+            if len(data) == limit:
+                has_more = True
+                break
+            data.append(event)
+
+        if ending_before is not None:
+            data.reverse()
+        return data, has_more
+
+
+def sign_payload(payload, secret, timestamp):
+    """Return a ``Stripe-Signature`` header value for a webhook payload.
+
+    :param payload: request body
+    :type payload: bytes
+    :param secret: endpoint signing secret, e.g. 'whsec_...'
+    :type secret: string
+    :param timestamp: unix timestamp of the delivery
+    :type timestamp: int
+    :rtype: string
+    """
+    signed = '{}.'.format(timestamp).encode('utf-8') + payload
+    signature = hmac.new(secret.encode('utf-8'), signed,
+                         hashlib.sha256).hexdigest()
+    return 't={},v1={}'.format(timestamp, signature)
+
+
+class WebhookDispatcher(object):
+
+    """Deliver events to a local webhook endpoint from a pool of threads.
+
+    - bounded concurrency: ``max_workers`` threads, each keeping one
+      keep-alive connection to the endpoint
+    - batching: workers drain up to ``batch_size`` queued events per wakeup
+    - backpressure: :meth:`submit` blocks once ``max_pending`` events are
+      waiting, so producers slow down to the consumer's pace
+
+    Delivery uses :mod:`http.client` rather than requests, so it isn't
+    intercepted while :mod:`responses` is active.
+
+    Usage::
+
+        with WebhookDispatcher('http://localhost:8000/webhook') as hooks:
+            s.events.listeners.append(hooks.submit)
+            ...  # mutate the mock
+        print(hooks.delivered, hooks.failed)
+
+    :param url: webhook endpoint
+    :type url: string
+    :param max_workers: number of delivery threads
+    :type max_workers: int
+    :param batch_size: events a worker takes from the queue at once
+    :type batch_size: int
+    :param max_pending: queued events before :meth:`submit` blocks
+    :type max_pending: int
+    :param signing_secret: if set, send a ``Stripe-Signature`` header
+    :type signing_secret: string
+    :param timeout: socket timeout in seconds
+    :type timeout: float
+    """
+
+    def __init__(self, url, max_workers=4, batch_size=100, max_pending=10000,
+                 signing_secret=None, timeout=5.0):
+        parts = urlsplit(url)
+        self._connection_class = (
+            http.client.HTTPSConnection
+            if parts.scheme == 'https' else http.client.HTTPConnection)
+        self._netloc = parts.netloc
+        self._path = parts.path or '/'
+        if parts.query:
+            self._path = '{}?{}'.format(self._path, parts.query)
+
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.signing_secret = signing_secret
+        self.timeout = timeout
+        self.delivered = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._counter_lock = threading.Lock()
+        self._threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Start the delivery threads."""
+        for _ in range(self.max_workers - len(self._threads)):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, event):
+        """Queue an event for delivery, blocking while the queue is full.
+
+        :param event: stripe event
+        :type event: dict
+        """
+        self._queue.put(event)
+
+    def join(self):
+        """Block until every submitted event has been attempted."""
+        self._queue.join()
+
+    def stop(self):
+        """Deliver what's queued, then stop the delivery threads."""
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self):
+        connection = None
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            try:
+                # a worker takes at most one stop marker, leaving the rest
+                # to the other workers
+                while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            delivered = failed = 0
+            for event in batch:
+                if event is _STOP:
+                    running = False
+                    continue
+                if connection is None:
+                    connection = self._connection_class(
+                        self._netloc, timeout=self.timeout)
+                try:
+                    ok = self._post(connection, event)
+                except Exception:
+                    # network errors, but also events that can't be
+                    # encoded: every event is counted, so join() returns
+                    connection.close()
+                    connection = None
+                    ok = False
+                if ok:
+                    delivered += 1
+                else:
+                    failed += 1
+
+            with self._counter_lock:
+                self.delivered += delivered
+                self.failed += failed
+            for _ in batch:
+                self._queue.task_done()
+
+        if connection is not None:
+            connection.close()
+
+    def _post(self, connection, event):
+        payload = encode_json(event)
+        headers = {
+            'Content-Type': 'application/json',
+            'User-Agent': 'Stripe/1.0 (+https://stripe.com/docs/webhooks)',
+        }
+        if self.signing_secret:
+            headers['Stripe-Signature'] = sign_payload(
+                payload, self.signing_secret, int(time.time()))
+
+        connection.request('POST', self._path, body=payload, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return 200 <= response.status < 300
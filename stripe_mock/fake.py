@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 """Functions for generating response bodies from stripe API."""
-from faker import Faker
 
 
 def fake_generic_listing(object_list, object_type):
@@ -23,6 +22,30 @@ def fake_generic_listing(object_list, object_type):
     }
 
 
+def fake_search_result(object_list, object_type, total_count, next_page):
+    """Fake a page of stripe search results.
+
+    :param object_list: list of object data on this page
+    :type object_list: list[dict]
+    :param object_type: stripe object type, e.g. 'customer'
+    :type object_type: string
+    :param total_count: number of objects matching the query
+    :type total_count: int
+    :param next_page: cursor for the next page, if any
+    :type next_page: string or None
+    :returns: response of data immitating stripe's search result
+    :rtype: dict
+    """
+    return {
+        'data': object_list,
+        'has_more': next_page is not None,
+        'next_page': next_page,
+        'object': 'search_result',
+        'total_count': total_count,
+        'url': '/v1/{}s/search'.format(object_type),
+    }
+
+
 def fake_subscription_list(subscription_list):
     """Fake the subscription listings (globally).
 
@@ -105,10 +128,73 @@ def fake_customer_source_list(customer_id, source_list):
     }
 
 
+def fake_event_list(event_list, has_more):
+    """Fake a page of the event listing.
+
+    :param event_list: list of event data on this page
+    :type event_list: list[dict]
+    :param has_more: whether more events follow this page
+    :type has_more: bool
+    :returns: response of data immitating stripe's listing
+    :rtype: dict
+    """
+    return {
+        'data': event_list,
+        'has_more': has_more,
+        'object': 'list',
+        'url': '/v1/events',
+    }
+
+
+def fake_list_page(object_list, object_type, has_more, url=None):
+    """Fake a page of a cursor paginated root-level listing.
+
+    :param object_list: list of object data on this page
+    :type object_list: list[dict]
+    :param object_type: stripe object type, e.g. 'invoice'
+    :type object_type: string
+    :param has_more: whether more objects follow this page
+    :type has_more: bool
+    :param url: path of the listing, defaults to '/v1/{object_type}s'
+    :type url: string
+    :returns: response of data immitating stripe's listing
+    :rtype: dict
+    """
+    return {
+        'data': object_list,
+        'has_more': has_more,
+        'object': 'list',
+        'url': url or '/v1/{}s'.format(object_type),
+    }
+
+
+def fake_event(event_id, event_type, data_object, **kwargs):
+    return {
+        **{
+            'api_version': '2017-08-15',
+            'created': 1513273056,
+            'data': {
+                'object': data_object,
+            },
+            'id': event_id,
+            'livemode': False,
+            'object': 'event',
+            'pending_webhooks': 0,
+            'request': {
+                'id': None,
+                'idempotency_key': None
+            },
+            'type': event_type,
+        },
+        **kwargs
+    }
+
+
 def fake_customer(customer_id, **kwargs):
     return {
         **{
             'account_balance': 0,
+            'balance': 0,
             'created': 1513262366,
             'currency': 'usd',
             'default_source': 'card_1BYxtEEzushJqDoiJUQkSyER',
@@ -137,12 +223,12 @@ def fake_coupon(coupon_id, **kwargs):
             'duration_in_months': None,
             'id': coupon_id,
             'livemode': False,
-            'max_redemptions': 5,
+            'max_redemptions': None,
             'metadata': {},
             'object': 'coupon',
             'percent_off': None,
-            'redeem_by': 1515650399,
-            'times_redeemed': 1,
+            'redeem_by': None,
+            'times_redeemed': 0,
             'valid': True
         },
         **kwargs
@@ -296,29 +382,7 @@ def fake_subscription(customer_id, subscription_id, **kwargs):
             'current_period_start': 1513273056,
             'customer': customer_id,
             'days_until_due': None,
-            'discount': {
-                'coupon': {
-                    'amount_off': 1500,
-                    'created': 1513532343,
-                    'currency': 'usd',
-                    'duration': 'once',
-                    'duration_in_months': None,
-                    'id': '15-off',
-                    'livemode': False,
-                    'max_redemptions': 5,
-                    'metadata': {},
-                    'object': 'coupon',
-                    'percent_off': None,
-                    'redeem_by': 1515650399,
-                    'times_redeemed': 2,
-                    'valid': True
-                },
-                'customer': 'cus_Bwrbeyo88aaUYP',
-                'end': None,
-                'object': 'discount',
-                'start': 1513532569,
-                'subscription': 'sub_BwuTCVDt1Klbil'
-            },
+            'discount': None,
             'ended_at': None,
             'id': subscription_id,
             'items': {
@@ -374,3 +438,284 @@ def fake_subscription(customer_id, subscription_id, **kwargs):
         },
         **kwargs
     }
+
+
+def fake_invoice_line_item(subscription_id, line_item_id, **kwargs):
+    return {
+        **{
+            'amount': 999,
+            'currency': 'usd',
+            'description': None,
+            'discountable': True,
+            'id': line_item_id,
+            'livemode': False,
+            'metadata': {},
+            'object': 'line_item',
+            'period': {
+                'end': 1515951456,
+                'start': 1513273056
+            },
+            'plan': None,
+            'proration': False,
+            'quantity': 1,
+            'subscription': subscription_id,
+            'subscription_item': None,
+            'type': 'subscription'
+        },
+        **kwargs
+    }
+
+
+def fake_invoice(customer_id, invoice_id, **kwargs):
+    return {
+        **{
+            'amount_due': 999,
+            'amount_paid': 999,
+            'amount_remaining': 0,
+            'application_fee': None,
+            'attempt_count': 1,
+            'attempted': True,
+            'billing': 'charge_automatically',
+            'charge': None,
+            'closed': True,
+            'created': 1513273056,
+            'currency': 'usd',
+            'customer': customer_id,
+            'description': None,
+            'discount': None,
+            'due_date': None,
+            'ending_balance': 0,
+            'forgiven': False,
+            'id': invoice_id,
+            'lines': {
+                'data': [],
+                'has_more': False,
+                'object': 'list',
+                'total_count': 0,
+                'url': '/v1/invoices/{}/lines'.format(invoice_id)
+            },
+            'livemode': False,
+            'metadata': {},
+            'next_payment_attempt': None,
+            'number': None,
+            'object': 'invoice',
+            'paid': True,
+            'period_end': 1513273056,
+            'period_start': 1513273056,
+            'receipt_number': None,
+            'starting_balance': 0,
+            'statement_descriptor': None,
+            'status': 'paid',
+            'subscription': None,
+            'subtotal': 999,
+            'tax': None,
+            'tax_percent': None,
+            'total': 999,
+            'webhooks_delivered_at': 1513273056
+        },
+        **kwargs
+    }
+
+
+def fake_charge(customer_id, charge_id, **kwargs):
+    return {
+        **{
+            'amount': 999,
+            'amount_refunded': 0,
+            'application': None,
+            'application_fee': None,
+            'balance_transaction': None,
+            'captured': True,
+            'created': 1513273056,
+            'currency': 'usd',
+            'customer': customer_id,
+            'description': None,
+            'dispute': None,
+            'failure_code': None,
+            'failure_message': None,
+            'fraud_details': {},
+            'id': charge_id,
+            'invoice': None,
+            'livemode': False,
+            'metadata': {},
+            'object': 'charge',
+            'on_behalf_of': None,
+            'order': None,
+            'outcome': {
+                'network_status': 'approved_by_network',
+                'reason': None,
+                'risk_level': 'normal',
+                'seller_message': 'Payment complete.',
+                'type': 'authorized'
+            },
+            'paid': True,
+            'receipt_email': None,
+            'receipt_number': None,
+            'refunded': False,
+            'refunds': {
+                'data': [],
+                'has_more': False,
+                'object': 'list',
+                'total_count': 0,
+                'url': '/v1/charges/{}/refunds'.format(charge_id)
+            },
+            'shipping': None,
+            'source': None,
+            'statement_descriptor': None,
+            'status': 'succeeded',
+            'transfer_group': None
+        },
+        **kwargs
+    }
+
+
+def fake_subscription_invoice(subscription, invoice_id, **kwargs):
+    """Fake the invoice of a subscription's current period.
+
+    Lines bill each subscription item's plan, embedded by reference, for
+    its quantity. The invoice's ``period_start`` and ``period_end``, like
+    its lines' ``period``, bound the period billed.
+
+    :param subscription: subscription data
+    :type subscription: dict
+    :param invoice_id: id of the invoice
+    :type invoice_id: string
+    :rtype: dict
+    """
+    period_start = subscription['current_period_start']
+    period_end = subscription['current_period_end']
+    lines = []
+    for item in subscription['items']['data']:
+        plan = item['plan']
+        lines.append(fake_invoice_line_item(
+            subscription['id'],
+            'sli_{}'.format(item['id'][len('si_'):]),
+            amount=plan['amount'] * item['quantity'],
+            currency=plan['currency'],
+            period={'end': period_end, 'start': period_start},
+            plan=plan,
+            quantity=item['quantity'],
+            subscription_item=item['id'],
+        ))
+    amount = sum(line['amount'] for line in lines)
+    return fake_invoice(
+        subscription['customer'],
+        invoice_id,
+        **{
+            'amount_due': amount,
+            'amount_paid': amount,
+            'billing': subscription['billing'],
+            'created': period_start,
+            'currency': lines[0]['currency'] if lines else 'usd',
+            'lines': {
+                'data': lines,
+                'has_more': False,
+                'object': 'list',
+                'total_count': len(lines),
+                'url': '/v1/invoices/{}/lines'.format(invoice_id)
+            },
+            'period_end': period_end,
+            'period_start': period_start,
+            'subscription': subscription['id'],
+            'subtotal': amount,
+            'total': amount,
+            'webhooks_delivered_at': period_start,
+            **kwargs
+        })
+
+
+def fake_invoice_charge(invoice, charge_id, **kwargs):
+    """Fake the charge paying an invoice.
+
+    :param invoice: invoice data
+    :type invoice: dict
+    :param charge_id: id of the charge
+    :type charge_id: string
+    :rtype: dict
+    """
+    return fake_charge(
+        invoice['customer'],
+        charge_id,
+        **{
+            'amount': invoice['amount_due'],
+            'created': invoice['created'],
+            'currency': invoice['currency'],
+            'invoice': invoice['id'],
+            **kwargs
+        })
+
+
+def fake_customer_balance_transaction(customer_id, transaction_id,
+                                      **kwargs):
+    return {
+        **{
+            'amount': 0,
+            'created': 1513273056,
+            'credit_note': None,
+            'currency': 'usd',
+            'customer': customer_id,
+            'description': None,
+            'ending_balance': 0,
+            'id': transaction_id,
+            'invoice': None,
+            'livemode': False,
+            'metadata': {},
+            'object': 'customer_balance_transaction',
+            'type': 'adjustment'
+        },
+        **kwargs
+    }
+
+
+def fake_usage_record(subscription_item_id, usage_record_id, **kwargs):
+    return {
+        **{
+            'id': usage_record_id,
+            'livemode': False,
+            'object': 'usage_record',
+            'quantity': 1,
+            'subscription_item': subscription_item_id,
+            'timestamp': 1513273056
+        },
+        **kwargs
+    }
+
+
+def fake_usage_record_summary(subscription_item_id, summary_id, **kwargs):
+    return {
+        **{
+            'id': summary_id,
+            'invoice': None,
+            'livemode': False,
+            'object': 'usage_record_summary',
+            'period': {
+                'end': None,
+                'start': None
+            },
+            'subscription_item': subscription_item_id,
+            'total_usage': 0
+        },
+        **kwargs
+    }
+
+
+def fake_usage_record_summary_list(subscription_item_id, summary_list,
+                                   has_more):
+    """Fake a page of a subscription item's usage record summaries.
+
+    :param subscription_item_id: id of the subscription item
+    :type subscription_item_id: string
+    :param summary_list: list of summary data on this page
+    :type summary_list: list[dict]
+    :param has_more: whether more summaries follow this page
+    :type has_more: bool
+    :returns: response of data immitating stripe's listing
+    :rtype: dict
+    """
+    return {
+        'data': summary_list,
+        'has_more': has_more,
+        'object': 'list',
+        'url': '/v1/subscription_items/{}/usage_record_summaries'.format(
+            subscription_item_id),
+    }
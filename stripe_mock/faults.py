@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""Latency and fault injection, to make the mock behave like stripe under
+load rather than like an in-memory dict.
+
+A :class:`FaultProfile` decides, per request:
+
+- a latency, drawn from a distribution per route (:class:`FixedLatency`,
+  :class:`NormalLatency` or a replayed :class:`EmpiricalLatency`)
+- a 429, when the request's API key runs out of tokens in its
+  :class:`TokenBucket`
+- a random 5xx, at ``error_rate``
+
+:class:`FaultInjector` applies a profile to a dispatcher (a
+:class:`StripeMockAPI` or :class:`~stripe_mock.accounts.ConnectedAccounts`)::
+
+    profile = FaultProfile(
+        latency=NormalLatency(0.25, 0.08),
+        routes=[('GET', r'/v1/customers/search', FixedLatency(0.6))],
+        rate_limit=(25, 50),
+        error_rate=0.01,
+    )
+    injector = FaultInjector(api, profile)
+    injector.sync()  # or serve it, or pass it to the transports
+
+Delays sleep the calling thread with :mod:`responses` and in the HTTP
+server (one thread per connection), and ``await asyncio.sleep()`` in the
+async transports, so other requests keep being answered meanwhile.
+"""
+import bisect
+import random
+import re
+import threading
+import time
+
+import responses
+
+from .encoding import encode_json
+from .response_callbacks import stripe_api_error, stripe_rate_limited
+from .router import install
+
+
+class FixedLatency(object):
+
+    """Always the same latency.
+
+    :param seconds: latency
+    :type seconds: float
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def sample(self, rng):
+        return self.seconds
+
+
+class NormalLatency(object):
+
+    """Normally distributed latency, clipped at ``minimum``.
+
+    :param mean: mean latency, in seconds
+    :type mean: float
+    :param stddev: standard deviation, in seconds
+    :type stddev: float
+    :param minimum: lowest latency returned
+    :type minimum: float
+    """
+
+    def __init__(self, mean, stddev, minimum=0.0):
+        self.mean = mean
+        self.stddev = stddev
+        self.minimum = minimum
+
+    def sample(self, rng):
+        return max(self.minimum, rng.gauss(self.mean, self.stddev))
+
+
+class EmpiricalLatency(object):
+
+    """Latency replayed from observations, e.g. a production histogram.
+
+    :param histogram: (latency in seconds, count) pairs; a bare list of
+        observed latencies counts each once
+    :type histogram: list[(float, int)] or list[float]
+    """
+
+    def __init__(self, histogram):
+        buckets = sorted(
+            item if isinstance(item, (tuple, list)) else (item, 1)
+            for item in histogram)
+        if not buckets:
+            raise ValueError('an empirical latency needs observations')
+        self.latencies = [latency for latency, _ in buckets]
+        self.cumulative = []
+        total = 0
+        for _, count in buckets:
+            total += count
+            self.cumulative.append(total)
+
+    def sample(self, rng):
+        point = rng.random() * self.cumulative[-1]
+        return self.latencies[bisect.bisect_right(self.cumulative, point)]
+
+
+class TokenBucket(object):
+
+    """Token bucket rate limiter.
+
+    :param rate: tokens added per second
+    :type rate: float
+    :param capacity: most tokens held, i.e. the burst allowed
+    :type capacity: int
+    :param clock: returns the time in seconds
+    :type clock: callable
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Take a token, if there is one.
+
+        :rtype: bool
+        """
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def api_key(request):
+    """Return the API key a request authenticates with, or ''."""
+    headers = getattr(request, 'headers', None) or {}
+    authorization = (
+        headers.get('Authorization') or headers.get('authorization') or '')
+    if authorization.startswith('Bearer '):
+        return authorization[len('Bearer '):]
+    return authorization
+
+
+class FaultProfile(object):
+
+    """Latencies, rate limits and errors to inject.
+
+    :param latency: latency of requests no route matches
+    :type latency: :class:`FixedLatency`, :class:`NormalLatency` or
+        :class:`EmpiricalLatency`
+    :param routes: (method, url pattern, latency), the first whose method
+        is the request's and whose pattern is found in its url wins
+    :type routes: list[(string, string, object)]
+    :param rate_limit: (requests per second, burst) per API key
+    :type rate_limit: (float, int)
+    :param error_rate: probability of answering with a 5xx
+    :type error_rate: float
+    :param error_statuses: statuses random errors are drawn from
+    :type error_statuses: tuple[int]
+    :param seed: seed of the random draws
+    :type seed: int
+    :param clock: time source of the rate limiters
+    :type clock: callable
+    """
+
+    def __init__(self, latency=None, routes=(), rate_limit=None,
+                 error_rate=0.0, error_statuses=(500, 502, 503), seed=None,
+                 clock=time.monotonic):
+        self.latency = latency
+        self.routes = [
+            (method, re.compile(pattern), route_latency)
+            for method, pattern, route_latency in routes
+        ]
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.clock = clock
+        self.buckets = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _latency(self, request):
+        for method, pattern, latency in self.routes:
+            if method == request.method and pattern.search(request.url):
+                return latency
+        return self.latency
+
+    def _bucket(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self.buckets.setdefault(
+                    key, TokenBucket(*self.rate_limit, clock=self.clock))
+        return bucket
+
+    def decide(self, request):
+        """Return the delay of a request, and the error to answer with.
+
+        :returns: (delay in seconds, error response or None)
+        :rtype: (float, (int, dict, dict) or None)
+        """
+        with self._lock:
+            latency = self._latency(request)
+            delay = latency.sample(self._rng) if latency is not None else 0.0
+            failed = self.error_rate and self._rng.random() < self.error_rate
+            status = self._rng.choice(self.error_statuses) if failed else None
+
+        if self.rate_limit is not None and not self._bucket(
+                api_key(request)).take():
+            return delay, stripe_rate_limited()
+        if status is not None:
+            return delay, stripe_api_error(status)
+        return delay, None
+
+
+class FaultInjector(object):
+
+    """A dispatcher answering through another one, with faults injected.
+
+    :param dispatcher: e.g. a :class:`StripeMockAPI`
+    :param profile: what to inject
+    :type profile: :class:`FaultProfile`
+    """
+
+    def __init__(self, dispatcher, profile):
+        self.dispatcher = dispatcher
+        self.profile = profile
+
+    def plan(self, request):
+        """Decide a request's fate without waiting for it.
+
+        :returns: (delay in seconds, callable returning the response once
+            the delay is over)
+        :rtype: (float, callable)
+        """
+        delay, error = self.profile.decide(request)
+        if error is not None:
+            status, headers, body = error
+            return delay, lambda: (status, headers, encode_json(body))
+        return delay, lambda: self.dispatcher.dispatch(request)
+
+    def matches(self, request):
+        return self.dispatcher.matches(request)
+
+    def dispatch(self, request):
+        """Answer a request, sleeping the calling thread for its delay."""
+        delay, respond = self.plan(request)
+        if delay > 0:
+            time.sleep(delay)
+        return respond()
+
+    def refresh(self, workers=None):
+        self.dispatcher.refresh(workers=workers)
+
+    def sync(self, workers=None):
+        """Clear the :mod:`responses` mock and serve the dispatcher through
+        it, with faults injected."""
+        responses.reset()
+        self.refresh(workers=workers)
+        install(self, ('GET', 'POST', 'DELETE'))
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""Fixture files, reloaded into a :class:`StripeMockAPI` as they change.
+
+A fixture file lists stripe objects, each with its ``object`` type and
+``id``, and the fields to set on top of the :mod:`~stripe_mock.fake`
+factory's defaults (``customer`` too, for the objects bound to one)::
+
+    - {object: plan, id: gold, amount: 2900}
+    - {object: customer, id: cus_1, email: a@example.com}
+    - {object: subscription, id: sub_1, customer: cus_1, plan: gold}
+
+Files are YAML (``.yaml`` / ``.yml``, with PyYAML installed), JSON arrays
+(``.json``) or datasets (``.jsonl``, see :mod:`stripe_mock.dataset`)::
+
+    fixtures = FixtureFiles(api, ['plans.yaml', 'customers.json'])
+    fixtures.load()
+    fixtures.start()  # poll for changes in a background thread
+
+:meth:`FixtureFiles.poll` checks the files' modification times and
+sizes, and re-reads only the files that changed. Each changed file is
+diffed against its previous contents, object by object: new objects are
+added, changed objects are updated with the changed fields only, and
+objects no longer listed are deleted, all through the ``add_*`` and
+``delete_*`` methods, so search indexes, references, events and the
+auto synced routes are updated incrementally. An edit that fails to
+apply is undone, and kept in :attr:`FixtureFiles.errors` until the file
+is fixed. A long running
+``python -m stripe_mock serve --fixtures ...`` picks up edits this way,
+without a restart.
+"""
+import collections
+import json
+import os
+import threading
+
+try:
+    import yaml
+except ImportError:  # pragma: no cover
+    yaml = None
+
+from .dataset import read_dataset
+from .fake import (
+    fake_charge,
+    fake_coupon,
+    fake_customer,
+    fake_customer_source,
+    fake_customer_source_bank_account,
+    fake_customer_source_card,
+    fake_invoice,
+    fake_plan,
+    fake_subscription,
+)
+from .generated import FACTORIES
+
+#: (add method, factory, positional fields) by object type; the other
+#: resources of the OpenAPI spec go through :meth:`StripeMockAPI.add_object`
+STORES = {
+    'bank_account': ('add_source_bank_account',
+                     fake_customer_source_bank_account, ('customer', 'id')),
+    'card': ('add_source_card', fake_customer_source_card, ('customer', 'id')),
+    'charge': ('add_charge', fake_charge, ('customer', 'id')),
+    'coupon': ('add_coupon', fake_coupon, ('id', )),
+    'customer': ('add_customer', fake_customer, ('id', )),
+    'invoice': ('add_invoice', fake_invoice, ('customer', 'id')),
+    'plan': ('add_plan', fake_plan, ('id', )),
+    'source': ('add_source', fake_customer_source, ('customer', 'id')),
+    'subscription': ('add_subscription', fake_subscription,
+                     ('customer', 'id')),
+}
+
+#: keys of the objects a reload added, updated and removed
+Changes = collections.namedtuple('Changes', ['added', 'updated', 'removed'])
+
+
+class FixtureError(ValueError):
+
+    """Raised for fixture files that can't be read or applied."""
+    pass
+
+
+def read_fixture(path):
+    """Return the objects of a fixture file.
+
+    :param path: .yaml, .yml, .json, .jsonl or .jsonl.gz file
+    :type path: string
+    :raises: :class:`FixtureError` for unknown formats and invalid objects
+    :rtype: list[dict]
+    """
+    path = str(path)
+    if path.endswith(('.jsonl', '.jsonl.gz')):
+        objects = list(read_dataset(path))
+    elif path.endswith(('.yaml', '.yml')):
+        if yaml is None:
+            raise FixtureError('PyYAML is required to read {}'.format(path))
+        with open(path, encoding='utf-8') as f:
+            objects = yaml.safe_load(f)
+        try:
+            # e.g. unquoted dates load as dates, which aren't json
+            json.dumps(objects)
+        except (TypeError, ValueError) as e:
+            raise FixtureError('Invalid fixture {}: {}'.format(path, e))
+    elif path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            objects = json.load(f)
+    else:
+        raise FixtureError('Unknown fixture format: {}'.format(path))
+
+    if objects is None:
+        objects = []
+    elif isinstance(objects, dict):
+        objects = [objects]
+    for obj in objects:
+        if not isinstance(obj, dict) or 'object' not in obj or 'id' not in obj:
+            raise FixtureError(
+                'Fixture objects need an object type and an id: {!r}'.format(
+                    obj))
+        object_type = obj['object']
+        if object_type not in STORES and object_type not in FACTORIES:
+            raise FixtureError(
+                'Unknown object type in {}: {}'.format(path, object_type))
+        if None in _positional(obj):
+            raise FixtureError(
+                '{} objects need a customer: {}'.format(
+                    object_type, obj['id']))
+        created = obj.get('created')
+        if created is not None and (
+                not isinstance(created, int) or isinstance(created, bool)):
+            # objects are ordered by it
+            raise FixtureError(
+                '{} {} is created at a timestamp, not {!r}'.format(
+                    object_type, obj['id'], created))
+    return objects
+
+
+def _key(obj):
+    return (obj['object'], obj['id'])
+
+
+def _positional(obj):
+    object_type = obj['object']
+    if object_type in STORES:
+        fields = STORES[object_type][2]
+    else:
+        fields = ('id', )
+    return tuple(obj.get(field) for field in fields)
+
+
+def _fields(obj):
+    """Return the fields of a fixture object, but its positional ones."""
+    positional = STORES.get(obj['object'], (None, None, ('id', )))[2]
+    return {
+        field: value
+        for field, value in obj.items()
+        if field != 'object' and field not in positional
+    }
+
+
+def _default(obj):
+    """Return the factory defaults of a fixture object."""
+    object_type = obj['object']
+    if object_type in STORES:
+        return STORES[object_type][1](*_positional(obj))
+    return FACTORIES[object_type](obj['id'])
+
+
+def _deletable(api, obj):
+    """Return the method deleting an object, None if it can't be."""
+    object_type = obj['object']
+    if object_type == 'customer':
+        return lambda: api.delete_customer(obj['id'])
+    if object_type == 'subscription':
+        return lambda: api.delete_subscription(obj['id'])
+    if object_type in ('bank_account', 'card', 'source'):
+        return lambda: api.delete_source(obj['customer'], obj['id'])
+    if object_type not in STORES:
+        return lambda: api.delete_object(object_type, obj['id'])
+    return None
+
+
+def _ignore_missing(delete):
+    """Return delete, ignoring objects already deleted, e.g. cascaded."""
+    def ignoring_missing():
+        try:
+            delete()
+        except KeyError:
+            pass
+    return ignoring_missing
+
+
+class FixtureFiles(object):
+
+    """Fixture files loaded into an API, reloaded as they change.
+
+    Listeners are called with ``(path, changes)`` after each file is
+    (re)loaded, ``changes`` being a :class:`Changes`.
+
+    :param api: the mock to load the objects into
+    :type api: :class:`StripeMockAPI`
+    :param paths: fixture files, loaded in this order
+    :type paths: iterable[string]
+    """
+
+    def __init__(self, api, paths):
+        self.api = api
+        self.paths = [str(path) for path in paths]
+        self.listeners = []
+        #: the last error reading or applying each file, by path; a file
+        #: in error keeps its previous objects and is retried on the next
+        #: poll. The last error of a listener called by the polling thread
+        #: is kept under None.
+        self.errors = {}
+        # (mtime, size) of each file as last read, and its objects by key
+        self._stats = {}
+        self._objects = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self):
+        """Load the files, in order.
+
+        Objects are completed with their factory's defaults and
+        bulk loaded (see :meth:`StripeMockAPI.bulk_load`), without
+        events, so their ids must not be stored yet.
+
+        :returns: number of objects loaded
+        :rtype: int
+        """
+        with self._lock, self.api.batch():
+            count = 0
+            for path in self.paths:
+                stat = self._stat(path)
+                objects = read_fixture(path)
+                count += self.api.bulk_load(
+                    {**_default(obj), **obj} for obj in objects)
+                self._stats[path] = stat
+                self._objects[path] = {_key(obj): obj for obj in objects}
+                self._notify(
+                    path, Changes([_key(obj) for obj in objects], [], []))
+            return count
+
+    def poll(self):
+        """Reload the files that changed since they were last read.
+
+        :returns: the changes of each file reloaded, by path
+        :rtype: dict
+        """
+        reloaded = {}
+        with self._lock:
+            for path in self.paths:
+                try:
+                    stat = self._stat(path)
+                    if stat == self._stats.get(path):
+                        continue
+                    reloaded[path] = self._reload(path, read_fixture(path))
+                except Exception as e:
+                    self.errors[path] = e
+                    continue
+                self.errors.pop(path, None)
+                self._stats[path] = stat
+                self._notify(path, reloaded[path])
+        return reloaded
+
+    def _stat(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _reload(self, path, objects):
+        """Apply the difference between a file's objects and the ones it
+        had, as a batch.
+
+        Every change is worked out before the batch starts. If one fails,
+        the ones applied are undone before the error is raised, so the
+        file keeps its previous objects.
+        """
+        previous = self._objects.get(path, {})
+        current = {_key(obj): obj for obj in objects}
+        added = [key for key in current if key not in previous]
+        removed = [key for key in previous if key not in current]
+        updated = [
+            key for key in current
+            if key in previous and current[key] != previous[key]
+        ]
+
+        # moving an object to another customer re-creates it
+        for key in updated[:]:
+            if _positional(current[key]) != _positional(previous[key]):
+                updated.remove(key)
+                removed.append(key)
+                added.append(key)
+
+        # (change, undoing it) pairs
+        steps = []
+        # dependents first, e.g. subscriptions before their customer
+        for key in reversed(removed):
+            obj = previous[key]
+            delete = _deletable(self.api, obj)
+            if delete is None:
+                raise FixtureError(
+                    '{} objects can not be removed: {}'.format(*key))
+            steps.append((
+                _ignore_missing(delete), self._adder(obj, _fields(obj))))
+        # objects that can't be deleted, e.g. plans, are added last, so
+        # that nothing fails after them
+        adds = []
+        for key in added:
+            delete = _deletable(self.api, current[key])
+            adds.append((
+                self._adder(current[key], _fields(current[key])),
+                None if delete is None else _ignore_missing(delete),
+            ))
+        steps.extend(step for step in adds if step[1] is not None)
+        for key in updated:
+            steps.append((
+                self._adder(current[key], self._changed_fields(
+                    previous[key], current[key])),
+                self._adder(previous[key], self._changed_fields(
+                    current[key], previous[key])),
+            ))
+        steps.extend(step for step in adds if step[1] is None)
+
+        with self.api.batch():
+            done = []
+            try:
+                for change, undo in steps:
+                    # undone even if it fails half way
+                    done.append(undo)
+                    change()
+            except Exception:
+                for undo in reversed(done):
+                    if undo is not None:
+                        undo()
+                raise
+        self._objects[path] = current
+        return Changes(added, updated, removed)
+
+    def _changed_fields(self, previous, current):
+        fields = _fields(current)
+        changed = {
+            field: value
+            for field, value in fields.items()
+            if previous.get(field) != value
+        }
+        # fields no longer set go back to the factory's default
+        dropped = set(_fields(previous)) - set(fields)
+        if dropped:
+            default = _default(current)
+            changed.update({field: default.get(field) for field in dropped})
+        return changed
+
+    def _add(self, obj, fields):
+        object_type = obj['object']
+        if object_type not in STORES:
+            self.api.add_object(object_type, obj['id'], **fields)
+            return
+        add = getattr(self.api, STORES[object_type][0])
+        add(*_positional(obj), **fields)
+
+    def _adder(self, obj, fields):
+        return lambda: self._add(obj, fields)
+
+    def _notify(self, path, changes):
+        for listener in self.listeners:
+            listener(path, changes)
+
+    def start(self, interval=0.5):
+        """Poll the files in a background (daemon) thread.
+
+        :param interval: seconds between polls
+        :type interval: float
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._watch, args=(interval, ), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the polling thread, waiting for it to end."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.poll()
+            except Exception as e:
+                # raised by a listener, the files keep being polled
+                self.errors[None] = e
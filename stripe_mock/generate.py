@@ -0,0 +1,485 @@
+# -*- coding: utf-8 -*-
+"""Seeded, high-speed generation of large stripe fixtures.
+
+Values are drawn a batch at a time (vectorized with NumPy when it's
+installed) and stamped onto copies of the :mod:`~stripe_mock.fake`
+factories' defaults, instead of calling a factory and Faker per field.
+
+Output is deterministic for a given seed and backend; NumPy and the
+standard library draw different (equally distributed) values.
+
+Subscriptions can come with the invoices (and charges) of their latest
+periods, billed from their plans, for paging through a long history.
+
+Usage::
+
+    s = StripeMockAPI()
+    populate(s, customers=100000, subscriptions=2, sources=1, seed=42)
+"""
+import random
+import zlib
+from datetime import datetime, timezone
+
+from faker import Faker
+
+from .clock import add_interval
+from .fake import (
+    fake_charge,
+    fake_customer,
+    fake_customer_source_bank_account,
+    fake_customer_source_card,
+    fake_invoice,
+    fake_invoice_line_item,
+    fake_plan,
+    fake_subscription,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+#: (id, name, amount, interval, weight), cheap plans are most popular
+DEFAULT_PLANS = (
+    ('basic_monthly', 'Basic', 900, 'month', 45),
+    ('pro_monthly', 'Pro', 2900, 'month', 25),
+    ('basic_yearly', 'Basic (yearly)', 9000, 'year', 12),
+    ('pro_yearly', 'Pro (yearly)', 29000, 'year', 8),
+    ('team_monthly', 'Team', 9900, 'month', 7),
+    ('enterprise_yearly', 'Enterprise', 199000, 'year', 3),
+)
+SUBSCRIPTION_STATUSES = (
+    ('active', 80),
+    ('trialing', 7),
+    ('past_due', 4),
+    ('canceled', 9),
+)
+CARD_BRANDS = (
+    ('Visa', '4242', 'credit', 52),
+    ('MasterCard', '4444', 'credit', 28),
+    ('American Express', '8431', 'credit', 12),
+    ('Discover', '1117', 'debit', 5),
+    ('JCB', '0000', 'credit', 3),
+)
+METADATA_TIERS = (('free', 60), ('pro', 30), ('enterprise', 10))
+METADATA_REGIONS = (('us', 50), ('eu', 35), ('apac', 15))
+#: share of sources that are bank accounts rather than cards
+BANK_ACCOUNT_RATE = 0.1
+#: customers sign up over this many seconds before the clock's time
+SIGNUP_SPAN = 3 * 365 * 86400
+
+_ALPHABET = (
+    '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz')
+_ID_BITS = 59  # 2 ** 59 < 62 ** 10, so ids fit 10 base62 characters
+_ID_MASK = (1 << _ID_BITS) - 1
+_ID_MULTIPLIER = 0x2545F4914F6CDD1D & _ID_MASK  # odd, so a bijection
+
+
+def _weights(table):
+    values = [row[:-1] if len(row) > 2 else row[0] for row in table]
+    return values, [row[-1] for row in table]
+
+
+class _StdlibSampler(object):
+
+    def __init__(self, seed):
+        self._random = random.Random(seed)
+
+    def uniform(self, low, high, n):
+        uniform = self._random.uniform
+        return [uniform(low, high) for _ in range(n)]
+
+    def integers(self, low, high, n):
+        """n ints in [low, high)."""
+        randrange = self._random.randrange
+        return [randrange(low, high) for _ in range(n)]
+
+    def choice(self, values, weights, n):
+        return self._random.choices(values, weights=weights, k=n)
+
+    def ids(self, prefix, start, n, salt):
+        offset = salt * _ID_MULTIPLIER
+        return [
+            prefix + _encode_id(((i * _ID_MULTIPLIER) + offset) & _ID_MASK)
+            for i in range(start, start + n)
+        ]
+
+
+class _NumpySampler(object):
+
+    def __init__(self, seed):
+        self._rng = np.random.default_rng(seed)
+        self._alphabet = np.array(list(_ALPHABET))
+
+    def uniform(self, low, high, n):
+        return self._rng.uniform(low, high, n).tolist()
+
+    def integers(self, low, high, n):
+        return self._rng.integers(low, high, n).tolist()
+
+    def choice(self, values, weights, n):
+        p = np.asarray(weights, dtype=float)
+        picks = self._rng.choice(len(values), size=n, p=p / p.sum())
+        return [values[i] for i in picks.tolist()]
+
+    def ids(self, prefix, start, n, salt):
+        numbers = np.arange(start, start + n, dtype=np.uint64)
+        with np.errstate(over='ignore'):  # uint64 wraps, like the mask
+            numbers = (numbers * np.uint64(_ID_MULTIPLIER) +
+                       np.uint64((salt * _ID_MULTIPLIER) & _ID_MASK))
+        numbers &= np.uint64(_ID_MASK)
+        digits = np.empty((n, 10), dtype=np.uint64)
+        for column in range(9, -1, -1):
+            digits[:, column] = numbers % np.uint64(62)
+            numbers //= np.uint64(62)
+        chars = self._alphabet[digits.astype(np.intp)]
+        encoded = np.ascontiguousarray(chars).view('<U10').ravel()
+        return [prefix + value for value in encoded.tolist()]
+
+
+def _salt(seed, kind):
+    """Salt id sequences per seed and kind, so they don't share suffixes."""
+    return seed * 0x9E3779B1 + zlib.crc32(kind.encode('utf-8'))
+
+
+def _encode_id(number):
+    chars = []
+    for _ in range(10):
+        number, digit = divmod(number, 62)
+        chars.append(_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def _sampler(seed, use_numpy=None):
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy and np is None:
+        raise ImportError('numpy is required for use_numpy=True')
+    return _NumpySampler(seed) if use_numpy else _StdlibSampler(seed)
+
+
+def _name_pool(seed, size=500):
+    """Draw a pool of names and domains with Faker, once per generator."""
+    faker = Faker()
+    faker.seed_instance(seed)
+    return (
+        [faker.first_name() for _ in range(size)],
+        [faker.last_name() for _ in range(size)],
+        [faker.free_email_domain() for _ in range(size // 10)],
+    )
+
+
+def generate_plans(plans=DEFAULT_PLANS):
+    """Return plan objects for the plans subscriptions are spread across.
+
+    :param plans: (id, name, amount, interval, weight) rows
+    :type plans: tuple[tuple]
+    :rtype: list[dict]
+    """
+    return [
+        fake_plan(plan_id, name=name, amount=amount, interval=interval)
+        for plan_id, name, amount, interval, _ in plans
+    ]
+
+
+def _invoice_periods(subscription, invoices):
+    """Return the (start, end) of the periods a subscription was billed
+    for, up to ``invoices`` of the latest, oldest first."""
+    status = subscription['status']
+    if status == 'trialing':
+        return []
+    interval = subscription['plan']['interval']
+    start = subscription['current_period_start']
+    if status == 'canceled':  # ended when its current period began
+        start = add_interval(start, interval, -1)
+    periods = []
+    while len(periods) < invoices and start >= subscription['created']:
+        periods.append((start, add_interval(start, interval)))
+        start = add_interval(start, interval, -1)
+    periods.reverse()
+    return periods
+
+
+def generate_objects(customers, subscriptions=1, sources=1, seed=0,
+                     now=1513273056, plans=DEFAULT_PLANS, batch_size=10000,
+                     use_numpy=None, invoices=0):
+    """Yield plans, then customers with their subscriptions and sources,
+    and the subscriptions' invoices and charges.
+
+    Objects are produced a batch of customers at a time, so memory stays
+    bounded by ``batch_size`` however many objects are generated.
+
+    :param customers: number of customers
+    :type customers: int
+    :param subscriptions: subscriptions per customer
+    :type subscriptions: int
+    :param sources: sources (mostly cards) per customer
+    :type sources: int
+    :param seed: random seed
+    :type seed: int
+    :param now: unix timestamp the fixture is generated "at"
+    :type now: int
+    :param plans: (id, name, amount, interval, weight) rows
+    :type plans: tuple[tuple]
+    :param batch_size: customers generated per batch
+    :type batch_size: int
+    :param use_numpy: force the NumPy (True) or stdlib (False) backend
+    :type use_numpy: bool
+    :param invoices: invoices per subscription, for its latest periods
+        since it was created; each is paid by a charge, except that the
+        latest invoice of a past due subscription is open and its charge
+        failed
+    :type invoices: int
+    :rtype: iterator[dict]
+    """
+    sampler = _sampler(seed, use_numpy)
+    first_names, last_names, domains = _name_pool(seed)
+
+    plan_objects = generate_plans(plans)
+    for plan in plan_objects:
+        yield plan
+    plan_weights = [row[-1] for row in plans]
+    statuses, status_weights = _weights(SUBSCRIPTION_STATUSES)
+    brands, brand_weights = _weights(CARD_BRANDS)
+    tiers, tier_weights = _weights(METADATA_TIERS)
+    regions, region_weights = _weights(METADATA_REGIONS)
+    this_year = datetime.fromtimestamp(now, timezone.utc).year
+
+    customer_template = fake_customer('')
+    subscription_template = fake_subscription('', '')
+    card_template = fake_customer_source_card('', '')
+    bank_account_template = fake_customer_source_bank_account('', '')
+    invoice_template = fake_invoice('', '')
+    line_template = fake_invoice_line_item('', '')
+    charge_template = fake_charge('', '')
+
+    for start in range(0, customers, batch_size):
+        n = min(batch_size, customers - start)
+        n_subscriptions = n * subscriptions
+        n_sources = n * sources
+
+        customer_ids = sampler.ids('cus_', start, n, _salt(seed, 'cus_'))
+        offsets = sampler.uniform(0, 1, n)
+        first = sampler.integers(0, len(first_names), n)
+        last = sampler.integers(0, len(last_names), n)
+        domain = sampler.integers(0, len(domains), n)
+        tier = sampler.choice(tiers, tier_weights, n)
+        region = sampler.choice(regions, region_weights, n)
+
+        subscription_ids = sampler.ids(
+            'sub_', start * subscriptions, n_subscriptions,
+            _salt(seed, 'sub_'))
+        item_ids = sampler.ids(
+            'si_', start * subscriptions, n_subscriptions, _salt(seed, 'si_'))
+        subscription_plans = sampler.choice(
+            plan_objects, plan_weights, n_subscriptions)
+        subscription_statuses = sampler.choice(
+            statuses, status_weights, n_subscriptions)
+        period_offsets = sampler.uniform(0, 1, n_subscriptions)
+        trial_days = sampler.integers(1, 15, n_subscriptions)
+
+        source_ids = sampler.ids(
+            'card_', start * sources, n_sources, _salt(seed, 'card_'))
+        bank_rolls = sampler.uniform(0, 1, n_sources)
+        source_brands = sampler.choice(brands, brand_weights, n_sources)
+        exp_months = sampler.integers(1, 13, n_sources)
+        exp_years = sampler.integers(this_year, this_year + 6, n_sources)
+        fingerprints = sampler.ids(
+            '', start * sources, n_sources, _salt(seed, 'fingerprint'))
+        invoice_ids = sampler.ids(
+            'in_', start * subscriptions * invoices,
+            n_subscriptions * invoices, _salt(seed, 'in_'))
+
+        for i in range(n):
+            customer_id = customer_ids[i]
+            # skewed towards recent signups, like a growing business
+            created = int(now - SIGNUP_SPAN * offsets[i] * offsets[i])
+            name = '{} {}'.format(first_names[first[i]], last_names[last[i]])
+            customer = dict(customer_template)
+            customer.update({
+                'id': customer_id,
+                'created': created,
+                'description': name,
+                'email': '{}.{}{}@{}'.format(
+                    first_names[first[i]], last_names[last[i]],
+                    start + i, domains[domain[i]]).lower(),
+                'metadata': {'tier': tier[i], 'region': region[i]},
+                'sources': {
+                    'data': [],
+                    'has_more': False,
+                    'object': 'list',
+                    'total_count': 0,
+                    'url': '/v1/customers/{}/sources'.format(customer_id),
+                },
+            })
+            customer_sources = []
+            for j in range(i * sources, (i + 1) * sources):
+                if bank_rolls[j] < BANK_ACCOUNT_RATE:
+                    source = dict(bank_account_template)
+                    source_id = 'ba_' + source_ids[j][len('card_'):]
+                else:
+                    brand, last4, funding = source_brands[j]
+                    source = dict(card_template)
+                    source_id = source_ids[j]
+                    source.update({
+                        'brand': brand,
+                        'exp_month': exp_months[j],
+                        'exp_year': exp_years[j],
+                        'funding': funding,
+                        'last4': last4,
+                    })
+                source.update({
+                    'id': source_id,
+                    'customer': customer_id,
+                    'fingerprint': fingerprints[j],
+                    'metadata': {},
+                })
+                customer_sources.append(source)
+            if customer_sources:
+                customer['default_source'] = customer_sources[0]['id']
+            yield customer
+            for source in customer_sources:
+                yield source
+
+            for j in range(i * subscriptions, (i + 1) * subscriptions):
+                plan = subscription_plans[j]
+                status = subscription_statuses[j]
+                period_start = int(now - (
+                    add_interval(now, plan['interval']) - now) *
+                    period_offsets[j])
+                period_start = max(period_start, created)
+                subscription_id = subscription_ids[j]
+                subscription = dict(subscription_template)
+                subscription.update({
+                    'id': subscription_id,
+                    'created': created,
+                    'start': created,
+                    'customer': customer_id,
+                    'current_period_start': period_start,
+                    'current_period_end': add_interval(
+                        period_start, plan['interval']),
+                    'metadata': {},
+                    'plan': plan,
+                    'status': status,
+                    'items': {
+                        'data': [{
+                            'created': created,
+                            'id': item_ids[j],
+                            'metadata': {},
+                            'object': 'subscription_item',
+                            'plan': plan,
+                            'quantity': 1,
+                        }],
+                        'has_more': False,
+                        'object': 'list',
+                        'total_count': 1,
+                        'url': '/v1/subscription_items?subscription={}'.format(
+                            subscription_id),
+                    },
+                })
+                if status == 'trialing':
+                    subscription['trial_start'] = period_start
+                    subscription['trial_end'] = now + trial_days[j] * 86400
+                elif status == 'canceled':
+                    subscription['canceled_at'] = period_start
+                    subscription['ended_at'] = period_start
+                yield subscription
+
+                periods = _invoice_periods(subscription, invoices)
+                for k, (billed_start, billed_end) in enumerate(periods):
+                    invoice_id = invoice_ids[j * invoices + k]
+                    charge_id = 'ch_' + invoice_id[len('in_'):]
+                    failed = (
+                        status == 'past_due' and k == len(periods) - 1)
+                    amount = plan['amount']
+                    invoice = dict(invoice_template)
+                    invoice.update({
+                        'id': invoice_id,
+                        'amount_due': amount,
+                        'amount_paid': 0 if failed else amount,
+                        'amount_remaining': amount if failed else 0,
+                        'charge': charge_id,
+                        'closed': not failed,
+                        'created': billed_start,
+                        'customer': customer_id,
+                        'lines': {
+                            'data': [dict(line_template, **{
+                                'amount': amount,
+                                'id': 'sli_' + invoice_id[len('in_'):],
+                                'metadata': {},
+                                'period': {
+                                    'end': billed_end,
+                                    'start': billed_start,
+                                },
+                                'plan': plan,
+                                'subscription': subscription_id,
+                                'subscription_item': item_ids[j],
+                            })],
+                            'has_more': False,
+                            'object': 'list',
+                            'total_count': 1,
+                            'url': '/v1/invoices/{}/lines'.format(
+                                invoice_id),
+                        },
+                        'metadata': {},
+                        'paid': not failed,
+                        'period_end': billed_end,
+                        'period_start': billed_start,
+                        'status': 'open' if failed else 'paid',
+                        'subscription': subscription_id,
+                        'subtotal': amount,
+                        'total': amount,
+                        'webhooks_delivered_at': billed_start,
+                    })
+                    yield invoice
+
+                    charge = dict(charge_template)
+                    charge.update({
+                        'id': charge_id,
+                        'amount': amount,
+                        'created': billed_start,
+                        'customer': customer_id,
+                        'fraud_details': {},
+                        'invoice': invoice_id,
+                        'metadata': {},
+                        'outcome': dict(charge_template['outcome']),
+                        'refunds': dict(
+                            charge_template['refunds'],
+                            url='/v1/charges/{}/refunds'.format(charge_id)),
+                        'source': customer_sources[0]['id']
+                        if customer_sources else None,
+                    })
+                    if failed:
+                        charge.update({
+                            'failure_code': 'card_declined',
+                            'failure_message': 'Your card was declined.',
+                            'outcome': dict(
+                                charge['outcome'],
+                                network_status='declined_by_network',
+                                seller_message='The bank did not return '
+                                'any further details with this decline.',
+                                type='issuer_declined'),
+                            'paid': False,
+                            'status': 'failed',
+                        })
+                    yield charge
+
+
+def populate(api, customers, subscriptions=1, sources=1, seed=0, **kwargs):
+    """Generate a fixture straight into a :class:`StripeMockAPI`'s stores.
+
+    Objects are streamed through :meth:`StripeMockAPI.bulk_load`, dated
+    relative to the API's simulated clock. Takes the same keyword
+    arguments as :func:`generate_objects`.
+
+    :returns: number of objects loaded
+    :rtype: int
+    """
+    kwargs.setdefault('now', api.clock.frozen_time)
+    return api.bulk_load(
+        generate_objects(
+            customers,
+            subscriptions=subscriptions,
+            sources=sources,
+            seed=seed,
+            **kwargs))
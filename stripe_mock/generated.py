@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Generated by ``python -m stripe_mock codegen`` from spec3.json, do not edit.
+"""Factories and routes of the resources of stripe's OpenAPI spec.
+
+See :mod:`stripe_mock.codegen`.
+"""
+
+#: version of the spec generated from
+SPEC_VERSION = '2017-08-15'
+
+
+def fake_checkout_session(session_id, **kwargs):
+    return {
+        **{
+            'amount_total': None,
+            'cancel_url': None,
+            'created': 1513262366,
+            'currency': None,
+            'customer': None,
+            'expires_at': 1513262366,
+            'id': session_id,
+            'line_items': {
+                'data': [],
+                'has_more': False,
+                'object': 'list',
+                'url': '',
+            },
+            'livemode': False,
+            'metadata': None,
+            'mode': 'payment',
+            'object': 'checkout.session',
+            'payment_status': 'no_payment_required',
+            'status': None,
+            'success_url': None,
+            'url': None,
+        },
+        **kwargs
+    }
+
+
+def fake_customer(customer_id, **kwargs):
+    return {
+        **{
+            'balance': 0,
+            'created': 1513262366,
+            'currency': None,
+            'delinquent': None,
+            'description': None,
+            'email': None,
+            'id': customer_id,
+            'livemode': False,
+            'metadata': {},
+            'name': None,
+            'object': 'customer',
+        },
+        **kwargs
+    }
+
+
+def fake_price(price_id, **kwargs):
+    return {
+        **{
+            'active': False,
+            'billing_scheme': 'per_unit',
+            'created': 1513262366,
+            'currency': 'usd',
+            'id': price_id,
+            'livemode': False,
+            'lookup_key': None,
+            'metadata': {},
+            'nickname': None,
+            'object': 'price',
+            'product': '',
+            'recurring': None,
+            'tax_behavior': None,
+            'type': 'one_time',
+            'unit_amount': None,
+        },
+        **kwargs
+    }
+
+
+def fake_product(product_id, **kwargs):
+    return {
+        **{
+            'active': False,
+            'created': 1513262366,
+            'default_price': None,
+            'description': None,
+            'id': product_id,
+            'images': [],
+            'livemode': False,
+            'metadata': {},
+            'name': '',
+            'object': 'product',
+            'package_dimensions': None,
+            'shippable': None,
+            'statement_descriptor': None,
+            'unit_label': None,
+            'updated': 1513262366,
+            'url': None,
+        },
+        **kwargs
+    }
+
+
+def fake_tax_rate(tax_rate_id, **kwargs):
+    return {
+        **{
+            'active': False,
+            'country': None,
+            'created': 1513262366,
+            'description': None,
+            'display_name': '',
+            'id': tax_rate_id,
+            'inclusive': False,
+            'jurisdiction': None,
+            'livemode': False,
+            'metadata': None,
+            'object': 'tax_rate',
+            'percentage': 0.0,
+            'state': None,
+            'tax_type': None,
+        },
+        **kwargs
+    }
+
+
+#: factory by the ``object`` of the resources
+FACTORIES = {
+    'checkout.session': fake_checkout_session,
+    'customer': fake_customer,
+    'price': fake_price,
+    'product': fake_product,
+    'tax_rate': fake_tax_rate,
+}
+
+#: (method, path, object type, action) of the routes listing and
+#: retrieving resources
+ROUTES = (
+    ('GET', '/v1/checkout/sessions', 'checkout.session', 'list'),
+    ('GET', '/v1/checkout/sessions/{session}', 'checkout.session', 'retrieve'),
+    ('GET', '/v1/customers', 'customer', 'list'),
+    ('GET', '/v1/customers/{customer}', 'customer', 'retrieve'),
+    ('GET', '/v1/prices', 'price', 'list'),
+    ('GET', '/v1/prices/{price}', 'price', 'retrieve'),
+    ('GET', '/v1/products', 'product', 'list'),
+    ('GET', '/v1/products/{id}', 'product', 'retrieve'),
+    ('GET', '/v1/tax_rates', 'tax_rate', 'list'),
+    ('GET', '/v1/tax_rates/{tax_rate}', 'tax_rate', 'retrieve'),
+)
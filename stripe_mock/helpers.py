@@ -3,24 +3,32 @@ import json
 
 import responses
 
+from .records import to_json_default
+
 
 def add_response(method, url, body, status):
     """Utility function to register a responses mock.
 
     - handles setting content_type as json
-    - dumps data (dict) to a json-encoded string literal
+    - dumps data (dict) to a json-encoded string literal, rendering
+      compact records (see :mod:`stripe_mock.records`) along the way
+    - already encoded bodies (bytes, e.g. from
+      :func:`stripe_mock.templates.render`) are passed as is
 
     :param method: GET, POST, UPDATE, etc.
     :type method: string
     :param url: url
     :type url: string
     :param data: data will be dumped into json string automatically
-    :type data: dict
+    :type data: dict or bytes
     :param status: http status to return
     :type status: int
     :rtype: void (nothing)
     """
-    json_body = json.dumps(body)
+    if isinstance(body, bytes):
+        json_body = body
+    else:
+        json_body = json.dumps(body, default=to_json_default)
     responses.add(
         getattr(responses, method),
         url,
@@ -47,7 +55,7 @@ def add_callback(method, url, cb):
 
     def json_cb(request):
         status, headers, body = cb(request)
-        return (status, headers, json.dumps(body))
+        return (status, headers, json.dumps(body, default=to_json_default))
 
     responses.add_callback(
         getattr(responses, method),
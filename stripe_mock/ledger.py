@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""Customer balance transactions, in an append-only ledger per customer.
+
+A customer's balance is its opening balance (the one it had before its
+first transaction) plus the amounts of its balance transactions
+(negative amounts are credits). Credit note and proration
+code reads it at arbitrary points in time, over long histories, so it
+isn't recomputed by replaying them: each customer's ledger keeps two
+typed arrays, the ``created`` of its transactions and the running
+balance after each (its prefix sums, the transactions'
+``ending_balance``). The current balance is the last running balance,
+and the balance at a time a binary search of ``created``.
+
+Transactions are appended in ``created`` order, as stripe creates them;
+only their ``description`` and ``metadata`` can change afterwards.
+
+Reads take no lock: a transaction is published by appending its
+``created`` last, and readers only look at as many transactions as
+there are ``created`` timestamps when they start.
+"""
+import array
+import bisect
+import threading
+
+
+class LedgerError(ValueError):
+
+    """Raised for balance transactions that can't be appended."""
+    pass
+
+
+class _CustomerLedger(object):
+
+    """Columns of one customer's balance transactions."""
+
+    __slots__ = ('opening', 'created', 'balances', 'transactions')
+
+    def __init__(self, opening=0):
+        self.opening = opening
+        self.created = array.array('q')
+        self.balances = array.array('q')
+        self.transactions = []
+
+
+class BalanceLedger(object):
+
+    """Balance transactions of customers, by customer and by id."""
+
+    def __init__(self):
+        self._customers = {}
+        # (customer id, position) by transaction id
+        self._by_id = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, transaction_id):
+        return transaction_id in self._by_id
+
+    def count(self, customer_id):
+        """Return the number of balance transactions of a customer.
+
+        :rtype: int
+        """
+        ledger = self._customers.get(customer_id)
+        return 0 if ledger is None else len(ledger.created)
+
+    def get(self, transaction_id):
+        """Return a balance transaction by id.
+
+        :raises: :class:`KeyError` if there's no such transaction
+        :rtype: dict
+        """
+        customer_id, position = self._by_id[transaction_id]
+        return self._customers[customer_id].transactions[position]
+
+    def append(self, transaction, opening_balance=0):
+        """Store a new balance transaction, setting its ``ending_balance``.
+
+        :param transaction: customer_balance_transaction with ``id``,
+            ``customer``, ``amount`` and ``created``
+        :type transaction: dict
+        :param opening_balance: the customer's balance before its first
+            transaction; ignored once it has one
+        :type opening_balance: int
+        :raises: :class:`LedgerError` if the id is stored already, or if
+            the transaction is older than the customer's last one
+        :returns: the transaction
+        :rtype: dict
+        """
+        with self._lock:
+            if transaction['id'] in self._by_id:
+                raise LedgerError(
+                    'Balance transaction {} exists already'.format(
+                        transaction['id']))
+            customer_id = transaction['customer']
+            ledger = self._customers.get(customer_id)
+            if ledger is None:
+                ledger = self._customers[customer_id] = _CustomerLedger(
+                    opening_balance)
+            elif transaction['created'] < ledger.created[-1]:
+                raise LedgerError(
+                    'Balance transactions are appended in created order: '
+                    '{} is older than {}'.format(
+                        transaction['created'], ledger.created[-1]))
+
+            balance = (
+                ledger.balances[-1] if ledger.balances else ledger.opening)
+            transaction['ending_balance'] = balance + transaction['amount']
+            ledger.balances.append(transaction['ending_balance'])
+            ledger.transactions.append(transaction)
+            self._by_id[transaction['id']] = (
+                customer_id, len(ledger.transactions) - 1)
+            ledger.created.append(transaction['created'])
+        return transaction
+
+    def discard(self, customer_id):
+        """Forget the balance transactions of a customer, if any.
+
+        :param customer_id: id of the customer
+        :type customer_id: string
+        """
+        with self._lock:
+            ledger = self._customers.pop(customer_id, None)
+            for transaction in (ledger.transactions if ledger else ()):
+                del self._by_id[transaction['id']]
+
+    def balance(self, customer_id, at=None):
+        """Return the balance of a customer: the current one in constant
+        time, or the one at a time in logarithmic time.
+
+        :param customer_id: id of the customer
+        :type customer_id: string
+        :param at: unix timestamp; the balance after the transactions
+            created at or before it
+        :type at: int
+        :rtype: int
+        """
+        ledger = self._customers.get(customer_id)
+        if ledger is None:
+            return 0
+        count = len(ledger.created)
+        if at is not None:
+            count = bisect.bisect_right(ledger.created, at, 0, count)
+        return ledger.balances[count - 1] if count else ledger.opening
+
+    def page(self, customer_id, limit=10, starting_after=None,
+             ending_before=None):
+        """Return one page of a customer's balance transactions, newest
+        first, like stripe's lists.
+
+        :param customer_id: id of the customer
+        :type customer_id: string
+        :param limit: page size
+        :type limit: int
+        :param starting_after: return transactions older than this one
+        :type starting_after: string
+        :param ending_before: return transactions newer than this one
+        :type ending_before: string
+        :raises: :class:`KeyError` if a cursor is not one of the
+            customer's transactions
+        :returns: (transactions, has_more)
+        :rtype: (list[dict], bool)
+        """
+        ledger = self._customers.get(customer_id) or _CustomerLedger()
+        transactions = ledger.transactions
+        low, high = 0, len(ledger.created)
+
+        if ending_before is not None:
+            low = min(high, self._position(customer_id, ending_before) + 1)
+            stop = min(high, low + limit)
+            data = transactions[low:stop]
+            data.reverse()
+            return data, stop < high
+
+        if starting_after is not None:
+            high = min(high, self._position(customer_id, starting_after))
+        start = max(low, high - limit)
+        data = transactions[start:high]
+        data.reverse()
+        return data, start > low
+
+    def _position(self, customer_id, transaction_id):
+        cursor = self._by_id.get(transaction_id)
+        if cursor is None or cursor[0] != customer_id:
+            raise KeyError(transaction_id)
+        return cursor[1]
@@ -1,58 +1,250 @@
 # -*- coding: utf-8 -*-
+import contextlib
+import functools
 import itertools
+import threading
 
 import responses
 
+from .clock import DEFAULT_FROZEN_TIME, TestClock, add_interval
+from .discounts import (
+    CouponRedemptionError,
+    CouponRedemptions,
+    discount_end,
+)
+from .encoding import (
+    FragmentCache,
+    JSONList,
+    encode_json,
+)
+from .events import EventLog
+from .generated import FACTORIES, ROUTES
 from .fake import (
+    fake_charge,
     fake_coupon,
     fake_coupon_list,
     fake_customer,
+    fake_customer_balance_transaction,
+    fake_customer_discount,
     fake_customer_list,
     fake_customer_source,
     fake_customer_source_bank_account,
     fake_customer_source_card,
     fake_customer_source_list,
     fake_customer_subscription_list,
+    fake_invoice,
+    fake_invoice_charge,
     fake_plan,
     fake_plan_list,
     fake_subscription,
+    fake_subscription_invoice,
     fake_subscription_list,
+    fake_usage_record,
+    fake_usage_record_summary,
 )
-from .helpers import add_callback, add_response
+from .ledger import BalanceLedger, LedgerError
+from .parallel import render_bodies, update_bodies
+from .profiling import span
 from .patterns import (
+    CHARGE_LIST_URL_RE,
+    CHARGE_URL_RE,
     COUPON_URL_BASE,
     COUPON_URL_RE,
+    CUSTOMER_BALANCE_TRANSACTION_LIST_URL_RE,
+    CUSTOMER_BALANCE_TRANSACTION_URL_RE,
+    CUSTOMER_DISCOUNT_URL_RE,
+    CUSTOMER_SEARCH_URL_RE,
     CUSTOMER_SOURCE_LIST_URL_RE,
     CUSTOMER_SOURCE_OBJECT_URL_RE,
     CUSTOMER_SOURCE_OBJECT_URL_TPL,
     CUSTOMER_SUBSCRIPTION_LIST_URL_TPL,
+    CUSTOMER_UPDATE_URL_RE,
     CUSTOMER_URL_BASE,
     CUSTOMER_URL_RE,
+    EVENT_LIST_URL_RE,
+    EVENT_URL_RE,
+    INVOICE_LIST_URL_RE,
+    INVOICE_URL_RE,
     PLAN_URL_BASE,
     PLAN_URL_RE,
     SOURCE_URL_BASE,
     SOURCE_URL_RE,
+    SUBSCRIPTION_DISCOUNT_URL_RE,
     SUBSCRIPTION_OBJECT_URL_TPL,
+    SUBSCRIPTION_SEARCH_URL_RE,
+    SUBSCRIPTION_UPDATE_URL_RE,
     SUBSCRIPTION_URL_BASE,
     SUBSCRIPTION_URL_RE,
+    USAGE_RECORD_SUMMARY_URL_RE,
+    USAGE_RECORD_URL_RE,
+    collection_url_re,
 )
+from .records import as_dict, compact, peek
+from .references import ReferenceIndex, ReferenceIntegrityError, key
 from .response_callbacks import (
+    balance_transaction_callback_factory,
+    balance_transaction_create_callback_factory,
+    balance_transaction_list_callback_factory,
+    balance_transaction_update_callback_factory,
     coupon_not_found,
+    coupon_update_callback_factory,
     customer_not_found,
+    delete_callback_factory,
+    discount_delete_callback_factory,
+    event_list_callback_factory,
+    event_callback_factory,
+    object_store_callback_factory,
     plan_not_found,
+    search_callback_factory,
     source_callback_factory,
     source_list_callback_factory,
     subscription_not_found,
+    time_index_callback_factory,
+    time_index_list_callback_factory,
+    usage_record_callback_factory,
+    usage_record_summary_callback_factory,
 )
+from .router import Router, install
+from .search import SearchIndex
+from .timeindex import TimeIndex
+from .usage import UsageRecordError, UsageStore
+
+# objects of the sources a customer's source list is filtered by, e.g.
+# /v1/customers/cus_1/sources?object=card
+_SOURCE_OBJECTS = ('bank_account', 'card', 'source')
+
+# object types with stores and routes of their own, the other resources
+# of the OpenAPI spec are served from StripeMockAPI.objects
+_MODELED_OBJECTS = frozenset([
+    'bank_account',
+    'card',
+    'charge',
+    'coupon',
+    'customer',
+    'customer_balance_transaction',
+    'discount',
+    'event',
+    'invoice',
+    'plan',
+    'source',
+    'subscription',
+])
+
+
+def _collections(routes):
+    """Return (object type, actions) by collection path, of the
+    generated routes of the resources not modeled here."""
+    collections = {}
+    for _, path, object_type, action in routes:
+        if object_type in _MODELED_OBJECTS:
+            continue
+        if action == 'retrieve':
+            path = path.rsplit('/', 1)[0]
+        collections.setdefault(path, (object_type, set()))[1].add(action)
+    return collections
+
+
+_COLLECTIONS = _collections(ROUTES)
+_COLLECTION_URL_RE = collection_url_re(_COLLECTIONS) if _COLLECTIONS else None
+
+
+def _locked(method):
+    """Run a method changing the stores with the sync lock held, so routes
+    are never rendered from stores half changed, see
+    :meth:`StripeMockAPI._writing`."""
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._writing():
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def _previous_attributes(obj, kwargs):
+    return {
+        key: obj.get(key)
+        for key, value in kwargs.items() if obj.get(key) != value
+    }
 
 
 def _add_object(storage, object_id, fake_fn, **kwargs):
+    """Generic function for storing / updating a root-level object.
+
+    :returns: the stored object, and the attributes an update overwrote
+        (None if the object was created)
+    :rtype: (dict, dict or None)
+    """
     for idx, c in enumerate(storage):
-        if object_id == c.id:  # plan already exists, overwrite properties
+        if object_id == c['id']:  # object already exists, overwrite properties
+            previous_attributes = _previous_attributes(storage[idx], kwargs)
             storage[idx].update(kwargs)
-            return
+            return storage[idx], previous_attributes
+
+    obj = fake_fn(object_id, **kwargs)
+    storage.append(obj)  # add object
+    return obj, None
+
+
+def _find(storage, object_id):
+    """Return the stored root-level object with an id, or None."""
+    for obj in storage:
+        if obj['id'] == object_id:
+            return obj
+    return None
+
+
+def _plan_id(plan):
+    """Return the id of an embedded plan, or of a plan given by id."""
+    if plan is None or isinstance(plan, str):
+        return plan
+    return plan.get('id')
+
+
+def _embed_plan(items, plan, previous_plan_id):
+    """Return a subscription's items, with plan (or a plan id) embedded by
+    reference in the items on plan, or on the subscription's previous
+    plan."""
+    if not items or not items.get('data'):
+        return items
+    plan_ids = (previous_plan_id, _plan_id(plan))
+    return dict(items, data=[
+        dict(as_dict(item), plan=plan)
+        if _plan_id(peek(item, 'plan')) in plan_ids else item
+        for item in items['data']
+    ])
+
+
+def _link_plans(listing, plans):
+    """Return a list of e.g. invoice lines, with the plans stored under
+    their plan ids embedded by reference."""
+    if not listing.get('data'):
+        return listing
+    data = []
+    for element in listing['data']:
+        plan = plans.get(_plan_id(peek(element, 'plan')))
+        if plan is not None:
+            element = dict(as_dict(element), plan=plan)
+        data.append(element)
+    return dict(listing, data=data)
+
+
+def _add_time_indexed(index, customer_id, object_id, fake_fn, **kwargs):
+    """Generic function for storing / updating an object of a
+    :class:`~stripe_mock.timeindex.TimeIndex`, e.g. an invoice.
+
+    :returns: the stored object, and the attributes an update overwrote
+        (None if the object was created)
+    :rtype: (dict, dict or None)
+    """
+    if object_id in index:
+        obj = index.get(object_id)
+        previous_attributes = _previous_attributes(obj, kwargs)
+        obj.update(kwargs)
+        index.add(obj)  # re-index a changed ``created``
+        return obj, previous_attributes
 
-    storage.append(fake_fn(object_id, **kwargs))  # add object
+    obj = fake_fn(customer_id, object_id, **kwargs)
+    index.add(obj)
+    return obj, None
 
 
 def _add_customer_object(storage, customer_id, object_id, fake_fn, **kwargs):
@@ -67,17 +259,25 @@ def _add_customer_object(storage, customer_id, object_id, fake_fn, **kwargs):
 
             ]
         }
+
+    :returns: the stored object, and the attributes an update overwrote
+        (None if the object was created)
+    :rtype: (dict, dict or None)
     """
 
     if customer_id not in storage:
         storage[customer_id] = []
 
     for idx, subscription in enumerate(storage[customer_id]):
-        if kwargs['id'] == subscription['id']:  # update and return void
+        if object_id == subscription['id']:  # update and return it
+            previous_attributes = _previous_attributes(
+                storage[customer_id][idx], kwargs)
             storage[customer_id][idx].update(kwargs)
-            return
+            return storage[customer_id][idx], previous_attributes
 
-    storage[customer_id].append(fake_fn(customer_id, object_id, **kwargs))
+    obj = fake_fn(customer_id, object_id, **kwargs)
+    storage[customer_id].append(obj)
+    return obj, None
 
 
 class StripeMockAPI(object):
@@ -113,18 +313,78 @@ class StripeMockAPI(object):
     Usage:
         s = StripeResponses()
 
+    :param frozen_time: starting unix timestamp of the simulated clock, see
+        :meth:`advance_clock`
+    :type frozen_time: int
+    :param compact: store objects as ``__slots__`` records instead of dicts,
+        see :mod:`stripe_mock.records`
+    :type compact: bool
+    :param auto_sync: bring the routes up to date as each change ends,
+        instead of on :meth:`sync`; only what changed is re-rendered
+    :type auto_sync: bool
+    :param profiler: records the phases of :meth:`sync` and of requests,
+        see :mod:`stripe_mock.profiling`
+    :type profiler: :class:`~stripe_mock.profiling.Profiler`
     """
 
-    def __init__(self):
+    def __init__(self, frozen_time=DEFAULT_FROZEN_TIME, compact=False,
+                 auto_sync=False, profiler=None):
+        self.compact = compact
+        self.auto_sync = auto_sync
+        self.profiler = profiler
         self.customers = []
+        # positions in customers by id
+        self._customer_positions = {}
         self.customer_sources = {}
         self.customer_source_cards = {}
         self.customer_source_bank_accounts = {}
         self.customer_subscriptions = {}
+        #: discounts by customer id, see :meth:`apply_coupon`
         self.customer_discounts = {}
+        #: discounts by subscription id
         self.subscription_discounts = {}
+        self.redemptions = CouponRedemptions()
+        #: objects pointing at each stored object, see
+        #: :mod:`stripe_mock.references`
+        self.references = ReferenceIndex()
+        #: metered usage, by subscription item id
+        self.usage = UsageStore()
+        #: customer balance transactions, see
+        #: :meth:`add_balance_transaction`
+        self.balance_transactions = BalanceLedger()
+        # subscription by the id of each of its items
+        self._item_subscriptions = {}
         self.coupons = []
         self.plans = []
+        #: invoices, by id and by customer, ordered by ``created``
+        self.invoices = TimeIndex()
+        #: charges, by id and by customer, ordered by ``created``
+        self.charges = TimeIndex()
+        #: objects of the other resources of the OpenAPI spec, by id, by
+        #: object type, see :meth:`add_object`
+        self.objects = {}
+        #: encoded plans, for the subscriptions embedding them
+        self.plan_fragments = FragmentCache()
+        self.customer_index = SearchIndex(fields=('email', ))
+        self.subscription_index = SearchIndex(fields=('status', ))
+        self.clock = TestClock(frozen_time)
+        self.events = EventLog(clock=self.clock)
+        #: routes of the last :meth:`sync`, see :meth:`dispatch`; a frozen
+        #: version, replaced whole by each update, so requests read it
+        #: without locks
+        self.router = None
+        # the next version of the router, while changes are under way
+        self._router_draft = None
+        # encoded bodies the routes serve, and what changed since
+        self._bodies = None
+        self._dirty_resources = set()
+        self._dirty_customers = set()
+        # held while changing the stores, and rendering routes from them
+        self._sync_lock = threading.RLock()
+        # changes under way, nested, and whether the routes are to be
+        # brought up to date when the outermost ends
+        self._writes = 0
+        self._publish = False
 
     @property
     def subscriptions(self):
@@ -134,8 +394,8 @@ class StripeMockAPI(object):
         :rtype: list[dict]
         """
         return [
-            sub for sub in
-            [subs for _, subs in self.customer_subscriptions.items()]
+            sub for subs in self.customer_subscriptions.values()
+            for sub in subs
         ]
 
     @property
@@ -167,6 +427,25 @@ class StripeMockAPI(object):
             )
         ]
 
+    def _factory(self, fake_fn):
+        """Return fake_fn, producing records if the store is compact."""
+        if not self.compact:
+            return fake_fn
+
+        def compact_fake_fn(*args, **kwargs):
+            return compact(fake_fn(*args, **kwargs))
+
+        return compact_fake_fn
+
+    def _emit(self, resource, obj, previous_attributes):
+        """Record a '{resource}.created' or '{resource}.updated' event."""
+        if previous_attributes is None:
+            self.events.append('{}.created'.format(resource), obj)
+        elif previous_attributes:
+            self.events.append(
+                '{}.updated'.format(resource), obj, previous_attributes)
+
+    @_locked
     def add_source(self, customer_id, source_id, **kwargs):
         """Add a source attached to customer ID.
 
@@ -179,14 +458,18 @@ class StripeMockAPI(object):
 
         If source ID already exists, overwrite properties.
         """
-        _add_customer_object(
+        source, previous_attributes = _add_customer_object(
             self.customer_sources,
             customer_id,
             source_id,
-            fake_customer_source,
+            self._factory(fake_customer_source),
             **kwargs,
         )
+        self.references.add(source)
+        self._touch(customer_id)
+        self._emit('customer.source', source, previous_attributes)
 
+    @_locked
     def add_source_card(self, customer_id, card_id, **kwargs):
         """Add a card source attached to a customer ID.
 
@@ -202,14 +485,18 @@ class StripeMockAPI(object):
         If card ID already exists, overwrite properties.
         """
 
-        _add_customer_object(
+        card, previous_attributes = _add_customer_object(
             self.customer_source_cards,
             customer_id,
             card_id,
-            fake_customer_source_card,
+            self._factory(fake_customer_source_card),
             **kwargs,
         )
+        self.references.add(card)
+        self._touch(customer_id)
+        self._emit('customer.source', card, previous_attributes)
 
+    @_locked
     def add_source_bank_account(self, customer_id, bank_account_id, **kwargs):
         """Add a bank_account source attached to a customer ID.
 
@@ -225,194 +512,1494 @@ class StripeMockAPI(object):
         If bank_account ID already exists, overwrite properties.
         """
 
-        _add_customer_object(
+        bank_account, previous_attributes = _add_customer_object(
             self.customer_source_bank_accounts,
             customer_id,
             bank_account_id,
-            fake_customer_source_bank_account,
+            self._factory(fake_customer_source_bank_account),
             **kwargs,
         )
+        self.references.add(bank_account)
+        self._touch(customer_id)
+        self._emit('customer.source', bank_account, previous_attributes)
 
+    @_locked
     def add_subscription(self, customer_id, subscription_id, **kwargs):
-        """Add / Update a subscription for a customer."""
-        _add_customer_object(
+        """Add / Update a subscription for a customer.
+
+        A ``plan`` that's stored (given as the plan, or its id) is
+        embedded by reference, in the subscription and in its items, so
+        :meth:`add_plan` updates show through. A plan id that isn't stored
+        yet is set in the subscription and its items, and the plan is
+        embedded when :meth:`add_plan` stores it.
+        """
+        plan = kwargs.get('plan')
+        if plan is not None:
+            plan = _find(self.plans, _plan_id(plan)) or plan
+            current = _find(
+                self.customer_subscriptions.get(customer_id, []),
+                subscription_id) or fake_subscription(
+                    customer_id, subscription_id)
+            kwargs['plan'] = plan
+            kwargs['items'] = _embed_plan(
+                kwargs['items']
+                if 'items' in kwargs else peek(current, 'items'),
+                plan,
+                _plan_id(peek(current, 'plan')),
+            )
+
+        subscription, previous_attributes = _add_customer_object(
             self.customer_subscriptions,
             customer_id,
             subscription_id,
-            fake_subscription,
+            self._factory(fake_subscription),
             **kwargs,
         )
+        self.subscription_index.add(subscription)
+        self.references.add(subscription)
+        self._index_items(subscription)
+        self.clock.schedule(subscription)
+        self._touch(customer_id)
+        self._emit(
+            'customer.subscription', subscription, previous_attributes)
+
+    @_locked
+    def advance_clock(self, frozen_time):
+        """Move the simulated clock forward to frozen_time.
+
+        Subscriptions renew, leave their trial or get canceled (with
+        ``cancel_at_period_end``) as their periods lapse. Only subscriptions
+        with a transition due are touched.
+
+        :param frozen_time: unix timestamp to move to
+        :type frozen_time: int
+        :returns: subscriptions that changed
+        :rtype: list[dict]
+        """
+        changed = self.clock.advance(frozen_time)
+        for subscription in changed:
+            self.subscription_index.add(subscription)
+            self._touch(subscription['customer'])
+            self.events.append(
+                'customer.subscription.deleted'
+                if subscription['status'] == 'canceled' else
+                'customer.subscription.updated',
+                subscription,
+                created=frozen_time,
+            )
+        return changed
 
+    @_locked
     def add_plan(self, plan_id, **kwargs):
         """Add / update a plan by id."""
-        _add_object(self.plans, plan_id, fake_plan, **kwargs)
-
+        plan, previous_attributes = _add_object(
+            self.plans, plan_id, self._factory(fake_plan), **kwargs)
+        self.plan_fragments.invalidate(plan_id)
+        self._embed_pending_plan(plan)
+        # subscriptions embed the plan
+        self._touch(
+            resource='plans' if previous_attributes is None else 'all')
+        self._emit('plan', plan, previous_attributes)
+
+    def _embed_pending_plan(self, plan):
+        """Embed a plan in the subscriptions added while it wasn't stored,
+        which hold its id instead."""
+        plan_id = plan['id']
+        for kind, object_id in self.references.referrers(('plan', plan_id)):
+            subscription = (
+                self.subscription_index.objects.get(object_id)
+                if kind == 'subscription' else None)
+            if subscription is None:
+                continue
+            current = peek(subscription, 'plan')
+            items = peek(subscription, 'items')
+            held = [current] + [
+                peek(item, 'plan') for item in (items or {}).get('data') or ()]
+            if all(held_plan is plan for held_plan in held
+                   if _plan_id(held_plan) == plan_id):
+                continue
+            if _plan_id(current) == plan_id:
+                subscription['plan'] = plan
+            subscription['items'] = _embed_plan(
+                items, plan, _plan_id(current))
+            self._index_items(subscription)
+            self._touch(peek(subscription, 'customer'))
+
+    @_locked
     def add_coupon(self, coupon_id, **kwargs):
         """Add / update coupon object."""
-        _add_object(self.coupons, coupon_id, fake_coupon, **kwargs)
-
+        coupon, previous_attributes = _add_object(
+            self.coupons, coupon_id, self._factory(fake_coupon), **kwargs)
+        # discounts embed redeemed coupons
+        self._touch(
+            resource='all' if coupon['times_redeemed'] and
+            previous_attributes else 'coupons')
+        self._emit('coupon', coupon, previous_attributes)
+
+    @_locked
     def add_customer(self, customer_id, **kwargs):
         """Add / update customer object."""
-        _add_object(self.customers, customer_id, fake_customer, **kwargs)
+        position = self._customer_positions.get(customer_id)
+        if position is None:
+            customer = self._factory(fake_customer)(customer_id, **kwargs)
+            previous_attributes = None
+            self._customer_positions[customer_id] = len(self.customers)
+            self.customers.append(customer)
+        else:
+            customer = self.customers[position]
+            previous_attributes = _previous_attributes(customer, kwargs)
+            customer.update(kwargs)
+        self.customer_index.add(customer)
+        self._touch(customer_id)
+        self._emit('customer', customer, previous_attributes)
+
+    @_locked
+    def add_invoice(self, customer_id, invoice_id, **kwargs):
+        """Add / update an invoice of a customer.
+
+        New invoices are ``created`` at the clock's time, unless given.
+        """
+        if invoice_id not in self.invoices:
+            kwargs.setdefault('created', self.clock.frozen_time)
+        invoice, previous_attributes = _add_time_indexed(
+            self.invoices, customer_id, invoice_id,
+            self._factory(fake_invoice), **kwargs)
+        self._emit('invoice', invoice, previous_attributes)
+        return invoice
+
+    @_locked
+    def add_charge(self, customer_id, charge_id, **kwargs):
+        """Add / update a charge of a customer.
+
+        New charges are ``created`` at the clock's time, unless given, and
+        recorded as a 'charge.{status}' event, e.g. 'charge.succeeded'.
+        """
+        if charge_id not in self.charges:
+            kwargs.setdefault('created', self.clock.frozen_time)
+        charge, previous_attributes = _add_time_indexed(
+            self.charges, customer_id, charge_id,
+            self._factory(fake_charge), **kwargs)
+        if previous_attributes is None:
+            self.events.append('charge.{}'.format(charge['status']), charge)
+        else:
+            self._emit('charge', charge, previous_attributes)
+        return charge
+
+    @_locked
+    def invoice_subscription(self, subscription_id, invoice_id,
+                             charge_id=None, **kwargs):
+        """Invoice a subscription's current period, from its plans.
+
+        Subscriptions billed ``charge_automatically`` are charged for the
+        invoice right away, and the invoice is paid; others get an open
+        invoice.
+
+        :param subscription_id: id of the subscription
+        :type subscription_id: string
+        :param invoice_id: id of the new invoice
+        :type invoice_id: string
+        :param charge_id: id of the charge, defaults to the invoice id with
+            a 'ch_' prefix
+        :type charge_id: string
+        :raises: :class:`KeyError` if the subscription isn't stored
+        :returns: the invoice, and its charge if any
+        :rtype: (dict, dict or None)
+        """
+        subscription = self.find_subscription(subscription_id)
+        if subscription is None:
+            raise KeyError(subscription_id)
+
+        invoice = fake_subscription_invoice(
+            as_dict(subscription), invoice_id, **kwargs)
+        if invoice['billing'] != 'charge_automatically':
+            invoice.update({
+                'amount_paid': 0,
+                'amount_remaining': invoice['amount_due'],
+                'attempt_count': 0,
+                'attempted': False,
+                'closed': False,
+                'paid': False,
+                'status': 'open',
+            })
+            return self.add_invoice(
+                invoice['customer'], invoice_id, **invoice), None
+
+        if charge_id is None:
+            charge_id = 'ch_{}'.format(invoice_id.split('_', 1)[-1])
+        invoice['charge'] = charge_id
+        invoice = self.add_invoice(invoice['customer'], invoice_id, **invoice)
+        charge = self.add_charge(
+            invoice['customer'], charge_id,
+            **fake_invoice_charge(invoice, charge_id))
+        self.events.append('invoice.payment_succeeded', invoice)
+        return invoice, charge
+
+    @_locked
+    def add_object(self, object_type, object_id, **kwargs):
+        """Add (or update) an object of a resource generated from the
+        OpenAPI spec, see :mod:`stripe_mock.codegen`.
+
+        The objects are listed, newest first, and retrieved at request
+        time, so they don't need a :meth:`sync`.
+
+        :param object_type: e.g. 'product', see
+            :data:`stripe_mock.generated.FACTORIES`
+        :type object_type: string
+        :raises: :class:`ValueError` for object types stored by their own
+            ``add_*`` method, or unknown to the spec
+        :returns: the stored object
+        :rtype: dict
+        """
+        if object_type in _MODELED_OBJECTS:
+            raise ValueError(
+                'Add {} objects with their add_* method'.format(object_type))
+        if object_type not in FACTORIES:
+            raise ValueError('Unknown object type: {}'.format(object_type))
+        store = self.objects.setdefault(object_type, {})
+        obj = store.get(object_id)
+        if obj is None:
+            previous_attributes = None
+            obj = store[object_id] = FACTORIES[object_type](
+                object_id, **kwargs)
+        else:
+            previous_attributes = _previous_attributes(obj, kwargs)
+            obj.update(kwargs)
+        self._emit(object_type, obj, previous_attributes)
+        return obj
+
+    def find_customer(self, customer_id):
+        """Return the stored customer with an id, or None."""
+        position = self._customer_positions.get(customer_id)
+        return None if position is None else self.customers[position]
+
+    def customer_position(self, customer_id):
+        """Return the position of a stored customer in :attr:`customers`,
+        or None."""
+        return self._customer_positions.get(customer_id)
+
+    def find_subscription(self, subscription_id):
+        """Return the stored subscription with an id, or None."""
+        for subs in self.customer_subscriptions.values():
+            subscription = _find(subs, subscription_id)
+            if subscription is not None:
+                return subscription
+        return None
+
+    def _index_items(self, subscription):
+        items = peek(subscription, 'items')
+        for item in (items or {}).get('data') or ():
+            self._item_subscriptions[item['id']] = subscription
+
+    def find_subscription_item(self, item_id):
+        """Return a stored subscription item, and its subscription.
+
+        :rtype: (dict, dict) or None
+        """
+        subscription = self._item_subscriptions.get(item_id)
+        if subscription is None:
+            return None
+        for item in peek(subscription, 'items')['data']:
+            if item['id'] == item_id:
+                return item, subscription
+        return None  # no longer among the subscription's items
+
+    def _metered_item(self, item_id):
+        found = self.find_subscription_item(item_id)
+        if found is None:
+            raise KeyError(item_id)
+        if peek(found[0], 'plan').get('usage_type') != 'metered':
+            raise UsageRecordError(
+                'Usage records can only be created for metered plans.')
+        return found
+
+    @_locked
+    def add_usage_record(self, item_id, quantity, timestamp=None,
+                         action='increment'):
+        """Record metered usage of a subscription item.
+
+        The record is stored as a row of :attr:`usage`, not as an object.
+
+        :param item_id: id of a subscription item on a plan with
+            ``usage_type='metered'``
+        :type item_id: string
+        :param quantity: usage quantity
+        :type quantity: int
+        :param timestamp: when the usage occurred, defaults to the clock's
+            time
+        :type timestamp: int
+        :param action: 'increment', or 'set' to replace the usage recorded
+            at the same timestamp
+        :type action: string
+        :raises: :class:`KeyError` if the item isn't stored,
+            :class:`~stripe_mock.usage.UsageRecordError` if its plan isn't
+            metered, or for an invalid action or quantity
+        :returns: the usage record, as stripe returns it
+        :rtype: dict
+        """
+        self._metered_item(item_id)
+        if timestamp is None:
+            timestamp = self.clock.frozen_time
+        position = self.usage.append(item_id, quantity, timestamp, action)
+        return fake_usage_record(
+            item_id,
+            'mbur_{}_{}'.format(item_id.split('_', 1)[-1], position),
+            quantity=quantity,
+            timestamp=timestamp,
+        )
+
+    @_locked
+    def add_usage_records(self, item_id, quantities, timestamps,
+                          action='increment'):
+        """Record many usages of a subscription item at once, e.g. to
+        preload a load test; see :meth:`add_usage_record`.
+
+        :param quantities: usage quantities
+        :type quantities: iterable[int]
+        :param timestamps: unix timestamps, one per quantity
+        :type timestamps: iterable[int]
+        :returns: number of records stored
+        :rtype: int
+        """
+        self._metered_item(item_id)
+        return self.usage.extend(item_id, quantities, timestamps, action)
 
-    def sync(self):  # NOQA C901
-        """Clear and recreate all responses based on stripe objects."""
+    def usage_record_summaries(self, item_id):
+        """Summarize the usage of a subscription item per billing period.
+
+        Periods run from the subscription's current one back to its
+        ``start``; usage is aggregated per the plan's ``aggregate_usage``.
+
+        :raises: :class:`KeyError` if the item isn't stored
+        :returns: usage record summaries, the current period's first
+        :rtype: list[dict]
+        """
+        item, subscription = self._metered_item(item_id)
+        plan = peek(item, 'plan')
+        interval = plan.get('interval', 'month')
+        interval_count = plan.get('interval_count') or 1
+
+        start = subscription['start'] or subscription['created']
+        boundaries = [subscription['current_period_end']]
+        period_start = subscription['current_period_start']
+        while True:
+            boundaries.append(period_start)
+            if period_start <= start:
+                break
+            period_start = add_interval(
+                period_start, interval, -interval_count)
+        boundaries.reverse()
+
+        totals = self.usage.aggregate(
+            item_id, boundaries, plan.get('aggregate_usage'))
+        suffix = item_id.split('_', 1)[-1]
+        summaries = [
+            fake_usage_record_summary(
+                item_id,
+                'sis_{}_{}'.format(suffix, period_start),
+                period={'end': period_end, 'start': period_start},
+                total_usage=total,
+            ) for period_start, period_end, total in zip(
+                boundaries, boundaries[1:], totals)
+        ]
+        summaries.reverse()
+        return summaries
+
+    @_locked
+    def add_balance_transaction(self, customer_id, amount,
+                                transaction_id=None, **kwargs):
+        """Adjust a customer's balance, as stripe's
+        ``Customer.create_balance_transaction``.
+
+        The transaction is appended to the customer's ledger in
+        :attr:`balance_transactions`, which opens at the customer's
+        ``balance`` before its first transaction, and the customer's
+        ``balance`` (and legacy ``account_balance``) updated to its
+        ``ending_balance``.
+        If the routes are built, they are brought up to date right away.
+
+        :param customer_id: id of a stored customer
+        :type customer_id: string
+        :param amount: amount added to the balance, negative for a credit
+        :type amount: int
+        :param transaction_id: defaults to an id numbering the customer's
+            transactions
+        :type transaction_id: string
+        :raises: :class:`KeyError` if the customer isn't stored,
+            :class:`~stripe_mock.ledger.LedgerError` if the transaction is
+            ``created`` before the customer's last one
+        :returns: the transaction
+        :rtype: dict
+        """
+        customer = self.customer_index.objects.get(customer_id)
+        if customer is None:
+            raise KeyError(customer_id)
+        if transaction_id is None:
+            transaction_id = 'cbtxn_{}_{}'.format(
+                customer_id.split('_', 1)[-1],
+                self.balance_transactions.count(customer_id))
+        kwargs.setdefault('created', self.clock.frozen_time)
+        kwargs.setdefault('currency', customer['currency'])
+        transaction = self.balance_transactions.append(
+            fake_customer_balance_transaction(
+                customer_id, transaction_id, amount=amount, **kwargs),
+            opening_balance=customer.get('balance') or 0)
+        balance = transaction['ending_balance']
+        self.add_customer(
+            customer_id, balance=balance, account_balance=balance)
+        self._update_routes()
+        return transaction
+
+    @_locked
+    def update_balance_transaction(self, transaction_id, **kwargs):
+        """Update the ``description`` and / or ``metadata`` of a balance
+        transaction; the rest of the ledger is immutable.
+
+        :raises: :class:`KeyError` if the transaction isn't stored,
+            :class:`~stripe_mock.ledger.LedgerError` for other fields
+        :returns: the transaction
+        :rtype: dict
+        """
+        transaction = self.balance_transactions.get(transaction_id)
+        fields = set(kwargs) - {'description', 'metadata'}
+        if fields:
+            raise LedgerError('Balance transactions can only update their '
+                              'description and metadata, not {}'.format(
+                                  ', '.join(sorted(fields))))
+        transaction.update(kwargs)
+        return transaction
+
+    def customer_balance(self, customer_id, at=None):
+        """Return a customer's balance, now or at a point in time, from
+        the prefix sums of its ledger rather than by replaying it.
+
+        :param customer_id: id of the customer
+        :type customer_id: string
+        :param at: unix timestamp; the balance after the transactions
+            created at or before it, defaults to the current balance
+        :type at: int
+        :rtype: int
+        """
+        return self.balance_transactions.balance(customer_id, at)
 
-        responses.reset()
+    def customer_body(self, customer):
+        """Return a customer as retrieved, with its subscriptions and
+        sources embedded.
 
-        if self.plans:
-            for p in self.plans:
-                add_response(
+        :rtype: dict
+        """
+        return {
+            **as_dict(customer), **{
+                'subscriptions': fake_customer_subscription_list(
+                    customer['id'],
+                    self.customer_subscriptions.get(customer['id'], []),
+                ),
+                'sources': fake_customer_source_list(
+                    customer['id'],
+                    self.customer_sources.get(customer['id'], []),
+                ),
+            }
+        }  # yapf: disable
+
+    @_locked
+    def apply_coupon(self, coupon_id, customer_id, subscription_id=None):
+        """Redeem a coupon for a customer, or one of their subscriptions.
+
+        The discount replaces the one the customer (or subscription) had.
+        It holds the stored coupon itself, not a copy, so it's rendered
+        with the coupon's current ``times_redeemed``, as are the other
+        discounts of the coupon, found in :attr:`references`.
+
+        If the routes are built, they are brought up to date right away.
+
+        :param coupon_id: id of a stored coupon
+        :type coupon_id: string
+        :param customer_id: id of a stored customer
+        :type customer_id: string
+        :param subscription_id: id of one of the customer's subscriptions,
+            to discount it rather than the customer
+        :type subscription_id: string
+        :raises: :class:`~stripe_mock.discounts.CouponRedemptionError` if
+            the coupon isn't stored, expired or was redeemed the most
+            times it can be; :class:`KeyError` if the customer or
+            subscription isn't stored
+        :returns: the discount
+        :rtype: dict
+        """
+        target = self._discount_target(customer_id, subscription_id)
+        coupon = _find(self.coupons, coupon_id)
+        if coupon is None:
+            raise CouponRedemptionError(
+                'No such coupon: {}'.format(coupon_id))
+
+        start = self.clock.frozen_time
+        valid = coupon['valid']
+        try:
+            self.redemptions.redeem(coupon, start)
+        except CouponRedemptionError:
+            if coupon['valid'] != valid:  # found no longer valid
+                self._touch_coupon(coupon_id)
+                self._update_routes()
+            raise
+        discount = self._factory(fake_customer_discount)(
+            customer_id,
+            subscription_id,
+            coupon=coupon,
+            start=start,
+            end=discount_end(coupon, start),
+        )
+        discounts = (
+            self.customer_discounts
+            if subscription_id is None else self.subscription_discounts)
+        previous = discounts.get(subscription_id or customer_id)
+        discounts[subscription_id or customer_id] = discount
+        target['discount'] = discount
+        self.references.add(discount)
+
+        self.events.append(
+            'customer.discount.created'
+            if previous is None else 'customer.discount.updated',
+            discount,
+        )
+        self._touch(customer_id)
+        self._touch_coupon(coupon_id)
+        self._update_routes()
+        return discount
+
+    def _touch_coupon(self, coupon_id):
+        """Mark the routes of the coupons out of date, and those of the
+        customers holding a discount of a coupon, which embed it."""
+        self._touch(resource='coupons')
+        for _, discount_key in self.references.referrers(
+                ('coupon', coupon_id)):
+            discount = (self.subscription_discounts.get(discount_key) or
+                        self.customer_discounts.get(discount_key))
+            if discount is not None:
+                self._touch(discount['customer'])
+
+    @_locked
+    def remove_discount(self, customer_id, subscription_id=None):
+        """Remove the discount of a customer, or of a subscription.
+
+        :returns: the removed discount, None if there was none
+        :rtype: dict or None
+        :raises: :class:`KeyError` if the customer or subscription isn't
+            stored
+        """
+        target = self._discount_target(customer_id, subscription_id)
+        discounts = (
+            self.customer_discounts
+            if subscription_id is None else self.subscription_discounts)
+        discount = discounts.pop(subscription_id or customer_id, None)
+        if discount is None:
+            return None
+
+        target['discount'] = None
+        self.references.discard(key(discount))
+        self.events.append('customer.discount.deleted', discount)
+        self._touch(customer_id)
+        self._update_routes()
+        return discount
+
+    def _discount_target(self, customer_id, subscription_id):
+        """Return the customer, or subscription, a discount applies to."""
+        if subscription_id is None:
+            target = self.find_customer(customer_id)
+        else:
+            target = _find(
+                self.customer_subscriptions.get(customer_id, []),
+                subscription_id)
+        if target is None:
+            raise KeyError(subscription_id or customer_id)
+        return target
+
+    def delete_customer(self, customer_id):
+        """Delete a customer, along with its subscriptions (and their
+        discounts), sources and discount.
+
+        What to delete is looked up in :attr:`references`, so the cost is
+        proportional to what references the customer, not to the size of
+        the stores. Each deletion is recorded as a '*.deleted' event.
+
+        If the routes are built, they are brought up to date right away.
+
+        :param customer_id: id of the customer
+        :type customer_id: string
+        :raises: :class:`KeyError` if neither the customer nor anything
+            referencing it is stored
+        :returns: the deleted customer, None if only objects referencing
+            it were stored
+        :rtype: dict or None
+        """
+        with self._writing():
+            customer = self.customer_index.objects.get(customer_id)
+            referrers = self.references.referrers(('customer', customer_id))
+            if customer is None and not referrers:
+                raise KeyError(customer_id)
+
+            for object_type, object_id in referrers:
+                if object_type == 'subscription':
+                    self._remove_subscription(customer_id, object_id)
+                elif object_type == 'discount':
+                    self._remove_discount(object_id)
+                else:
+                    self._remove_source(customer_id, object_type, object_id)
+
+            self.balance_transactions.discard(customer_id)
+            if customer is not None:
+                position = self._customer_positions.pop(customer_id)
+                del self.customers[position]
+                for i in range(position, len(self.customers)):
+                    self._customer_positions[self.customers[i]['id']] = i
+                self.customer_index.remove(customer_id)
+                # rendered bodies line up with the customers
+                if (self._bodies is not None and
+                        position < len(self._bodies['customers'])):
+                    del self._bodies['customers'][position]
+                self.events.append('customer.deleted', customer)
+            if self.router is not None:
+                customer_url = '{}/{}'.format(CUSTOMER_URL_BASE, customer_id)
+                for url in (customer_url, '{}/subscriptions'.format(
+                        customer_url), '{}/sources'.format(customer_url)):
+                    self._draft_router().remove_response('GET', url)
+            self._touch(customer_id)
+            self._update_routes()
+        return customer
+
+    def delete_subscription(self, subscription_id):
+        """Cancel a subscription and delete it, along with its discount.
+
+        If the routes are built, they are brought up to date right away.
+
+        :param subscription_id: id of the subscription
+        :type subscription_id: string
+        :raises: :class:`KeyError` if the subscription isn't stored
+        :returns: the subscription, canceled
+        :rtype: dict
+        """
+        with self._writing():
+            subscription = self.subscription_index.objects.get(
+                subscription_id)
+            if subscription is None:
+                raise KeyError(subscription_id)
+            customer_id = subscription['customer']
+            self._remove_subscription(customer_id, subscription_id)
+            self._touch(customer_id)
+            self._update_routes()
+        return subscription
+
+    def delete_source(self, customer_id, source_id):
+        """Detach a source, card or bank account from a customer.
+
+        If the routes are built, they are brought up to date right away.
+
+        :raises: :class:`KeyError` if the customer has no such source
+        :returns: the source
+        :rtype: dict
+        """
+        with self._writing():
+            for source in self.sources_for(customer_id):
+                if source['id'] == source_id:
+                    break
+            else:
+                raise KeyError(source_id)
+            self._remove_source(customer_id, source['object'], source_id)
+            self._touch(customer_id)
+            self._update_routes()
+        return source
+
+    @_locked
+    def delete_object(self, object_type, object_id):
+        """Delete an object added with :meth:`add_object`.
+
+        :raises: :class:`KeyError` if there's no such object
+        :returns: the object
+        :rtype: dict
+        """
+        obj = self.objects.get(object_type, {}).pop(object_id)
+        self.events.append('{}.deleted'.format(object_type), obj)
+        return obj
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Make several changes at once, e.g. from a fixture file.
+
+        The routes are published when the block ends, so requests see
+        all of its changes or none. If the routes are built, they are
+        brought up to date then.
+        """
+        with self._writing():
+            yield self
+            self._update_routes()
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """Hold the sync lock while changing the stores.
+
+        When the outermost change ends, failed or not, the routes are
+        brought up to date if it asked for it (see :meth:`_update_routes`),
+        or with ``auto_sync``. Requests only ever read the routes
+        published, so they see a change whole or not at all.
+        """
+        with self._sync_lock:
+            self._writes += 1
+            try:
+                yield
+            finally:
+                self._writes -= 1
+                if not self._writes:
+                    self._publish_writes()
+
+    def _publish_writes(self):
+        """Publish what the changes that ended left out of date."""
+        publish, self._publish = self._publish, False
+        if self.router is None:
+            return
+        if publish or self.auto_sync and (
+                self._dirty_resources or self._dirty_customers or
+                self._router_draft is not None):
+            with span(self.profiler, 'update'):
+                self._update_router()
+
+    def _remove_subscription(self, customer_id, subscription_id):
+        """Cancel a subscription and drop it from the stores, indexes and
+        routes, along with its discount."""
+        subscriptions = self.customer_subscriptions.get(customer_id, [])
+        for position, subscription in enumerate(subscriptions):
+            if subscription['id'] == subscription_id:
+                break
+        else:
+            return
+        del subscriptions[position]
+        if not subscriptions:
+            del self.customer_subscriptions[customer_id]
+
+        for _, discount_key in self.references.referrers(
+                ('subscription', subscription_id)):
+            self._remove_discount(discount_key)
+        self.references.discard(('subscription', subscription_id))
+        self.subscription_index.remove(subscription_id)
+        self.clock.unschedule(subscription_id)
+        for item in (peek(subscription, 'items') or {}).get('data') or ():
+            if self._item_subscriptions.get(item['id']) is subscription:
+                del self._item_subscriptions[item['id']]
+
+        now = self.clock.frozen_time
+        subscription.update(status='canceled', canceled_at=now, ended_at=now)
+        self.events.append('customer.subscription.deleted', subscription)
+        if self.router is not None:
+            router = self._draft_router()
+            router.remove_response(
+                'GET',
+                SUBSCRIPTION_OBJECT_URL_TPL.format(
+                    subscription_id=subscription_id))
+            if not subscriptions:
+                router.remove_response(
                     'GET',
-                    '{}/{}'.format(PLAN_URL_BASE, p['id']),
-                    p,
+                    CUSTOMER_SUBSCRIPTION_LIST_URL_TPL.format(
+                        customer_url_base=CUSTOMER_URL_BASE,
+                        customer_id=customer_id,
+                    ))
+
+    def _remove_discount(self, discount_key):
+        """Drop the discount of a subscription, or customer, by id."""
+        discount = self.subscription_discounts.pop(discount_key, None)
+        if discount is None:
+            discount = self.customer_discounts.pop(discount_key, None)
+        if discount is None:
+            return
+        self.references.discard(('discount', discount_key))
+        self.events.append('customer.discount.deleted', discount)
+
+    def _remove_source(self, customer_id, object_type, source_id):
+        """Drop a source, card or bank account from its store and
+        routes."""
+        store = {
+            'bank_account': self.customer_source_bank_accounts,
+            'card': self.customer_source_cards,
+            'source': self.customer_sources,
+        }[object_type]
+        sources = store.get(customer_id, [])
+        for position, source in enumerate(sources):
+            if source['id'] == source_id:
+                break
+        else:
+            return
+        del sources[position]
+        if not sources:
+            del store[customer_id]
+
+        self.references.discard((object_type, source_id))
+        self.events.append('customer.source.deleted', source)
+        if self.router is not None:
+            router = self._draft_router()
+            router.remove_response(
+                'GET',
+                CUSTOMER_SOURCE_OBJECT_URL_TPL.format(
+                    customer_url_base=CUSTOMER_URL_BASE,
+                    customer_id=customer_id,
+                    source_id=source_id,
+                ))
+            router.remove_response(
+                'GET', '{}/{}'.format(SOURCE_URL_BASE, source_id))
+
+    def orphans(self):
+        """Return the references to objects that aren't stored, e.g. from
+        the subscriptions of a customer that was never added.
+
+        Each object referenced is looked up once, in the search indexes
+        for customers and subscriptions, and in sets of the plan and coupon
+        ids.
+
+        :returns: (referrer, missing object) keys, see
+            :mod:`stripe_mock.references`
+        :rtype: list[((string, string), (string, string))]
+        """
+        stored = {
+            'coupon': {coupon['id'] for coupon in self.coupons},
+            'customer': self.customer_index.objects,
+            'plan': {plan['id'] for plan in self.plans},
+            'subscription': self.subscription_index.objects,
+        }
+        return self.references.dangling(
+            lambda target: target[1] in stored[target[0]])
+
+    def validate(self):
+        """Check that every stored reference points at a stored object.
+
+        :raises: :class:`~stripe_mock.references.ReferenceIntegrityError`
+            listing the :meth:`orphans`
+        """
+        orphans = self.orphans()
+        if orphans:
+            raise ReferenceIntegrityError(orphans)
+
+    def _update_routes(self):
+        """Bring the routes up to date right away, if they are built, or
+        when the change under way ends, see :meth:`_writing`.
+
+        Rendering is serialized, so concurrent updates leave the routes
+        with the latest state rather than whichever rendered last. The
+        changes, and the removals made since the last update, are
+        published as one new version of the router.
+        """
+        if self.router is None:
+            return
+        with self._sync_lock:
+            if self._writes:
+                self._publish = True
+            else:
+                self._update_router()
+
+    @_locked
+    def bulk_load(self, objects):
+        """Store many new objects at once, e.g. from a fixture generator.
+
+        Objects are dispatched to their store by their ``object`` field and
+        appended without the duplicate-id scan the ``add_*`` methods do, so
+        their ids must not be stored yet. Search indexes and the clock are
+        updated; no events are recorded. Subscriptions, and invoice lines,
+        embed the plans stored, or loaded, before them by reference, as
+        with :meth:`add_subscription`. Invoices and charges are indexed
+        once all objects are read. Objects of the other resources of the
+        OpenAPI spec go to :attr:`objects`.
+
+        :param objects: stripe objects, consumed one at a time
+        :type objects: iterable[dict]
+        :raises: :class:`ValueError` for unsupported object types
+        :returns: number of objects loaded
+        :rtype: int
+        """
+        root_stores = {
+            'coupon': self.coupons,
+            'customer': self.customers,
+            'plan': self.plans,
+        }
+        customer_stores = {
+            'bank_account': self.customer_source_bank_accounts,
+            'card': self.customer_source_cards,
+            'source': self.customer_sources,
+            'subscription': self.customer_subscriptions,
+        }
+        # indexed once at the end, instead of one insertion at a time
+        time_indexed = {'charge': [], 'invoice': []}
+
+        plans = {plan['id']: plan for plan in self.plans}
+        self._touch(resource='all')
+
+        count = 0
+        for obj in objects:
+            object_type = obj['object']
+            if object_type == 'subscription':
+                plan = plans.get(_plan_id(peek(obj, 'plan')))
+                if plan is not None:
+                    obj = dict(as_dict(obj), plan=plan)
+                    if obj.get('items'):
+                        obj['items'] = _embed_plan(
+                            obj['items'], plan, plan['id'])
+            elif object_type == 'invoice' and peek(obj, 'lines'):
+                obj = dict(as_dict(obj), lines=_link_plans(
+                    peek(obj, 'lines'), plans))
+            if self.compact:
+                obj = compact(obj)
+            if object_type == 'plan':
+                plans[obj['id']] = obj
+            if object_type == 'customer':
+                self._customer_positions[obj['id']] = len(self.customers)
+            if object_type in root_stores:
+                root_stores[object_type].append(obj)
+            elif object_type in time_indexed:
+                time_indexed[object_type].append(obj)
+            elif object_type in customer_stores:
+                store = customer_stores[object_type]
+                customer_id = obj['customer']
+                if customer_id not in store:
+                    store[customer_id] = []
+                store[customer_id].append(obj)
+            elif object_type in FACTORIES:
+                self.objects.setdefault(object_type, {})[obj['id']] = obj
+            else:
+                raise ValueError(
+                    'Cannot bulk load {} objects'.format(object_type))
+
+            if object_type == 'customer':
+                self.customer_index.add(obj)
+            elif object_type == 'subscription':
+                self.subscription_index.add(obj)
+                self._index_items(obj)
+                self.clock.schedule(obj)
+            if object_type in customer_stores:
+                self.references.add(obj)
+            count += 1
+
+        self.invoices.extend(time_indexed['invoice'])
+        self.charges.extend(time_indexed['charge'])
+        return count
+
+    def sync(self, workers=None):
+        """Clear and recreate all responses based on stripe objects.
+
+        With ``auto_sync``, only the routes of what changed since they
+        were built are brought up to date, and later changes publish their
+        routes as they are made, without calling :meth:`sync` again.
+
+        :param workers: render the responses across this many processes,
+            see :mod:`stripe_mock.parallel`
+        :type workers: int
+        """
+
+        with span(self.profiler, 'sync'):
+            if not self.auto_sync or self.router is None:
+                self.refresh(workers=workers)
+            else:
+                self._update_routes()
+            with span(self.profiler, 'install'):
+                responses.reset()
+                # through current_router(), so the mock answers from the
+                # versions published after this one too
+                install(self, ('GET', 'POST', 'DELETE'))
+
+    def refresh(self, workers=None):
+        """Rebuild the routes :meth:`dispatch` answers from, leaving the
+        :mod:`responses` mock alone.
+
+        :param workers: render the responses across this many processes,
+            see :mod:`stripe_mock.parallel`
+        :type workers: int
+        """
+        with self._sync_lock, span(self.profiler, 'refresh'):
+            resources, self._dirty_resources = self._dirty_resources, set()
+            customer_ids, self._dirty_customers = (
+                self._dirty_customers, set())
+            try:
+                with span(self.profiler, 'render'):
+                    self._bodies = render_bodies(self, workers=workers)
+                with span(self.profiler, 'route'):
+                    self._router_draft = None
+                    self.router = self._build_router(self._bodies).freeze()
+            except BaseException:
+                self._restore_dirty(resources, customer_ids)
+                raise
+
+    def current_router(self):
+        """Return the router to answer from, building it if there's none.
+
+        This is the last version published: requests neither wait for
+        changes under way nor render routes. With ``auto_sync``, changes
+        publish a new version as they end, see :meth:`_writing`.
+
+        :rtype: :class:`~stripe_mock.router.Router`
+        """
+        router = self.router
+        if router is None:
+            self.refresh()
+            router = self.router
+        return router
+
+    def dispatch(self, request):
+        """Answer a request from the stores, without any HTTP library.
+
+        Uses the router of the last :meth:`sync`, building one if there
+        wasn't any.
+
+        :param request: the request, see :meth:`Router.dispatch`
+        :type request: :class:`~stripe_mock.router.MockRequest`
+        :returns: (status, headers, json body), or None if no route matches
+        :rtype: (int, dict, string) or None
+        """
+        with span(self.profiler, 'dispatch'):
+            router = self.current_router()
+            with span(self.profiler, 'resolve'):
+                handler = router.resolve(request.method, request.url)
+            if handler is None:
+                return None
+            with span(self.profiler, 'respond'):
+                return handler(request)
+
+    def matches(self, request):
+        """Return whether :meth:`dispatch` has an answer for a request."""
+        with span(self.profiler, 'match'):
+            return self.current_router().matches(request)
+
+    def _touch(self, customer_id=None, resource=None):
+        """Mark the routes of a customer, or a resource, out of date.
+
+        :param resource: 'plans', 'coupons', or 'all' for a full rebuild
+        :type resource: string
+        """
+        if customer_id is not None:
+            self._dirty_customers.add(customer_id)
+        if resource is not None:
+            self._dirty_resources.add(resource)
+
+    def _update_router(self):
+        """Re-render the routes marked out of date by :meth:`_touch`.
+
+        Customers are re-rendered one by one, along with their
+        subscriptions and sources; the lists of all customers and
+        subscriptions are reassembled from the encoded objects, without
+        encoding them again.
+        """
+        resources, self._dirty_resources = self._dirty_resources, set()
+        customer_ids, self._dirty_customers = self._dirty_customers, set()
+        try:
+            if 'all' in resources or self._bodies is None:
+                self.refresh()
+                return
+
+            router = self._draft_router()
+            self._route_changes(router, resources, customer_ids)
+        except BaseException:
+            # still out of date: retried on the next update
+            self._restore_dirty(resources, customer_ids)
+            raise
+        # published whole, requests under way keep the previous version
+        self._router_draft = None
+        self.router = router.freeze()
+
+    def _restore_dirty(self, resources, customer_ids):
+        """Mark out of date again what a failed update took on."""
+        self._dirty_resources.update(resources)
+        self._dirty_customers.update(customer_ids)
+
+    def _draft_router(self):
+        """Return the next version of the router, the one changes go to
+        until :meth:`_update_router` publishes it.
+
+        Called with the sync lock held.
+
+        :rtype: :class:`~stripe_mock.router.Router`
+        """
+        if self._router_draft is None:
+            self._router_draft = self.router.copy()
+        return self._router_draft
+
+    def _route_changes(self, router, resources, customer_ids):
+        """Route the resources and customers changed, on a draft."""
+        bodies = self._bodies
+        if 'plans' in resources:
+            bodies['plans'] = [encode_json(plan) for plan in self.plans]
+            self._route_plans(router, bodies)
+        if 'coupons' in resources:
+            bodies['coupons'] = [
+                encode_json(coupon) for coupon in self.coupons
+            ]
+            self._route_coupons(router, bodies)
+        if not customer_ids:
+            return
+
+        had_subscriptions = any(
+            customer_id in bodies['subscriptions']
+            for customer_id in customer_ids)
+        update_bodies(self, bodies, customer_ids)
+        positions = self._customer_positions
+        for customer_id in customer_ids:
+            if customer_id in bodies['subscriptions']:
+                self._route_subscriptions(
+                    router,
+                    customer_id,
+                    self.customer_subscriptions[customer_id],
+                    bodies['subscriptions'][customer_id],
+                )
+            if customer_id in bodies['sources']:
+                self._route_sources(
+                    router,
+                    customer_id,
+                    self.sources_for(customer_id),
+                    bodies['sources'][customer_id],
+                )
+            else:
+                # answered like for customers that never had sources
+                self._unroute_sources(router, customer_id)
+            if customer_id in positions:
+                router.add_response(
+                    'GET',
+                    '{}/{}'.format(CUSTOMER_URL_BASE, customer_id),
+                    bodies['customers'][positions[customer_id]][0],
                     200,
                 )
-            add_response(
+        if had_subscriptions or any(
+                customer_id in bodies['subscriptions']
+                for customer_id in customer_ids):
+            self._route_subscription_list(router, bodies)
+        self._route_customer_list(router, bodies)
+
+    def sources_for(self, customer_id):
+        """Return a customer's sources, cards and bank accounts.
+
+        :rtype: list[dict]
+        """
+        return [
+            source for store in (
+                self.customer_sources,
+                self.customer_source_cards,
+                self.customer_source_bank_accounts,
+            ) for source in store.get(customer_id, ())
+        ]
+
+    def build_router(self, workers=None):
+        """Return a :class:`Router` serving the current stripe objects.
+
+        :param workers: render the responses across this many processes,
+            see :mod:`stripe_mock.parallel`
+        :type workers: int
+        :rtype: :class:`~stripe_mock.router.Router`
+        """
+        return self._build_router(render_bodies(self, workers=workers))
+
+    def _build_router(self, bodies):
+        """Return a :class:`Router` serving bodies from
+        :func:`~stripe_mock.parallel.render_bodies`."""
+        router = Router()
+
+        # registered first, so the id lookups below don't swallow /search
+        router.add_callback(
+            'GET',
+            CUSTOMER_SEARCH_URL_RE,
+            search_callback_factory(self.customer_index, 'customer'),
+        )
+        router.add_callback(
+            'GET',
+            SUBSCRIPTION_SEARCH_URL_RE,
+            search_callback_factory(self.subscription_index, 'subscription'),
+        )
+
+        # the event log is append-only and read at request time
+        router.add_callback(
+            'GET',
+            EVENT_LIST_URL_RE,
+            event_list_callback_factory(self.events),
+        )
+        router.add_callback(
+            'GET',
+            EVENT_URL_RE,
+            event_callback_factory(self.events),
+        )
+
+        # as are invoices and charges, paged through their time index
+        for object_type, time_index, list_url_re, url_re in (
+                ('invoice', self.invoices, INVOICE_LIST_URL_RE,
+                 INVOICE_URL_RE),
+                ('charge', self.charges, CHARGE_LIST_URL_RE, CHARGE_URL_RE),
+        ):
+            router.add_callback(
                 'GET',
-                PLAN_URL_BASE,
-                fake_plan_list(self.plans),
-                200,
+                list_url_re,
+                time_index_list_callback_factory(time_index, object_type),
+            )
+            router.add_callback(
+                'GET',
+                url_re,
+                time_index_callback_factory(time_index, object_type, url_re),
             )
 
-        add_callback(
+        self._route_plans(router, bodies)
+        router.add_callback(
             'GET',
             PLAN_URL_RE,
             plan_not_found,
         )
 
-        if self.coupons:
-            for p in self.coupons:
-                add_response(
-                    'GET',
-                    '{}/{}'.format(COUPON_URL_BASE, p['id']),
-                    p,
-                    200,
-                )
-            add_response(
-                'GET',
-                COUPON_URL_BASE,
-                fake_coupon_list(self.coupons),
-                200,
-            )
-
-        add_callback(
+        self._route_coupons(router, bodies)
+        router.add_callback(
             'GET',
             COUPON_URL_RE,
             coupon_not_found,
         )
 
-        if self.customer_subscriptions:
+        with span(self.profiler, 'subscriptions'):
             for customer_id, subs in self.customer_subscriptions.items():
-                for sub in subs:
-                    add_response(
-                        'GET',
-                        SUBSCRIPTION_OBJECT_URL_TPL.format(
-                            subscription_id=sub['id']),
-                        sub,
-                        200,
-                    )
-                add_response(
-                    'GET',
-                    CUSTOMER_SUBSCRIPTION_LIST_URL_TPL.format(
-                        customer_url_base=CUSTOMER_URL_BASE,
-                        customer_id=customer_id,
-                    ),
-                    fake_customer_subscription_list(customer_id, subs),
-                    200,
-                )
-
-            add_response(
-                'GET',
-                SUBSCRIPTION_URL_BASE,
-                fake_subscription_list(self.subscriptions),
-                200,
-            )
-
-        add_callback(
+                self._route_subscriptions(
+                    router, customer_id, subs,
+                    bodies['subscriptions'][customer_id])
+            self._route_subscription_list(router, bodies)
+        router.add_callback(
             'GET',
             SUBSCRIPTION_URL_RE,
             subscription_not_found,
         )
 
-        if self.sources:
-            # sources are different, they can be gotten via Customer,
-            # but in some instances, globally.
+        # sources are different, they can be gotten via Customer,
+        # but in some instances, globally.
+        with span(self.profiler, 'sources'):
             for customer_id, sources in self.sources.items():
-                for source in sources:
-                    add_response(
-                        'GET',
-                        CUSTOMER_SOURCE_OBJECT_URL_TPL.format(
-                            customer_url_base=CUSTOMER_URL_BASE,
-                            customer_id=customer_id,
-                            source_id=source['id'],
-                        ),
-                        source,
-                        200,
-                    )
-                    add_response(
-                        'GET',
-                        '{}/{}'.format(SOURCE_URL_BASE, source['id']),
-                        source,
-                        200,
-                    )
-
-                # this includes *all sources*
-                add_response(
+                self._route_sources(
+                    router, customer_id, sources,
+                    bodies['sources'][customer_id])
+            self._route_source_callbacks(router)
+
+        with span(self.profiler, 'customers'):
+            for c, (body, _) in zip(self.customers, bodies['customers']):
+                router.add_response(
                     'GET',
-                    '{}/{}/sources'.format(CUSTOMER_URL_BASE, customer_id),
-                    fake_customer_source_list(customer_id, sources),
+                    '{}/{}'.format(CUSTOMER_URL_BASE, c['id']),
+                    body,
                     200,
                 )
+            self._route_customer_list(router, bodies)
 
-        add_callback(
+        # balance transactions, before the customer 404's matching their
+        # urls too; the ledger is read at request time
+        router.add_callback(
             'GET',
-            SOURCE_URL_RE,
-            source_callback_factory(
-                self.sources_list, blocked_objects=['card']),
+            CUSTOMER_BALANCE_TRANSACTION_LIST_URL_RE,
+            balance_transaction_list_callback_factory(self),
+        )
+        router.add_callback(
+            'POST',
+            CUSTOMER_BALANCE_TRANSACTION_LIST_URL_RE,
+            balance_transaction_create_callback_factory(self),
+        )
+        router.add_callback(
+            'GET',
+            CUSTOMER_BALANCE_TRANSACTION_URL_RE,
+            balance_transaction_callback_factory(self.balance_transactions),
+        )
+        router.add_callback(
+            'POST',
+            CUSTOMER_BALANCE_TRANSACTION_URL_RE,
+            balance_transaction_update_callback_factory(self),
         )
 
-        add_callback(
+        # fill in 404's for customers
+        router.add_callback(
             'GET',
-            CUSTOMER_SOURCE_OBJECT_URL_RE,
-            source_callback_factory(self.sources_list),
+            CUSTOMER_URL_RE,
+            customer_not_found,
         )
 
-        add_callback(
+        # updates applying coupons, answered at request time
+        for object_name, update_url_re, discount_url_re in (
+                ('customer', CUSTOMER_UPDATE_URL_RE,
+                 CUSTOMER_DISCOUNT_URL_RE),
+                ('subscription', SUBSCRIPTION_UPDATE_URL_RE,
+                 SUBSCRIPTION_DISCOUNT_URL_RE),
+        ):
+            router.add_callback(
+                'POST',
+                update_url_re,
+                coupon_update_callback_factory(self, object_name),
+            )
+            router.add_callback(
+                'DELETE',
+                discount_url_re,
+                discount_delete_callback_factory(self, object_name),
+            )
+            router.add_callback(
+                'DELETE',
+                update_url_re,
+                delete_callback_factory(self, object_name),
+            )
+
+        # metered usage, stored and summarized at request time
+        router.add_callback(
+            'POST',
+            USAGE_RECORD_URL_RE,
+            usage_record_callback_factory(self),
+        )
+        router.add_callback(
             'GET',
-            CUSTOMER_SOURCE_LIST_URL_RE,
-            source_list_callback_factory(self.sources_list),
+            USAGE_RECORD_SUMMARY_URL_RE,
+            usage_record_summary_callback_factory(self),
         )
 
-        if self.customers:
-            for c in self.customers:
-                add_response(
-                    'GET',
-                    '{}/{}'.format(CUSTOMER_URL_BASE, c['id']),
-                    {
-                        **c, **{
-                            'subscriptions': fake_customer_subscription_list(
-                                c['id'],
-                                self.customer_subscriptions.get(c['id'], []),
-                            ),
-                            'sources': fake_customer_source_list(
-                                c['id'],
-                                self.customer_sources.get(c['id'], []),
-                            ),
-                        }
-                    },
-                    200,
-                )  # yapf: disable
-            add_response(
+        # the other resources of the spec, last so the routes above win
+        if _COLLECTION_URL_RE is not None:
+            router.add_callback(
                 'GET',
-                CUSTOMER_URL_BASE,
-                fake_customer_list(self.customers),
+                _COLLECTION_URL_RE,
+                object_store_callback_factory(
+                    self.objects, _COLLECTION_URL_RE, _COLLECTIONS),
+            )
+
+        return router
+
+    def _route_plans(self, router, bodies):
+        if not self.plans:
+            return
+        for p, body in zip(self.plans, bodies['plans']):
+            router.add_response(
+                'GET',
+                '{}/{}'.format(PLAN_URL_BASE, p['id']),
+                body,
                 200,
             )
+        router.add_response(
+            'GET',
+            PLAN_URL_BASE,
+            JSONList(fake_plan_list(self.plans), bodies['plans']),
+            200,
+        )
 
-        # fill in 404's for customers
-        add_callback(
+    def _route_coupons(self, router, bodies):
+        if not self.coupons:
+            return
+        for p, body in zip(self.coupons, bodies['coupons']):
+            router.add_response(
+                'GET',
+                '{}/{}'.format(COUPON_URL_BASE, p['id']),
+                body,
+                200,
+            )
+        router.add_response(
             'GET',
-            CUSTOMER_URL_RE,
-            customer_not_found,
+            COUPON_URL_BASE,
+            JSONList(fake_coupon_list(self.coupons), bodies['coupons']),
+            200,
+        )
+
+    def _route_subscriptions(self, router, customer_id, subs, sub_list):
+        """Route a customer's subscriptions, and their list."""
+        for sub, body in zip(subs, sub_list.fragments):
+            router.add_response(
+                'GET',
+                SUBSCRIPTION_OBJECT_URL_TPL.format(subscription_id=sub['id']),
+                body,
+                200,
+            )
+        router.add_response(
+            'GET',
+            CUSTOMER_SUBSCRIPTION_LIST_URL_TPL.format(
+                customer_url_base=CUSTOMER_URL_BASE,
+                customer_id=customer_id,
+            ),
+            sub_list,
+            200,
+        )
+
+    def _route_subscription_list(self, router, bodies):
+        if not self.customer_subscriptions:
+            router.remove_response('GET', SUBSCRIPTION_URL_BASE)
+            return
+        all_bodies = []
+        for customer_id in self.customer_subscriptions:
+            all_bodies.extend(bodies['subscriptions'][customer_id].fragments)
+        router.add_response(
+            'GET',
+            SUBSCRIPTION_URL_BASE,
+            JSONList(fake_subscription_list(self.subscriptions), all_bodies),
+            200,
+        )
+
+    def _route_sources(self, router, customer_id, sources, source_list):
+        """Route a customer's sources, and their list."""
+        for source, body in zip(sources, source_list.fragments):
+            router.add_response(
+                'GET',
+                CUSTOMER_SOURCE_OBJECT_URL_TPL.format(
+                    customer_url_base=CUSTOMER_URL_BASE,
+                    customer_id=customer_id,
+                    source_id=source['id'],
+                ),
+                body,
+                200,
+            )
+            router.add_response(
+                'GET',
+                '{}/{}'.format(SOURCE_URL_BASE, source['id']),
+                body,
+                200,
+            )
+
+        # this includes *all sources*
+        list_url = '{}/{}/sources'.format(CUSTOMER_URL_BASE, customer_id)
+        router.add_response('GET', list_url, source_list, 200)
+        # and ?object=card etc. the sources of one type
+        for object_type in _SOURCE_OBJECTS:
+            typed = [
+                (source, body)
+                for source, body in zip(sources, source_list.fragments)
+                if source['object'] == object_type
+            ]
+            router.add_response(
+                'GET',
+                '{}?object={}'.format(list_url, object_type),
+                JSONList(
+                    fake_customer_source_list(
+                        customer_id, [source for source, _ in typed]),
+                    [body for _, body in typed]),
+                200,
+            )
+
+    def _unroute_sources(self, router, customer_id):
+        """Unroute a customer's source lists."""
+        list_url = '{}/{}/sources'.format(CUSTOMER_URL_BASE, customer_id)
+        router.remove_response('GET', list_url)
+        for object_type in _SOURCE_OBJECTS:
+            router.remove_response(
+                'GET', '{}?object={}'.format(list_url, object_type))
+
+    def _route_source_callbacks(self, router):
+        """Route the source lookups nothing fixed answers: sources that
+        aren't stored, and lists of customers without sources.
+
+        Stored sources, and their lists, are routed per customer by
+        :meth:`_route_sources`, so these don't change with the sources.
+        """
+        router.add_callback(
+            'GET',
+            SOURCE_URL_RE,
+            source_callback_factory([]),
+        )
+        router.add_callback(
+            'GET',
+            CUSTOMER_SOURCE_OBJECT_URL_RE,
+            source_callback_factory([], url_re=CUSTOMER_SOURCE_OBJECT_URL_RE),
+        )
+        router.add_callback(
+            'GET',
+            CUSTOMER_SOURCE_LIST_URL_RE,
+            source_list_callback_factory([]),
+        )
+
+    def _route_customer_list(self, router, bodies):
+        if not self.customers:
+            router.remove_response('GET', CUSTOMER_URL_BASE)
+            return
+        router.add_response(
+            'GET',
+            CUSTOMER_URL_BASE,
+            JSONList(
+                fake_customer_list(self.customers),
+                [item for _, item in bodies['customers']]),
+            200,
         )
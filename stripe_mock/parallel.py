@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Render the response bodies of :meth:`StripeMockAPI.build_router`,
+optionally across a process pool.
+
+Rendering is split by resource type, and by shards of customers. Each
+shard is encoded to bytes independently, so with ``workers`` processes
+a cold :meth:`StripeMockAPI.sync` of a large fixture scales with the
+cores available. The pool is forked: workers see the stores without
+copying them, and only the encoded bodies travel back. Where fork isn't
+available, bodies are rendered in-process.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .encoding import JSONList, encode_json, encode_subscription
+from .fake import fake_customer_source_list, fake_customer_subscription_list
+from .profiling import span
+
+#: shards per worker, so uneven shards even out
+SHARDS_PER_WORKER = 4
+
+# (api, sources by customer) the forked workers render from
+_state = None
+
+
+def _render_objects(objects):
+    return [encode_json(obj) for obj in objects]
+
+
+def _render_plans(api, sources, start, stop):
+    return _render_objects(api.plans[start:stop])
+
+
+def _render_coupons(api, sources, start, stop):
+    return _render_objects(api.coupons[start:stop])
+
+
+def _render_customers(api, sources, start, stop):
+    """(retrieve body, list item) of each customer."""
+    rendered = []
+    for c in api.customers[start:stop]:
+        body = api.customer_body(c)
+        rendered.append((encode_json(body), encode_json(c)))
+    return rendered
+
+
+def _subscription_list(api, customer_id, subs):
+    return JSONList(
+        fake_customer_subscription_list(customer_id, subs),
+        [encode_subscription(sub, api.plan_fragments) for sub in subs])
+
+
+def _source_list(customer_id, sources):
+    return JSONList(
+        fake_customer_source_list(customer_id, sources),
+        _render_objects(sources))
+
+
+def _render_subscriptions(api, sources, start, stop):
+    """Subscription lists of a slice of the customers having any."""
+    customer_ids = list(api.customer_subscriptions)[start:stop]
+    return {
+        customer_id: _subscription_list(
+            api, customer_id, api.customer_subscriptions[customer_id])
+        for customer_id in customer_ids
+    }
+
+
+def _render_sources(api, sources, start, stop):
+    """Source lists of a slice of the customers having any."""
+    customer_ids = list(sources)[start:stop]
+    return {
+        customer_id: _source_list(customer_id, sources[customer_id])
+        for customer_id in customer_ids
+    }
+
+
+def _run(task):
+    renderer, start, stop = task
+    return renderer(*_state, start, stop)
+
+
+def _tasks(api, sources, shards):
+    """Yield (resource, renderer, start, stop) covering all objects."""
+    for resource, renderer, size in (
+            ('plans', _render_plans, len(api.plans)),
+            ('coupons', _render_coupons, len(api.coupons)),
+            ('customers', _render_customers, len(api.customers)),
+            ('subscriptions', _render_subscriptions,
+             len(api.customer_subscriptions)),
+            ('sources', _render_sources, len(sources)),
+    ):
+        step = max(1, -(-size // shards))
+        for start in range(0, size, step):
+            yield resource, renderer, start, min(start + step, size)
+
+
+def render_bodies(api, workers=None):
+    """Encode the bodies of every stored object.
+
+    :param api: the mock to render
+    :type api: :class:`StripeMockAPI`
+    :param workers: processes to render with; None or 1 renders in-process
+    :type workers: int
+    :returns: encoded bodies by resource: lists aligned with ``plans``,
+        ``coupons`` and ``customers`` (the latter of (retrieve body, list
+        item) pairs), and the list body of each customer's
+        ``subscriptions`` and ``sources`` by customer id; their
+        ``fragments`` are the bodies of the objects, in the order of
+        ``customer_subscriptions`` and :attr:`StripeMockAPI.sources`
+    :rtype: dict
+    """
+    global _state
+
+    profiler = api.profiler
+    with span(profiler, 'group_sources'):
+        sources = api.sources
+    bodies = {
+        'plans': [],
+        'coupons': [],
+        'customers': [],
+        'subscriptions': {},
+        'sources': {},
+    }
+    parallel = (
+        workers is not None and workers > 1 and
+        'fork' in multiprocessing.get_all_start_methods())
+
+    tasks = list(_tasks(
+        api, sources, workers * SHARDS_PER_WORKER if parallel else 1))
+    if parallel:
+        _state = (api, sources)
+        try:
+            with span(profiler, 'pool'), ProcessPoolExecutor(
+                    workers,
+                    mp_context=multiprocessing.get_context('fork')) as pool:
+                results = list(pool.map(
+                    _run,
+                    [(renderer, start, stop)
+                     for _, renderer, start, stop in tasks]))
+        finally:
+            _state = None
+    else:
+        results = []
+        for resource, renderer, start, stop in tasks:
+            with span(profiler, resource):
+                results.append(renderer(api, sources, start, stop))
+
+    for (resource, _, _, _), result in zip(tasks, results):
+        if isinstance(result, dict):
+            bodies[resource].update(result)
+        else:
+            bodies[resource].extend(result)
+    return bodies
+
+
+def update_bodies(api, bodies, customer_ids):
+    """Re-render, in place, the bodies of some customers: their own, and
+    their subscription and source lists.
+
+    Customers added since ``bodies`` were rendered must be among them.
+
+    :param api: the mock the bodies were rendered from
+    :type api: :class:`StripeMockAPI`
+    :param bodies: as returned by :func:`render_bodies`
+    :type bodies: dict
+    :param customer_ids: ids of the customers to re-render
+    :type customer_ids: iterable[string]
+    """
+    customers = bodies['customers']
+    customers.extend([None] * (len(api.customers) - len(customers)))
+    for customer_id in customer_ids:
+        position = api.customer_position(customer_id)
+        if position is not None:
+            customers[position] = _render_customers(
+                api, None, position, position + 1)[0]
+
+        subs = api.customer_subscriptions.get(customer_id)
+        if subs:
+            bodies['subscriptions'][customer_id] = _subscription_list(
+                api, customer_id, subs)
+        else:
+            bodies['subscriptions'].pop(customer_id, None)
+
+        sources = api.sources_for(customer_id)
+        if sources:
+            bodies['sources'][customer_id] = _source_list(
+                customer_id, sources)
+        else:
+            bodies['sources'].pop(customer_id, None)
@@ -3,15 +3,27 @@ import re
 
 import stripe
 
+#: api base the url patterns below were built against
+API_BASE = stripe.api_base
+API_URL_RE = re.compile(r'{}/'.format(re.escape(API_BASE)))
 CUSTOMER_URL_BASE = '{}/v1/customers'.format(stripe.api_base)
 CUSTOMER_OBJECT_URL_TPL = '{customer_url_base}/{customer_id}'
 CUSTOMER_URL_RE = re.compile(
     CUSTOMER_OBJECT_URL_TPL.format(
-        customer_url_base=CUSTOMER_URL_BASE, customer_id='(\w+)'))
+        customer_url_base=CUSTOMER_URL_BASE, customer_id=r'(?!search\b)(\w+)'))
+CUSTOMER_SEARCH_URL_RE = re.compile(r'{}/search'.format(CUSTOMER_URL_BASE))
+CUSTOMER_UPDATE_URL_RE = re.compile(
+    r'{}/(?!search\b)(\w+)$'.format(CUSTOMER_URL_BASE))
+CUSTOMER_DISCOUNT_URL_RE = re.compile(
+    r'{}/(\w+)/discount$'.format(CUSTOMER_URL_BASE))
 CUSTOMER_SOURCE_OBJECT_URL_RE = re.compile(
-    r'{}/(\w+)/sources(\w+)'.format(CUSTOMER_URL_BASE))
+    r'{}/(\w+)/sources/(\w+)'.format(CUSTOMER_URL_BASE))
 CUSTOMER_SOURCE_LIST_URL_RE = re.compile(
-    r'{}/(\w+)/sources(\?object=(\w+)?)?'.format(CUSTOMER_URL_BASE))
+    r'{}/(\w+)/sources(\?object=(\w+)?)?$'.format(CUSTOMER_URL_BASE))
+CUSTOMER_BALANCE_TRANSACTION_LIST_URL_RE = re.compile(
+    r'{}/(\w+)/balance_transactions(\?.*)?$'.format(CUSTOMER_URL_BASE))
+CUSTOMER_BALANCE_TRANSACTION_URL_RE = re.compile(
+    r'{}/(\w+)/balance_transactions/(\w+)(\?.*)?$'.format(CUSTOMER_URL_BASE))
 CUSTOMER_SOURCE_OBJECT_URL_TPL = """
 {customer_url_base}/{customer_id}/sources/{source_id}
 """.strip()
@@ -22,7 +34,14 @@ PLAN_URL_RE = re.compile(r'{}/(\w+)'.format(PLAN_URL_BASE))
 SUBSCRIPTION_URL_BASE = '{}/v1/subscriptions'.format(stripe.api_base)
 SUBSCRIPTION_OBJECT_URL_TPL = '{}/{{subscription_id}}'.format(
     SUBSCRIPTION_URL_BASE)
-SUBSCRIPTION_URL_RE = re.compile(r'{}/(\w+)'.format(SUBSCRIPTION_URL_BASE))
+SUBSCRIPTION_URL_RE = re.compile(
+    r'{}/(?!search\b)(\w+)'.format(SUBSCRIPTION_URL_BASE))
+SUBSCRIPTION_SEARCH_URL_RE = re.compile(
+    r'{}/search'.format(SUBSCRIPTION_URL_BASE))
+SUBSCRIPTION_UPDATE_URL_RE = re.compile(
+    r'{}/(?!search\b)(\w+)$'.format(SUBSCRIPTION_URL_BASE))
+SUBSCRIPTION_DISCOUNT_URL_RE = re.compile(
+    r'{}/(\w+)/discount$'.format(SUBSCRIPTION_URL_BASE))
 CUSTOMER_SUBSCRIPTION_OBJECT_URL_RE = re.compile(
     r'{}/(\w+)/subscriptions/(\w+)'.format(SUBSCRIPTION_URL_BASE))
 CUSTOMER_SUBSCRIPTION_LIST_URL_RE = re.compile(
@@ -32,3 +51,36 @@ CUSTOMER_SUBSCRIPTION_LIST_URL_TPL = """
 """.strip()
 COUPON_URL_BASE = '{}/v1/coupons'.format(stripe.api_base)
 COUPON_URL_RE = re.compile(r'{}/(\w+)'.format(COUPON_URL_BASE))
+EVENT_URL_BASE = '{}/v1/events'.format(stripe.api_base)
+EVENT_URL_RE = re.compile(r'{}/(\w+)'.format(EVENT_URL_BASE))
+EVENT_LIST_URL_RE = re.compile(r'{}(\?.*)?$'.format(EVENT_URL_BASE))
+INVOICE_URL_BASE = '{}/v1/invoices'.format(stripe.api_base)
+INVOICE_URL_RE = re.compile(r'{}/(\w+)'.format(INVOICE_URL_BASE))
+INVOICE_LIST_URL_RE = re.compile(r'{}(\?.*)?$'.format(INVOICE_URL_BASE))
+CHARGE_URL_BASE = '{}/v1/charges'.format(stripe.api_base)
+CHARGE_URL_RE = re.compile(r'{}/(\w+)'.format(CHARGE_URL_BASE))
+CHARGE_LIST_URL_RE = re.compile(r'{}(\?.*)?$'.format(CHARGE_URL_BASE))
+SUBSCRIPTION_ITEM_URL_BASE = '{}/v1/subscription_items'.format(
+    stripe.api_base)
+USAGE_RECORD_URL_RE = re.compile(
+    r'{}/(\w+)/usage_records$'.format(SUBSCRIPTION_ITEM_URL_BASE))
+USAGE_RECORD_SUMMARY_URL_RE = re.compile(
+    r'{}/(\w+)/usage_record_summaries(\?.*)?$'.format(
+        SUBSCRIPTION_ITEM_URL_BASE))
+
+
+def collection_url_re(paths):
+    """Return the pattern of the urls of collections and of their objects.
+
+    Group 1 is the collection's path, e.g. '/v1/products', group 2 the
+    object id if any.
+
+    :param paths: paths of the collections
+    :type paths: iterable[string]
+    :rtype: compiled regex
+    """
+    # longest first, so '/v1/a/b' isn't read as object 'b' of '/v1/a'
+    alternatives = '|'.join(
+        re.escape(path) for path in sorted(paths, key=len, reverse=True))
+    return re.compile(r'{}({})(?:/(\w+))?(\?.*)?$'.format(
+        re.escape(API_BASE), alternatives))
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""Time the phases of :meth:`StripeMockAPI.sync` and of request handling.
+
+Set a :class:`Profiler` as the mock's ``profiler``, and every phase runs in
+a span of it::
+
+    profiler = Profiler()
+    api.profiler = profiler
+    api.sync()
+    ...
+    print(profiler.format_stats())
+    profiler.write_folded('sync.folded')
+
+Spans nest: ``sync`` holds ``refresh``, which holds ``render`` (the
+``group_sources`` regrouping of :attr:`StripeMockAPI.sources`, then the
+encoding of each resource) and ``route``, then ``install`` (the
+:mod:`responses` registration). Each request is a
+``dispatch`` span, holding the auto sync ``update`` if any, ``resolve``
+and ``respond``; through :mod:`responses`, it is preceded by a ``match``
+span, which runs the ``update`` instead.
+
+Wall time and allocations are aggregated per stack of phases. Allocations
+are the net change of the interpreter's allocated blocks, or of the bytes
+traced by :mod:`tracemalloc` when the profiler is created with
+``tracemalloc=True``. With ``cprofile=True`` the outermost spans also run
+under :mod:`cProfile`, for a per function breakdown. Stacks are written in
+the folded format of Brendan Gregg's ``flamegraph.pl`` (also read by
+speedscope and inferno), one ``phase;phase;phase value`` line each.
+
+Without a profiler, spans cost a function call.
+"""
+import cProfile
+import collections
+import contextlib
+import sys
+import threading
+import time
+import tracemalloc as _tracemalloc
+
+#: aggregated measures of one stack of phases; wall seconds and
+#: allocations include the nested phases
+PhaseStats = collections.namedtuple(
+    'PhaseStats', ['stack', 'calls', 'wall', 'allocated'])
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+def span(profiler, phase):
+    """Return a span of a profiler, or a no-op one if it is None.
+
+    :param profiler: where the span is recorded
+    :type profiler: :class:`Profiler` or None
+    :param phase: name of the phase
+    :type phase: string
+    :rtype: context manager
+    """
+    if profiler is None:
+        return _NO_SPAN
+    return profiler.span(phase)
+
+
+class Profiler(object):
+
+    """Aggregate wall time and allocations of nested phases.
+
+    Usable from several threads; each thread nests its own spans.
+
+    Listeners are called with ``(stack, wall, allocated)`` as each span
+    ends, ``stack`` being the tuple of phase names, outermost first.
+
+    :param tracemalloc: measure allocated bytes with :mod:`tracemalloc`,
+        starting it if needed, instead of counting allocated blocks
+    :type tracemalloc: bool
+    :param cprofile: also profile the outermost spans with
+        :mod:`cProfile`, see :attr:`cprofile`
+    :type cprofile: bool
+    """
+
+    def __init__(self, tracemalloc=False, cprofile=False):
+        self.tracemalloc = tracemalloc
+        #: :class:`cProfile.Profile` of the outermost spans, or None
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.listeners = []
+        # [calls, wall, allocated] by stack
+        self._phases = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+        if tracemalloc and not _tracemalloc.is_tracing():
+            _tracemalloc.start()
+
+    def _allocated(self):
+        if self.tracemalloc:
+            return _tracemalloc.get_traced_memory()[0]
+        return sys.getallocatedblocks()
+
+    @contextlib.contextmanager
+    def span(self, phase):
+        """Record the code run in the block as a phase.
+
+        :param phase: name of the phase, nested in the current one
+        :type phase: string
+        """
+        stack = getattr(self._local, 'stack', ())
+        self._local.stack = stack = stack + (phase, )
+        # cProfile profiles one thread, and can't be enabled twice
+        profile = self.cprofile if len(stack) == 1 else None
+        if profile is not None and not self._profile_lock.acquire(
+                blocking=False):
+            profile = None
+        try:
+            if profile is not None:
+                profile.enable()
+            allocated = self._allocated()
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                wall = time.perf_counter() - started
+                allocated = self._allocated() - allocated
+                if profile is not None:
+                    profile.disable()
+        finally:
+            if profile is not None:
+                self._profile_lock.release()
+            self._local.stack = stack[:-1]
+
+        with self._lock:
+            phase_stats = self._phases.get(stack)
+            if phase_stats is None:
+                phase_stats = self._phases[stack] = [0, 0.0, 0]
+            phase_stats[0] += 1
+            phase_stats[1] += wall
+            phase_stats[2] += allocated
+        for listener in self.listeners:
+            listener(stack, wall, allocated)
+
+    def stats(self):
+        """Return the measures of each stack of phases, in stack order.
+
+        :rtype: list[:class:`PhaseStats`]
+        """
+        with self._lock:
+            return [
+                PhaseStats(stack, *phase_stats)
+                for stack, phase_stats in sorted(self._phases.items())
+            ]
+
+    def reset(self):
+        """Forget the measures so far."""
+        with self._lock:
+            self._phases.clear()
+
+    def format_stats(self):
+        """Return the measures as a table, nested phases indented.
+
+        :rtype: string
+        """
+        lines = ['{:<40}{:>8}{:>12}{:>14}'.format(
+            'phase', 'calls', 'wall ms', 'allocated')]
+        for phase_stats in self.stats():
+            lines.append('{:<40}{:>8}{:>12.2f}{:>14}'.format(
+                '  ' * (len(phase_stats.stack) - 1) + phase_stats.stack[-1],
+                phase_stats.calls,
+                phase_stats.wall * 1000,
+                phase_stats.allocated,
+            ))
+        return '\n'.join(lines)
+
+    def folded(self, measure='wall'):
+        """Yield the stacks in the folded flame graph format.
+
+        Values are a stack's own share: the time (in microseconds) or
+        allocations not spent in nested phases. Stacks without any are
+        left out.
+
+        :param measure: 'wall' or 'allocated'
+        :type measure: string
+        :rtype: iterator[string]
+        """
+        if measure not in ('wall', 'allocated'):
+            raise ValueError('Unknown measure: {}'.format(measure))
+        stats = self.stats()
+        totals = {
+            phase_stats.stack: (
+                int(phase_stats.wall * 1e6) if measure == 'wall' else
+                phase_stats.allocated)
+            for phase_stats in stats
+        }
+        own = dict(totals)
+        for stack, total in totals.items():
+            if len(stack) > 1 and stack[:-1] in own:
+                own[stack[:-1]] -= total
+        for phase_stats in stats:
+            value = own[phase_stats.stack]
+            if value > 0:
+                yield '{} {}'.format(';'.join(phase_stats.stack), value)
+
+    def write_folded(self, path, measure='wall'):
+        """Write :meth:`folded` stacks to a file, for ``flamegraph.pl``.
+
+        :param path: file to write
+        :type path: string
+        :param measure: 'wall' or 'allocated'
+        :type measure: string
+        """
+        with open(path, 'w') as f:
+            for line in self.folded(measure):
+                f.write(line)
+                f.write('\n')
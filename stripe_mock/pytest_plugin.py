@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""pytest plugin holding tests to a budget of stripe calls.
+
+Enable it with ``pytest -p stripe_mock.pytest_plugin``, or with
+``pytest_plugins = ['stripe_mock.pytest_plugin']`` in the root
+conftest.py. The stripe calls each test makes through the
+:mod:`responses` mock of a :class:`StripeMockAPI` are counted by route
+(see :mod:`stripe_mock.budget`), and the ``stripe_budget`` marker fails
+the tests making more than their budget::
+
+    @pytest.mark.stripe_budget(customer_retrieve=1, total=5)
+    def test_sync_billing(api):
+        api.sync()
+        sync_billing()
+
+The ``stripe_calls`` fixture is the running test's
+:class:`~stripe_mock.budget.CallCounter`, to assert on directly. At the
+end of the session, the tests making the most calls are listed, see
+``--stripe-report``.
+"""
+import pytest
+
+from .budget import BudgetExceeded, CallCounter
+
+_COUNTER = pytest.StashKey()
+# (node id, total, counter) of the tests that made calls
+_RESULTS = pytest.StashKey()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('stripe_mock')
+    group.addoption(
+        '--stripe-report', type=int, default=10, metavar='N',
+        help='list the N tests making the most stripe calls, 0 for none')
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers',
+        'stripe_budget(total=None, **routes): fail the test if it makes '
+        'more stripe calls, in total or to a route (e.g. '
+        'customer_retrieve=1)')
+    config.stash[_RESULTS] = []
+
+
+def _counter(item):
+    counter = item.stash.get(_COUNTER, None)
+    if counter is None:
+        counter = item.stash[_COUNTER] = CallCounter()
+    return counter
+
+
+@pytest.fixture
+def stripe_calls(request):
+    """The stripe calls of the running test, by route.
+
+    :rtype: :class:`~stripe_mock.budget.CallCounter`
+    """
+    return _counter(request.node)
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    counter = _counter(item)
+    try:
+        with counter:
+            result = yield
+    finally:
+        if counter.total:
+            item.config.stash[_RESULTS].append(
+                (item.nodeid, counter.total, counter))
+
+    marker = item.get_closest_marker('stripe_budget')
+    if marker is not None:
+        try:
+            counter.check(*marker.args, **marker.kwargs)
+        except BudgetExceeded as e:
+            pytest.fail(str(e), pytrace=False)
+    return result
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    limit = config.getoption('stripe_report')
+    results = sorted(
+        config.stash.get(_RESULTS, []), key=lambda result: -result[1])
+    if not limit or not results:
+        return
+    terminalreporter.write_sep('-', 'most stripe calls')
+    for nodeid, total, counter in results[:limit]:
+        terminalreporter.write_line('{:>6} {} ({})'.format(
+            total, nodeid, counter.format_counts(3)))
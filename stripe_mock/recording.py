@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""Record stripe traffic, and rebuild a :class:`StripeMockAPI` from it.
+
+A recording is a JSON lines file (gzip compressed if it ends in ``.gz``),
+one request/response exchange per line. Capture real test mode traffic by
+hooking a :class:`Recorder` into the :mod:`requests` session stripe uses::
+
+    with Recorder('traffic.jsonl.gz') as recorder:
+        session = requests.Session()
+        session.hooks['response'].append(recorder.requests_hook)
+        stripe.default_http_client = stripe.RequestsClient(session=session)
+        ...
+
+then load it as a fixture::
+
+    api = StripeMockAPI()
+    load_recording(api, 'traffic.jsonl.gz')
+    api.sync()
+
+Customers, subscriptions, sources (cards, bank accounts), invoices,
+charges, plans and coupons are picked out of the responses, lists
+included, and stored through :meth:`StripeMockAPI.bulk_load` in their
+last recorded state; objects whose last response is a deletion are left
+out. The file is read twice, an exchange at a time, so memory holds the
+ids seen, not the traffic.
+"""
+import json
+import threading
+from urllib.parse import parse_qs
+
+from .dataset import open_dataset
+from .records import to_json_default
+
+#: object types :meth:`StripeMockAPI.bulk_load` stores
+REPLAYED_OBJECTS = frozenset([
+    'bank_account',
+    'card',
+    'charge',
+    'coupon',
+    'customer',
+    'invoice',
+    'plan',
+    'source',
+    'subscription',
+])
+# object types stored per customer, dropped when they aren't attached
+_CUSTOMER_OBJECTS = frozenset(['bank_account', 'card', 'source',
+                               'subscription'])
+# lists embedded in customers, served from the other stores
+_CUSTOMER_LISTS = ('sources', 'subscriptions')
+
+
+class Recorder(object):
+
+    """Write exchanges to a recording, as they happen.
+
+    Usable from several threads; lines are written whole.
+
+    :param path: file to write, gzip compressed if it ends in .gz
+    :type path: string
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = open_dataset(path, 'w')
+        self._lock = threading.Lock()
+
+    def record(self, method, url, status, response, request=None):
+        """Write an exchange.
+
+        :param method: GET, POST, DELETE, etc.
+        :type method: string
+        :param url: requested url, query string included
+        :type url: string
+        :param status: http status of the response
+        :type status: int
+        :param response: decoded json body of the response
+        :type response: dict
+        :param request: decoded form parameters of the request
+        :type request: dict
+        """
+        line = json.dumps(
+            {
+                'method': method,
+                'url': url,
+                'status': status,
+                'request': request,
+                'response': response,
+            },
+            separators=(',', ':'),
+            default=to_json_default,
+        )
+        with self._lock:
+            self._file.write(line)
+            self._file.write('\n')
+            self.count += 1
+
+    def requests_hook(self, response, *args, **kwargs):
+        """Record a :class:`requests.Response`, as a session hook.
+
+        Responses that aren't json are skipped.
+        """
+        try:
+            body = response.json()
+        except ValueError:
+            return response
+        request = response.request
+        params = None
+        if request.body:
+            data = request.body
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            params = {
+                key: values[0] if len(values) == 1 else values
+                for key, values in parse_qs(data).items()
+            }
+        self.record(
+            request.method, request.url, response.status_code, body, params)
+        return response
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_recording(path):
+    """Yield the exchanges of a recording, one at a time.
+
+    :param path: file to read, gzip compressed if it ends in .gz
+    :type path: string
+    :rtype: iterator[dict]
+    """
+    with open_dataset(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _objects(exchange):
+    """Yield the replayable objects of an exchange, in order.
+
+    Deletions are yielded as their ``{'id', 'object', 'deleted'}`` body.
+    """
+    if not 200 <= exchange.get('status', 200) < 300:
+        return
+    stack = [exchange.get('response')]
+    while stack:
+        obj = stack.pop()
+        if not isinstance(obj, dict):
+            continue
+        object_type = obj.get('object')
+        if object_type in ('list', 'search_result'):
+            stack.extend(reversed(obj.get('data') or []))
+            continue
+        if object_type not in REPLAYED_OBJECTS or 'id' not in obj:
+            continue
+        if object_type == 'customer':
+            embedded = [
+                obj[key] for key in _CUSTOMER_LISTS
+                if isinstance(obj.get(key), dict)
+            ]
+            if embedded:
+                obj = {
+                    key: value
+                    for key, value in obj.items()
+                    if key not in _CUSTOMER_LISTS
+                }
+            yield obj
+            stack.extend(reversed(embedded))
+        else:
+            yield obj
+
+
+def _replay(path):
+    """Yield (key, object) of every replayable object of a recording."""
+    for exchange in read_recording(path):
+        for obj in _objects(exchange):
+            yield (obj['object'], obj['id']), obj
+
+
+def replay_objects(path):
+    """Yield the last recorded state of each object of a recording.
+
+    :param path: recording to read, see :class:`Recorder`
+    :type path: string
+    :rtype: iterator[dict]
+    """
+    # first pass: where each object is seen last
+    last = {}
+    for i, (key, _) in enumerate(_replay(path)):
+        last[key] = i
+
+    for i, (key, obj) in enumerate(_replay(path)):
+        if last[key] != i or obj.get('deleted'):
+            continue
+        if key[0] in _CUSTOMER_OBJECTS:
+            customer = obj.get('customer')
+            if not customer:
+                continue
+            if isinstance(customer, dict):  # expanded
+                obj = dict(obj, customer=customer['id'])
+        yield obj
+
+
+def load_recording(api, path):
+    """Load the objects of a recording into a :class:`StripeMockAPI`'s
+    stores, see :meth:`StripeMockAPI.bulk_load`.
+
+    :returns: number of objects loaded
+    :rtype: int
+    """
+    return api.bulk_load(replay_objects(path))
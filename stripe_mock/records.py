@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""Compact, ``__slots__`` based storage for stripe objects.
+
+A stored stripe object as a plain dict repeats its 15-40 keys, and the
+same default values, for every object. A record instead keeps one slot per
+field of its :mod:`~stripe_mock.fake` factory's template:
+
+- keys live once, on the class
+- unset slots fall back to the template's default, and values equal to
+  the default are stored as a reference to it
+- mutable defaults (e.g. ``metadata``) are copied on first access, so the
+  shared template is never modified through a record
+- keys the template doesn't know about go to a per-record dict
+- embedded stripe objects (a subscription's plan, list items) are
+  compacted too, and the keys and short values of other embedded dicts
+  (e.g. ``metadata``) are interned
+
+Records are :class:`~collections.abc.MutableMapping` s, so code treating
+stored objects as dicts keeps working. :func:`to_json_default` renders
+them for :func:`json.dumps`.
+"""
+import copy
+import sys
+from collections.abc import MutableMapping
+
+from .fake import (
+    fake_charge,
+    fake_coupon,
+    fake_customer,
+    fake_customer_discount,
+    fake_customer_source,
+    fake_customer_source_bank_account,
+    fake_customer_source_card,
+    fake_invoice,
+    fake_invoice_line_item,
+    fake_plan,
+    fake_subscription,
+)
+
+
+class _Deleted(object):
+
+    """Marks a template field deleted from a record; pickles by name."""
+
+    def __reduce__(self):
+        return '_DELETED'
+
+
+_DELETED = _Deleted()
+_IMMUTABLE_TYPES = (str, int, float, bool, type(None))
+_INTERN_MAX_LENGTH = 16
+
+
+class StripeRecord(MutableMapping):
+
+    """Base class of the per-object-type record classes."""
+
+    __slots__ = ('_extra', )
+
+    #: template values, keyed by field
+    _template = {}
+    #: slot descriptors, keyed by field
+    _descriptors = {}
+    #: fields whose default needs copying before it's handed out
+    _mutable_fields = frozenset()
+
+    def __init__(self, values=()):
+        self._extra = None
+        if hasattr(values, 'items'):
+            values = values.items()
+        for key, value in values:
+            self[key] = value
+
+    def __getitem__(self, key):
+        descriptor = self._descriptors.get(key)
+        if descriptor is None:
+            if self._extra is None:
+                raise KeyError(key)
+            return self._extra[key]
+
+        try:
+            value = descriptor.__get__(self)
+        except AttributeError:
+            value = self._template[key]
+            if key in self._mutable_fields:
+                value = copy.deepcopy(value)
+                descriptor.__set__(self, value)
+            return value
+        if value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        descriptor = self._descriptors.get(key)
+        if descriptor is None:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+            return
+
+        default = self._template[key]
+        if isinstance(value, _IMMUTABLE_TYPES):
+            if type(value) is type(default) and value == default:
+                value = default  # share the template's copy
+        elif type(value) is dict:
+            if value == default:  # fall back to the template
+                try:
+                    descriptor.__delete__(self)
+                except AttributeError:
+                    pass
+                return
+            value = _compact_nested(value)
+        descriptor.__set__(self, value)
+
+    def __delitem__(self, key):
+        descriptor = self._descriptors.get(key)
+        if descriptor is None:
+            if self._extra is None:
+                raise KeyError(key)
+            del self._extra[key]
+            return
+        if key not in self:
+            raise KeyError(key)
+        descriptor.__set__(self, _DELETED)
+
+    def __contains__(self, key):
+        descriptor = self._descriptors.get(key)
+        if descriptor is None:
+            return self._extra is not None and key in self._extra
+        try:
+            return descriptor.__get__(self) is not _DELETED
+        except AttributeError:
+            return True
+
+    def __iter__(self):
+        for key, descriptor in self._descriptors.items():
+            try:
+                if descriptor.__get__(self) is _DELETED:
+                    continue
+            except AttributeError:
+                pass
+            yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.to_dict())
+
+    def to_dict(self):
+        """Return a plain dict of the record, for rendering.
+
+        Unlike ``dict(record)``, defaults are not copied into the record;
+        they are shared with the template, so treat the result as
+        read-only.
+
+        :rtype: dict
+        """
+        data = {}
+        template = self._template
+        for key, descriptor in self._descriptors.items():
+            try:
+                value = descriptor.__get__(self)
+            except AttributeError:
+                value = template[key]
+            if value is not _DELETED:
+                data[key] = value
+        if self._extra is not None:
+            data.update(self._extra)
+        return data
+
+
+def _record_class(name, template):
+    fields = list(template)
+    cls = type(name, (StripeRecord, ), {
+        '__slots__': tuple('f_{}'.format(field) for field in fields),
+        '__module__': __name__,
+    })
+    cls._template = template
+    cls._descriptors = {
+        field: getattr(cls, 'f_{}'.format(field))
+        for field in fields
+    }
+    cls._mutable_fields = frozenset(
+        field for field, value in template.items()
+        if not isinstance(value, _IMMUTABLE_TYPES))
+    return cls
+
+
+CustomerRecord = _record_class('CustomerRecord', fake_customer(None))
+CouponRecord = _record_class('CouponRecord', fake_coupon(None))
+PlanRecord = _record_class('PlanRecord', fake_plan(None))
+SubscriptionRecord = _record_class(
+    'SubscriptionRecord', fake_subscription(None, None))
+SourceRecord = _record_class('SourceRecord', fake_customer_source(None, None))
+CardRecord = _record_class('CardRecord', fake_customer_source_card(None, None))
+BankAccountRecord = _record_class(
+    'BankAccountRecord', fake_customer_source_bank_account(None, None))
+DiscountRecord = _record_class('DiscountRecord', fake_customer_discount(None))
+SubscriptionItemRecord = _record_class(
+    'SubscriptionItemRecord',
+    fake_subscription(None, None)['items']['data'][0])
+InvoiceRecord = _record_class('InvoiceRecord', fake_invoice(None, None))
+LineItemRecord = _record_class(
+    'LineItemRecord', fake_invoice_line_item(None, None))
+ChargeRecord = _record_class('ChargeRecord', fake_charge(None, None))
+
+#: record class by the ``object`` field of stripe objects
+RECORD_CLASSES = {
+    'bank_account': BankAccountRecord,
+    'card': CardRecord,
+    'charge': ChargeRecord,
+    'coupon': CouponRecord,
+    'customer': CustomerRecord,
+    'discount': DiscountRecord,
+    'invoice': InvoiceRecord,
+    'line_item': LineItemRecord,
+    'plan': PlanRecord,
+    'source': SourceRecord,
+    'subscription': SubscriptionRecord,
+    'subscription_item': SubscriptionItemRecord,
+}
+
+
+def _compact_nested(value):
+    """Compact stripe objects embedded in a record, e.g. a subscription's
+    plan, or the items of an embedded list."""
+    object_type = value.get('object')
+    if object_type in RECORD_CLASSES:
+        return RECORD_CLASSES[object_type](value)
+
+    # plain dicts (metadata, lists, ...): share key strings, and the short
+    # values that repeat across objects, through the interpreter's table
+    compacted = {}
+    for key, item in value.items():
+        if type(item) is dict:
+            item = _compact_nested(item)
+        elif type(item) is list:
+            item = [
+                _compact_nested(element) if type(element) is dict else element
+                for element in item
+            ]
+        elif type(item) is str and len(item) <= _INTERN_MAX_LENGTH:
+            item = sys.intern(item)
+        compacted[sys.intern(key)] = item
+    return compacted
+
+
+def peek(obj, key, default=None):
+    """Read a field without copying a record's mutable default.
+
+    Like ``obj.get(key, default)``, but a record's shared template value is
+    returned as is, so the result must not be modified.
+    """
+    if not isinstance(obj, StripeRecord):
+        return obj.get(key, default)
+    descriptor = obj._descriptors.get(key)
+    if descriptor is None:
+        return obj.get(key, default)
+    try:
+        value = descriptor.__get__(obj)
+    except AttributeError:
+        return obj._template[key]
+    return default if value is _DELETED else value
+
+
+def as_dict(obj):
+    """Return a dict view of a stored object, for rendering.
+
+    Records are converted with :meth:`StripeRecord.to_dict`, dicts are
+    returned as is.
+
+    :rtype: dict
+    """
+    if isinstance(obj, StripeRecord):
+        return obj.to_dict()
+    return obj
+
+
+def compact(obj):
+    """Return a record holding obj, or obj itself if no record class fits.
+
+    :param obj: stripe object
+    :type obj: dict
+    :rtype: :class:`StripeRecord` or dict
+    """
+    if isinstance(obj, StripeRecord):
+        return obj
+    record_class = RECORD_CLASSES.get(obj.get('object'))
+    if record_class is None:
+        return obj
+    return record_class(obj)
+
+
+def to_json_default(obj):
+    """``default`` hook for :func:`json.dumps` rendering records.
+
+    :raises: :class:`TypeError` for anything else, like json does
+    """
+    if isinstance(obj, StripeRecord):
+        return obj.to_dict()
+    raise TypeError(
+        'Object of type {} is not JSON serializable'.format(
+            type(obj).__name__))
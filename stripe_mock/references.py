@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""Reverse references between stored objects.
+
+Stored objects point at others by id: a subscription at its customer and
+plans, a source at its customer, a discount at its customer, coupon and
+subscription. Nothing checks the objects pointed at exist, so e.g. a
+subscription can be added for a customer that never was.
+
+A :class:`ReferenceIndex` keeps the reverse of every pointer, keyed by
+``(object type, id)``, so :meth:`StripeMockAPI.delete_customer` finds
+what to cascade to, and :meth:`StripeMockAPI.validate` finds the
+pointers to missing objects, in time proportional to the references
+involved rather than by scanning every store.
+
+Discounts have no ids of their own, they are keyed by the id of the
+customer, or subscription, they apply to.
+"""
+import threading
+
+from .records import peek
+
+# object types of the customer sources
+_SOURCE_OBJECTS = frozenset(['bank_account', 'card', 'source'])
+
+
+class ReferenceIntegrityError(ValueError):
+
+    """Raised when stored objects point at objects that aren't stored.
+
+    :param orphans: (referrer, missing object) keys
+    :type orphans: list[((string, string), (string, string))]
+    """
+
+    def __init__(self, orphans):
+        self.orphans = orphans
+        super().__init__('{} references to missing objects: {}'.format(
+            len(orphans), ', '.join(
+                '{}:{} -> {}:{}'.format(*(referrer + target))
+                for referrer, target in orphans[:5])))
+
+
+def key(obj):
+    """Return the key of a stored object in a :class:`ReferenceIndex`.
+
+    :rtype: (string, string)
+    """
+    if obj['object'] == 'discount':
+        return ('discount', obj['subscription'] or obj['customer'])
+    return (obj['object'], obj['id'])
+
+
+def references(obj):
+    """Return the keys of the objects a stored object points at.
+
+    :param obj: subscription, source, card, bank account or discount
+    :type obj: dict
+    :rtype: list[(string, string)]
+    """
+    object_type = obj['object']
+    targets = []
+    if object_type == 'subscription' or object_type in _SOURCE_OBJECTS:
+        targets.append(('customer', obj['customer']))
+    if object_type == 'subscription':
+        plans = [peek(obj, 'plan')]
+        items = peek(obj, 'items') or {}
+        plans.extend(item.get('plan') for item in items.get('data') or ())
+        for plan in plans:
+            if isinstance(plan, str):
+                targets.append(('plan', plan))
+            elif plan is not None:
+                targets.append(('plan', plan['id']))
+    elif object_type == 'discount':
+        targets.append(('customer', obj['customer']))
+        if obj['subscription'] is not None:
+            targets.append(('subscription', obj['subscription']))
+        coupon = peek(obj, 'coupon')
+        if coupon is not None:
+            targets.append(('coupon', coupon['id']))
+    return targets
+
+
+class ReferenceIndex(object):
+
+    """The objects pointing at each stored object."""
+
+    def __init__(self):
+        # referrer keys (a dict, for its order) by target key
+        self._referrers = {}
+        # target keys by referrer key
+        self._targets = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of references."""
+        return sum(len(targets) for targets in self._targets.values())
+
+    def add(self, obj):
+        """Index (or re-index) the references of a stored object.
+
+        :param obj: subscription, source, card, bank account or discount
+        :type obj: dict
+        """
+        self.set(key(obj), references(obj))
+
+    def set(self, referrer, targets):
+        """Replace the references of an object.
+
+        :param referrer: key of the object
+        :type referrer: (string, string)
+        :param targets: keys of the objects it points at
+        :type targets: iterable[(string, string)]
+        """
+        targets = tuple(dict.fromkeys(targets))
+        with self._lock:
+            previous = self._targets.get(referrer, ())
+            for target in previous:
+                if target not in targets:
+                    self._unlink(referrer, target)
+            for target in targets:
+                self._referrers.setdefault(target, {})[referrer] = None
+            if targets:
+                self._targets[referrer] = targets
+            else:
+                self._targets.pop(referrer, None)
+
+    def discard(self, referrer):
+        """Forget the references of an object, e.g. after deleting it.
+
+        :param referrer: key of the object
+        :type referrer: (string, string)
+        """
+        with self._lock:
+            for target in self._targets.pop(referrer, ()):
+                self._unlink(referrer, target)
+
+    def _unlink(self, referrer, target):
+        referrers = self._referrers[target]
+        del referrers[referrer]
+        if not referrers:
+            del self._referrers[target]
+
+    def referrers(self, target):
+        """Return the keys of the objects pointing at an object, in the
+        order they were indexed.
+
+        :param target: key of the object
+        :type target: (string, string)
+        :rtype: list[(string, string)]
+        """
+        with self._lock:
+            return list(self._referrers.get(target, ()))
+
+    def targets(self, referrer):
+        """Return the keys of the objects an object points at.
+
+        :rtype: tuple[(string, string)]
+        """
+        return self._targets.get(referrer, ())
+
+    def dangling(self, exists):
+        """Return the references to objects that don't exist.
+
+        Each object pointed at is checked once, however many objects
+        point at it.
+
+        :param exists: tells whether the object of a key is stored
+        :type exists: callable
+        :returns: (referrer, target) keys
+        :rtype: list[((string, string), (string, string))]
+        """
+        with self._lock:
+            referrers = [
+                (target, list(target_referrers))
+                for target, target_referrers in self._referrers.items()
+            ]
+        return [
+            (referrer, target)
+            for target, target_referrers in referrers if not exists(target)
+            for referrer in target_referrers
+        ]
@@ -1,15 +1,37 @@
 # -*- coding: utf-8 -*-
 """Functions to generate stripe responses. For use w/ responses.add_callback()
 """
-from .fake import fake_customer_source_list
+import functools
+from urllib.parse import parse_qs, urlparse
+
+from .discounts import CouponRedemptionError
+from .fake import (
+    fake_customer_source_list,
+    fake_event_list,
+    fake_list_page,
+    fake_search_result,
+    fake_usage_record_summary_list,
+)
+from .ledger import LedgerError
 from .patterns import (
     COUPON_URL_RE,
+    CUSTOMER_BALANCE_TRANSACTION_LIST_URL_RE,
+    CUSTOMER_BALANCE_TRANSACTION_URL_RE,
+    CUSTOMER_DISCOUNT_URL_RE,
     CUSTOMER_SOURCE_LIST_URL_RE,
+    CUSTOMER_UPDATE_URL_RE,
     CUSTOMER_URL_RE,
+    EVENT_URL_RE,
     PLAN_URL_RE,
     SOURCE_URL_RE,
+    SUBSCRIPTION_DISCOUNT_URL_RE,
+    SUBSCRIPTION_UPDATE_URL_RE,
     SUBSCRIPTION_URL_RE,
+    USAGE_RECORD_SUMMARY_URL_RE,
+    USAGE_RECORD_URL_RE,
 )
+from .search import SearchQueryError
+from .usage import ACTIONS, UsageRecordError
 
 
 def stripe_object_not_found(object_name, object_id):
@@ -32,6 +54,102 @@ def stripe_object_not_found(object_name, object_id):
         })
 
 
+def stripe_invalid_request(message, param):
+    """Return responses callback templated for a stripe 400 error.
+
+    :param message: human readable error message
+    :type message: string
+    :param param: name of the offending request parameter
+    :type param: string
+    :returns: signature required by :meth:`responses.add_callback`
+    :rtype: (int, dict, dict) (status, headers, body)
+    """
+    return (
+        400, {}, {
+            'error': {
+                'type': 'invalid_request_error',
+                'message': message,
+                'param': param,
+            }
+        })
+
+
+class _InvalidRequest(Exception):
+
+    """Raised while parsing a request for stripe's 400 response, which
+    :func:`_answers_invalid_requests` returns."""
+
+    def __init__(self, message, param):
+        super().__init__(message)
+        self.response = stripe_invalid_request(message, param)
+
+
+def _answers_invalid_requests(request_callback):
+    """Decorate a request callback to answer the
+    :class:`_InvalidRequest` it raises with its 400 response."""
+
+    @functools.wraps(request_callback)
+    def answering(request):
+        try:
+            return request_callback(request)
+        except _InvalidRequest as e:
+            return e.response
+
+    return answering
+
+
+def stripe_rate_limited():
+    """Return the 429 stripe answers when an API key is rate limited.
+
+    :rtype: (int, dict, dict) (status, headers, body)
+    """
+    return (
+        429, {}, {
+            'error': {
+                'code': 'rate_limit',
+                'message': (
+                    'Too many requests hit the API too quickly. We '
+                    'recommend an exponential backoff of your requests.'),
+                'type': 'invalid_request_error',
+            }
+        })
+
+
+def stripe_api_error(status=500):
+    """Return a stripe 5xx error, as for an internal failure.
+
+    :param status: http status, e.g. 500 or 503
+    :type status: int
+    :rtype: (int, dict, dict) (status, headers, body)
+    """
+    return (
+        status, {}, {
+            'error': {
+                'type': 'api_error',
+                'message': 'An unknown error occurred',
+            }
+        })
+
+
+def unrecognized_request_url(method, url):
+    """Return the 404 stripe answers for urls it doesn't know.
+
+    :param method: GET, POST, DELETE, etc.
+    :type method: string
+    :param url: requested url or path, the query string is left out
+    :type url: string
+    :rtype: (int, dict, dict) (status, headers, body)
+    """
+    return (
+        404, {}, {
+            'error': {
+                'type': 'invalid_request_error',
+                'message': 'Unrecognized request URL ({}: {}).'.format(
+                    method, url.split('?', 1)[0]),
+            }
+        })
+
+
 def customer_not_found(request):
     """Callback for customer not being found, for responses.
 
@@ -80,7 +198,8 @@ def coupon_not_found(request):
     return stripe_object_not_found('coupon', coupon_id)
 
 
-def source_callback_factory(source_list, blocked_objects=[]):
+def source_callback_factory(source_list, blocked_objects=[],
+                            url_re=SOURCE_URL_RE):
     """A factory to create a callback to handle sources.
 
     Filters out cards, wich do not fit this URL schema.
@@ -92,6 +211,8 @@ def source_callback_factory(source_list, blocked_objects=[]):
 
     :param source_list: list of source data
     :type source_list: list[dict]
+    :param url_re: url pattern whose last group is the source id
+    :type url_re: compiled regex
     :returns: response of data immitating stripe's listing
     :rtype: dict
     """
@@ -101,7 +222,7 @@ def source_callback_factory(source_list, blocked_objects=[]):
     ]
 
     def request_callback(request):
-        source_id = SOURCE_URL_RE.match(request.url).group(1)
+        source_id = url_re.match(request.url).groups()[-1]
         for source in cleaned_sources:
             if source_id == source['id']:
                 return (200, {}, source)
@@ -136,3 +257,648 @@ def source_list_callback_factory(source_list):
         return (200, {}, response)
 
     return request_callback
+
+
+def _list_params(request):
+    """Return the query parameters of a list request, their first values,
+    with ``limit`` parsed.
+
+    :raises: :class:`_InvalidRequest` for a bad ``limit``
+    :returns: parameters, ``limit`` an int between 1 and 100 (10 if not
+        given)
+    :rtype: dict
+    """
+    params = {
+        key: values[0]
+        for key, values in parse_qs(urlparse(request.url).query).items()
+    }
+    try:
+        params['limit'] = int(params.get('limit', 10))
+    except ValueError:
+        params['limit'] = 0
+    if not 1 <= params['limit'] <= 100:
+        raise _InvalidRequest(
+            'Invalid limit: must be between 1 and 100', 'limit')
+    return params
+
+
+def search_callback_factory(search_index, object_type):
+    """A factory to create a callback answering stripe search requests.
+
+    Handles ?query=, ?limit= and ?page= against a
+    :class:`~stripe_mock.search.SearchIndex`. The index is read at request
+    time, so objects added after :meth:`StripeMockAPI.sync` are found too.
+
+    :param search_index: index of the objects to search
+    :type search_index: :class:`~stripe_mock.search.SearchIndex`
+    :param object_type: stripe object type, e.g. 'customer'
+    :type object_type: string
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+
+    @_answers_invalid_requests
+    def request_callback(request):
+        params = _list_params(request)
+        query = params.get('query')
+        if not query:
+            return stripe_invalid_request(
+                'Missing required param: query.', 'query')
+
+        try:
+            data, total_count, next_page = search_index.search(
+                query, limit=params['limit'], page=params.get('page'))
+        except SearchQueryError as e:
+            return stripe_invalid_request(str(e), 'query')
+
+        return (
+            200, {},
+            fake_search_result(data, object_type, total_count, next_page))
+
+    return request_callback
+
+
+def event_callback_factory(event_log):
+    """A factory to create a callback retrieving an event by id.
+
+    :param event_log: log of events
+    :type event_log: :class:`~stripe_mock.events.EventLog`
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+
+    def request_callback(request):
+        event_id = EVENT_URL_RE.match(request.url).group(1)
+        try:
+            return (200, {}, event_log.get(event_id))
+        except KeyError:
+            return stripe_object_not_found('event', event_id)
+
+    return request_callback
+
+
+def event_list_callback_factory(event_log):
+    """A factory to create a callback listing events.
+
+    Handles ?limit=, ?starting_after=, ?ending_before= and ?type=.
+
+    :param event_log: log of events
+    :type event_log: :class:`~stripe_mock.events.EventLog`
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+
+    @_answers_invalid_requests
+    def request_callback(request):
+        params = _list_params(request)
+        limit = params['limit']
+
+        try:
+            data, has_more = event_log.page(
+                limit=limit,
+                starting_after=params.get('starting_after'),
+                ending_before=params.get('ending_before'),
+                event_type=params.get('type'),
+            )
+        except KeyError as e:
+            return stripe_object_not_found('event', e.args[0])
+        return (200, {}, fake_event_list(data, has_more))
+
+    return request_callback
+
+
+def time_index_callback_factory(time_index, object_type, url_re):
+    """A factory to create a callback retrieving an object of a
+    :class:`~stripe_mock.timeindex.TimeIndex` by id.
+
+    :param time_index: index of the objects
+    :type time_index: :class:`~stripe_mock.timeindex.TimeIndex`
+    :param object_type: stripe object type, e.g. 'invoice'
+    :type object_type: string
+    :param url_re: url pattern whose first group is the object id
+    :type url_re: compiled regex
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+
+    def request_callback(request):
+        object_id = url_re.match(request.url).group(1)
+        try:
+            return (200, {}, time_index.get(object_id))
+        except KeyError:
+            return stripe_object_not_found(object_type, object_id)
+
+    return request_callback
+
+
+def time_index_list_callback_factory(time_index, object_type):
+    """A factory to create a callback listing the objects of a
+    :class:`~stripe_mock.timeindex.TimeIndex`, newest first.
+
+    Handles ?limit=, ?starting_after=, ?ending_before=, ?customer= and
+    ?created= (or ?created[gt]=, [gte], [lt] and [lte]). The index is read
+    at request time, so objects added after :meth:`StripeMockAPI.sync`
+    are listed too.
+
+    :param time_index: index of the objects
+    :type time_index: :class:`~stripe_mock.timeindex.TimeIndex`
+    :param object_type: stripe object type, e.g. 'invoice'
+    :type object_type: string
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+
+    @_answers_invalid_requests
+    def request_callback(request):
+        params = _list_params(request)
+        limit = params['limit']
+
+        created = {}
+        for key, value in params.items():
+            if key == 'created':
+                bounds = ('gte', 'lte')
+            elif key.startswith('created[') and key.endswith(']'):
+                bounds = (key[len('created['):-1], )
+                if bounds[0] not in ('gt', 'gte', 'lt', 'lte'):
+                    return stripe_invalid_request(
+                        'Received unknown parameter: {}'.format(key), key)
+            else:
+                continue
+            try:
+                value = int(value)
+            except ValueError:
+                return stripe_invalid_request(
+                    'Invalid integer: {}'.format(value), key)
+            for bound in bounds:
+                created[bound] = value
+
+        try:
+            data, has_more = time_index.page(
+                limit=limit,
+                starting_after=params.get('starting_after'),
+                ending_before=params.get('ending_before'),
+                customer=params.get('customer'),
+                created=created,
+            )
+        except KeyError as e:
+            return stripe_object_not_found(object_type, e.args[0])
+        return (200, {}, fake_list_page(data, object_type, has_more))
+
+    return request_callback
+
+
+def _form(request):
+    """Return the form encoded parameters of a request's body."""
+    body = request.body or ''
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    return parse_qs(body, keep_blank_values=True)
+
+
+def _discount_target(api, object_name, object_id):
+    """Return (customer id, subscription id) of a customer or subscription,
+    or None if it isn't stored."""
+    if object_name == 'customer':
+        if api.find_customer(object_id) is None:
+            return None
+        return object_id, None
+    subscription = api.find_subscription(object_id)
+    if subscription is None:
+        return None
+    return subscription['customer'], object_id
+
+
+def _discount_target_body(api, customer_id, subscription_id):
+    if subscription_id is None:
+        return api.customer_body(api.find_customer(customer_id))
+    return api.find_subscription(subscription_id)
+
+
+def coupon_update_callback_factory(api, object_name):
+    """A factory to create a callback applying the coupon of an update.
+
+    Handles POST /v1/customers/{id} and /v1/subscriptions/{id} with a
+    ``coupon`` parameter, an empty one removing the discount. Updates of
+    other fields are rejected, rather than answered without applying
+    them. See :meth:`StripeMockAPI.apply_coupon`.
+
+    :param api: the mock holding the objects
+    :type api: :class:`StripeMockAPI`
+    :param object_name: 'customer' or 'subscription'
+    :type object_name: string
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+    url_re = (
+        CUSTOMER_UPDATE_URL_RE
+        if object_name == 'customer' else SUBSCRIPTION_UPDATE_URL_RE)
+
+    def request_callback(request):
+        object_id = url_re.match(request.url).group(1)
+        target = _discount_target(api, object_name, object_id)
+        if target is None:
+            return stripe_object_not_found(object_name, object_id)
+
+        form = _form(request)
+        for key in form:
+            if key not in ('coupon', 'expand[]'):
+                return stripe_invalid_request(
+                    'Received unknown parameter: {} (only coupon can be '
+                    'updated)'.format(key), key)
+        coupon_id = form.get('coupon', [None])[0]
+        try:
+            if coupon_id:
+                api.apply_coupon(coupon_id, *target)
+            elif coupon_id is not None:
+                api.remove_discount(*target)
+        except CouponRedemptionError as e:
+            return stripe_invalid_request(str(e), 'coupon')
+        return (200, {}, _discount_target_body(api, *target))
+
+    return request_callback
+
+
+def discount_delete_callback_factory(api, object_name):
+    """A factory to create a callback deleting a discount.
+
+    Handles DELETE /v1/customers/{id}/discount and
+    /v1/subscriptions/{id}/discount.
+
+    :param api: the mock holding the objects
+    :type api: :class:`StripeMockAPI`
+    :param object_name: 'customer' or 'subscription'
+    :type object_name: string
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+    url_re = (
+        CUSTOMER_DISCOUNT_URL_RE
+        if object_name == 'customer' else SUBSCRIPTION_DISCOUNT_URL_RE)
+
+    def request_callback(request):
+        object_id = url_re.match(request.url).group(1)
+        target = _discount_target(api, object_name, object_id)
+        if target is None:
+            return stripe_object_not_found(object_name, object_id)
+
+        discount = api.remove_discount(*target)
+        if discount is None:
+            return stripe_object_not_found('discount', object_id)
+        return (200, {}, {'object': 'discount', 'deleted': True})
+
+    return request_callback
+
+
+def delete_callback_factory(api, object_name):
+    """A factory to create a callback deleting a customer, or a
+    subscription.
+
+    Handles DELETE /v1/customers/{id}, see
+    :meth:`StripeMockAPI.delete_customer`, and /v1/subscriptions/{id},
+    answered with the canceled subscription, see
+    :meth:`StripeMockAPI.delete_subscription`.
+
+    :param api: the mock holding the objects
+    :type api: :class:`StripeMockAPI`
+    :param object_name: 'customer' or 'subscription'
+    :type object_name: string
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+    url_re = (
+        CUSTOMER_UPDATE_URL_RE
+        if object_name == 'customer' else SUBSCRIPTION_UPDATE_URL_RE)
+
+    def request_callback(request):
+        object_id = url_re.match(request.url).group(1)
+        try:
+            if object_name == 'subscription':
+                return (200, {}, api.delete_subscription(object_id))
+            api.delete_customer(object_id)
+        except KeyError:
+            return stripe_object_not_found(object_name, object_id)
+        return (
+            200, {}, {'deleted': True, 'id': object_id, 'object': 'customer'})
+
+    return request_callback
+
+
+def usage_record_callback_factory(api):
+    """A factory to create a callback recording metered usage.
+
+    Handles POST /v1/subscription_items/{id}/usage_records with
+    ``quantity``, and optionally ``timestamp`` and ``action``. See
+    :meth:`StripeMockAPI.add_usage_record`.
+
+    :param api: the mock holding the subscription items
+    :type api: :class:`StripeMockAPI`
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+
+    def request_callback(request):
+        item_id = USAGE_RECORD_URL_RE.match(request.url).group(1)
+        form = {key: values[0] for key, values in _form(request).items()}
+        if 'quantity' not in form:
+            return stripe_invalid_request(
+                'Missing required param: quantity.', 'quantity')
+        params = {}
+        for key in ('quantity', 'timestamp'):
+            if form.get(key, 'now') == 'now':
+                continue
+            try:
+                params[key] = int(form[key])
+            except ValueError:
+                return stripe_invalid_request(
+                    'Invalid integer: {}'.format(form[key]), key)
+        action = form.get('action', 'increment')
+        if action not in ACTIONS:
+            return stripe_invalid_request(
+                'Invalid action: must be one of increment or set', 'action')
+
+        try:
+            record = api.add_usage_record(
+                item_id, params['quantity'], params.get('timestamp'), action)
+        except KeyError:
+            return stripe_object_not_found('subscription_item', item_id)
+        except UsageRecordError as e:
+            return stripe_invalid_request(str(e), 'quantity')
+        return (200, {}, record)
+
+    return request_callback
+
+
+def usage_record_summary_callback_factory(api):
+    """A factory to create a callback listing usage record summaries.
+
+    Handles GET /v1/subscription_items/{id}/usage_record_summaries with
+    ?limit=, ?starting_after= and ?ending_before=. See
+    :meth:`StripeMockAPI.usage_record_summaries`.
+
+    :param api: the mock holding the subscription items
+    :type api: :class:`StripeMockAPI`
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+
+    @_answers_invalid_requests
+    def request_callback(request):
+        item_id = USAGE_RECORD_SUMMARY_URL_RE.match(request.url).group(1)
+        params = _list_params(request)
+        limit = params['limit']
+
+        try:
+            summaries = api.usage_record_summaries(item_id)
+        except KeyError:
+            return stripe_object_not_found('subscription_item', item_id)
+        except UsageRecordError as e:
+            return stripe_invalid_request(str(e), 'subscription_item')
+
+        try:
+            data, has_more = _page(summaries, limit, params)
+        except KeyError as e:
+            return stripe_object_not_found('usage_record_summary', e.args[0])
+        return (
+            200, {}, fake_usage_record_summary_list(item_id, data, has_more))
+
+    return request_callback
+
+
+def _balance_transaction_fields(form):
+    """Return the description and metadata of a balance transaction
+    request's form, or an error response."""
+    fields = {}
+    metadata = {}
+    for key, values in form.items():
+        if key == 'description':
+            fields['description'] = values[0] or None
+        elif key.startswith('metadata[') and key.endswith(']'):
+            metadata[key[len('metadata['):-1]] = values[0]
+        elif key not in ('amount', 'currency', 'expand[]'):
+            return stripe_invalid_request(
+                'Received unknown parameter: {}'.format(key), key)
+    if metadata:
+        fields['metadata'] = metadata
+    return fields
+
+
+def balance_transaction_list_callback_factory(api):
+    """A factory to create a callback listing a customer's balance
+    transactions, newest first.
+
+    Handles GET /v1/customers/{id}/balance_transactions with ?limit=,
+    ?starting_after= and ?ending_before=, paged from the customer's
+    ledger, see :meth:`StripeMockAPI.add_balance_transaction`.
+
+    :param api: the mock holding the customers
+    :type api: :class:`StripeMockAPI`
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+
+    @_answers_invalid_requests
+    def request_callback(request):
+        customer_id = CUSTOMER_BALANCE_TRANSACTION_LIST_URL_RE.match(
+            request.url).group(1)
+        if customer_id not in api.customer_index.objects:
+            return stripe_object_not_found('customer', customer_id)
+        params = _list_params(request)
+        limit = params['limit']
+
+        try:
+            data, has_more = api.balance_transactions.page(
+                customer_id,
+                limit=limit,
+                starting_after=params.get('starting_after'),
+                ending_before=params.get('ending_before'),
+            )
+        except KeyError as e:
+            return stripe_object_not_found(
+                'customer_balance_transaction', e.args[0])
+        return (200, {}, fake_list_page(
+            data, 'customer_balance_transaction', has_more,
+            '/v1/customers/{}/balance_transactions'.format(customer_id)))
+
+    return request_callback
+
+
+def balance_transaction_create_callback_factory(api):
+    """A factory to create a callback adjusting a customer's balance.
+
+    Handles POST /v1/customers/{id}/balance_transactions with ``amount``
+    and ``currency``, and optionally ``description`` and ``metadata``.
+    See :meth:`StripeMockAPI.add_balance_transaction`.
+
+    :param api: the mock holding the customers
+    :type api: :class:`StripeMockAPI`
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+
+    def request_callback(request):
+        customer_id = CUSTOMER_BALANCE_TRANSACTION_LIST_URL_RE.match(
+            request.url).group(1)
+        form = _form(request)
+        for key in ('amount', 'currency'):
+            if key not in form:
+                return stripe_invalid_request(
+                    'Missing required param: {}.'.format(key), key)
+        try:
+            amount = int(form['amount'][0])
+        except ValueError:
+            return stripe_invalid_request(
+                'Invalid integer: {}'.format(form['amount'][0]), 'amount')
+        fields = _balance_transaction_fields(form)
+        if isinstance(fields, tuple):
+            return fields
+
+        try:
+            transaction = api.add_balance_transaction(
+                customer_id, amount, currency=form['currency'][0].lower(),
+                **fields)
+        except KeyError:
+            return stripe_object_not_found('customer', customer_id)
+        except LedgerError as e:
+            return stripe_invalid_request(str(e), 'amount')
+        return (200, {}, transaction)
+
+    return request_callback
+
+
+def _customer_balance_transaction(ledger, url):
+    """Return the balance transaction of a url, or a 404 response if
+    the customer has no such transaction."""
+    customer_id, transaction_id = CUSTOMER_BALANCE_TRANSACTION_URL_RE.match(
+        url).group(1, 2)
+    try:
+        transaction = ledger.get(transaction_id)
+    except KeyError:
+        transaction = None
+    if transaction is None or transaction['customer'] != customer_id:
+        return stripe_object_not_found(
+            'customer_balance_transaction', transaction_id)
+    return transaction
+
+
+def balance_transaction_callback_factory(ledger):
+    """A factory to create a callback retrieving a customer's balance
+    transaction.
+
+    :param ledger: the customers' balance transactions
+    :type ledger: :class:`~stripe_mock.ledger.BalanceLedger`
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+
+    def request_callback(request):
+        transaction = _customer_balance_transaction(ledger, request.url)
+        if isinstance(transaction, tuple):
+            return transaction
+        return (200, {}, transaction)
+
+    return request_callback
+
+
+def balance_transaction_update_callback_factory(api):
+    """A factory to create a callback updating the ``description`` and
+    ``metadata`` of a customer's balance transaction.
+
+    :param api: the mock holding the customers
+    :type api: :class:`StripeMockAPI`
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+
+    def request_callback(request):
+        transaction = _customer_balance_transaction(
+            api.balance_transactions, request.url)
+        if isinstance(transaction, tuple):
+            return transaction
+        form = _form(request)
+        for key in ('amount', 'currency'):
+            if key in form:
+                return stripe_invalid_request(
+                    'Received unknown parameter: {}'.format(key), key)
+        fields = _balance_transaction_fields(form)
+        if isinstance(fields, tuple):
+            return fields
+        if 'metadata' in fields:
+            fields['metadata'] = {**transaction['metadata'],
+                                  **fields['metadata']}
+        return (200, {}, api.update_balance_transaction(
+            transaction['id'], **fields))
+
+    return request_callback
+
+
+def _page(objects, limit, params):
+    """Return a page of objects from the ?starting_after= or
+    ?ending_before= cursor of a request, and whether more follow.
+
+    :raises: :class:`KeyError` if a cursor is not an object id
+    :rtype: (list[dict], bool)
+    """
+    ids = [obj['id'] for obj in objects]
+    cursor = params.get('starting_after', params.get('ending_before'))
+    if cursor is not None and cursor not in ids:
+        raise KeyError(cursor)
+    if 'starting_after' in params:
+        start = ids.index(cursor) + 1
+        stop = start + limit
+        has_more = stop < len(ids)
+    elif 'ending_before' in params:
+        stop = ids.index(cursor)
+        start = max(0, stop - limit)
+        has_more = start > 0
+    else:
+        start, stop = 0, limit
+        has_more = stop < len(ids)
+    return objects[start:stop], has_more
+
+
+def object_store_callback_factory(objects, url_re, collections):
+    """A factory to create a callback listing and retrieving objects of
+    the resources generated from the OpenAPI spec, see
+    :meth:`StripeMockAPI.add_object`.
+
+    Lists are newest first and handle ?limit=, ?starting_after= and
+    ?ending_before=. The stores are read at request time.
+
+    :param objects: objects by id, by object type
+    :type objects: dict
+    :param url_re: pattern from :func:`~stripe_mock.patterns.collection_url_re`
+    :type url_re: compiled regex
+    :param collections: (object type, actions) by collection path, the
+        actions being 'list' and / or 'retrieve'
+    :type collections: dict
+    :returns: callback for :meth:`responses.add_callback`
+    :rtype: callable
+    """
+
+    @_answers_invalid_requests
+    def request_callback(request):
+        match = url_re.match(request.url)
+        path, object_id = match.group(1, 2)
+        object_type, actions = collections[path]
+        store = objects.get(object_type, {})
+        action = 'list' if object_id is None else 'retrieve'
+        if action not in actions:
+            return unrecognized_request_url(
+                'GET', urlparse(request.url).path)
+
+        if object_id is not None:
+            try:
+                return (200, {}, store[object_id])
+            except KeyError:
+                return stripe_object_not_found(object_type, object_id)
+
+        params = _list_params(request)
+        limit = params['limit']
+        try:
+            data, has_more = _page(
+                list(reversed(store.values())), limit, params)
+        except KeyError as e:
+            return stripe_object_not_found(object_type, e.args[0])
+        return (200, {}, fake_list_page(data, object_type, has_more, path))
+
+    return request_callback
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""Transport independent routing of requests to mocked stripe responses.
+
+:meth:`StripeMockAPI.build_router` registers every mocked url on a
+:class:`Router`; the :mod:`responses` mock, the HTTP server
+(:mod:`stripe_mock.server`) and the async transports
+(:mod:`stripe_mock.transports`) all answer from it, so every mode serves
+the same stores identically.
+
+Fixed urls are looked up in dicts, so a router with hundreds of
+thousands of objects answers as fast as an empty one; url patterns are
+tried in registration order after that.
+
+Routers are versions: once :meth:`Router.freeze` d, a router doesn't
+change, so requests read it without locks. Changes go to a
+:meth:`Router.copy`, published whole when done (see
+:attr:`StripeMockAPI.router`): a request answers from the version that
+was current when it started, never from one half updated, e.g. with a
+customer's new body but the customer list of before. Versions are
+rendered from the stores with the :class:`StripeMockAPI` sync lock held,
+which its methods changing the stores take too.
+"""
+import collections
+import functools
+import re
+
+import requests
+import responses
+
+from .encoding import JSONList, body_reader, encode_json
+from .patterns import API_URL_RE
+
+#: the parts of a request the response callbacks look at
+MockRequest = collections.namedtuple(
+    'MockRequest', ['method', 'url', 'headers', 'body'])
+MockRequest.__new__.__defaults__ = (None, None)
+
+# marks a fixed response removed from the layers below
+_REMOVED = object()
+# fixed responses in the newest layers are merged into the layer below
+# once they're at least 1/_MERGE_RATIO of its size
+_MERGE_RATIO = 2
+
+#: called with each request answered through :mod:`responses` (see
+#: :func:`install`), e.g. :meth:`stripe_mock.budget.CallCounter.record`
+listeners = []
+
+
+class Router(object):
+
+    """Fixed responses and callbacks, keyed by method and url.
+
+    Fixed responses are kept in layers of dicts, oldest first, shared by
+    the copies of a router: a copy only adds a layer with its own changes,
+    so it costs as much as the changes, not as the routes. As layers pile
+    up, the newest are merged into the ones below, the way a binary
+    counter carries, so a lookup goes through a logarithmic number of
+    them.
+    """
+
+    def __init__(self):
+        # frozen layers of (status, body) (or _REMOVED) by (method, url
+        # without query string, or with the exact query string it answers),
+        # and the layer of this version's changes
+        self._layers = ()
+        self._changes = {}
+        self.frozen = False
+        #: (method, compiled url pattern, callback), in registration order
+        self.callbacks = []
+
+    @property
+    def responses(self):
+        """(status, body) by (method, url without query string), merged
+        from the layers; built on each access, for inspection.
+
+        :rtype: dict
+        """
+        merged = {}
+        for layer in self._layers + (self._changes, ):
+            merged.update(layer)
+        return {
+            key: response
+            for key, response in merged.items() if response is not _REMOVED
+        }
+
+    @property
+    def methods(self):
+        """Methods with at least one route, sorted."""
+        return sorted(
+            {method for method, _ in self.responses}
+            | {method for method, _, _ in self.callbacks})
+
+    def copy(self):
+        """Return a new version of the router, to change and publish.
+
+        :rtype: :class:`Router`
+        """
+        router = Router()
+        router._layers = self._layers
+        if self._changes:
+            router._layers += (dict(self._changes), )
+        router.callbacks = list(self.callbacks)
+        return router
+
+    def freeze(self):
+        """Make the router read only, e.g. before publishing it.
+
+        :returns: the router
+        :rtype: :class:`Router`
+        """
+        layers = list(self._layers)
+        if self._changes:
+            layers.append(self._changes)
+        while (len(layers) > 1 and
+               len(layers[-2]) <= _MERGE_RATIO * len(layers[-1])):
+            newest = layers.pop()
+            merged = dict(layers.pop())
+            merged.update(newest)
+            if not layers:  # nothing left to remove from
+                merged = {
+                    key: response
+                    for key, response in merged.items()
+                    if response is not _REMOVED
+                }
+            layers.append(merged)
+        self._layers = tuple(layers)
+        self._changes = {}
+        self.callbacks = tuple(self.callbacks)
+        self.frozen = True
+        return self
+
+    def _check_writable(self):
+        if self.frozen:
+            raise RuntimeError(
+                'Frozen routers are read only, change a copy() instead')
+
+    def _response(self, key):
+        response = self._changes.get(key)
+        if response is None:
+            for layer in reversed(self._layers):
+                response = layer.get(key)
+                if response is not None:
+                    break
+        return None if response is _REMOVED else response
+
+    def add_response(self, method, url, body, status):
+        """Register a fixed response; the counterpart of
+        :func:`stripe_mock.helpers.add_response`.
+
+        :param method: GET, POST, DELETE, etc.
+        :type method: string
+        :param url: url, matched ignoring the query string; or with a query
+            string, answering that exact query before any callback
+        :type url: string
+        :param body: encoded right away, unless it already is
+        :type body: dict, bytes or :class:`~stripe_mock.encoding.JSONList`
+        :param status: http status to return
+        :type status: int
+        :returns: the encoded body, for reuse in list bodies
+        :rtype: bytes or :class:`~stripe_mock.encoding.JSONList`
+        """
+        self._check_writable()
+        if not isinstance(body, (bytes, JSONList)):
+            body = encode_json(body)
+        self._changes[(method, url)] = (status, body)
+        return body
+
+    def remove_response(self, method, url):
+        """Unregister a fixed response, if there's one.
+
+        :param method: GET, POST, DELETE, etc.
+        :type method: string
+        :param url: url, as registered
+        :type url: string
+        """
+        self._check_writable()
+        if self._layers:
+            self._changes[(method, url)] = _REMOVED
+        else:
+            self._changes.pop((method, url), None)
+
+    def add_callback(self, method, url, cb):
+        """Register a callback; the counterpart of
+        :func:`stripe_mock.helpers.add_callback`.
+
+        :param method: GET, POST, DELETE, etc.
+        :type method: string
+        :param url: url pattern, matched from the start of the url
+        :type url: string or compiled regex
+        :param cb: returns (status, headers, body), the body is encoded to
+            json
+        :type cb: callable
+
+        A callback for a method and pattern already routed replaces the
+        previous one, keeping its precedence.
+        """
+        self._check_writable()
+        if isinstance(url, str):
+            url = re.compile(r'{}(\?|$)'.format(re.escape(url)))
+        for i, (callback_method, pattern, _) in enumerate(self.callbacks):
+            if callback_method == method and pattern == url:
+                self.callbacks[i] = (method, url, cb)
+                return
+        self.callbacks.append((method, url, cb))
+
+    def resolve(self, method, url):
+        """Return the handler of a request, or None if nothing matches.
+
+        Fixed responses come first, except that a pattern matching into the
+        query string (e.g. ``?object=card``) is more specific than a fixed
+        response ignoring it. A fixed response registered with the request's
+        exact query string is the most specific.
+
+        :rtype: callable or None
+        """
+        path, _, query = url.partition('?')
+        if query:
+            response = self._response((method, url))
+            if response is not None:
+                return lambda request: (response[0], {}, response[1])
+            for callback_method, pattern, cb in self.callbacks:
+                if callback_method != method:
+                    continue
+                match = pattern.match(url)
+                if match and match.end() > len(path):
+                    return _callback_handler(cb)
+
+        response = self._response((method, path))
+        if response is not None:
+            return lambda request: (response[0], {}, response[1])
+
+        for callback_method, pattern, cb in self.callbacks:
+            if callback_method == method and pattern.match(url):
+                return _callback_handler(cb)
+        return None
+
+    def dispatch(self, request):
+        """Answer a request.
+
+        :param request: anything with ``method`` and ``url`` attributes, e.g.
+            a :class:`MockRequest` or a :class:`requests.PreparedRequest`
+        :returns: (status, headers, json body), or None if no route matches;
+            list bodies are :class:`~stripe_mock.encoding.JSONList` s, to
+            serve in chunks
+        :rtype: (int, dict, bytes or JSONList) or None
+        """
+        handler = self.resolve(request.method, request.url)
+        if handler is None:
+            return None
+        return handler(request)
+
+    def matches(self, request):
+        """Whether a route answers the request.
+
+        :rtype: bool
+        """
+        return self.resolve(request.method, request.url) is not None
+
+    def install(self):
+        """Serve the router's routes through the :mod:`responses` mock."""
+        install(self, self.methods)
+
+
+def install(dispatcher, methods):
+    """Serve a dispatcher through the :mod:`responses` mock.
+
+    One callback is registered per method, matching only the requests the
+    dispatcher answers, so mocks registered for other urls keep working.
+    Each request answered is then passed to the :data:`listeners`.
+
+    :param dispatcher: has ``matches(request)`` and ``dispatch(request)``,
+        like :class:`Router`
+    :param methods: GET, POST, DELETE, etc.
+    :type methods: iterable[string]
+    """
+    for method in methods:
+        responses.add_callback(
+            getattr(responses, method),
+            API_URL_RE,
+            callback=functools.partial(_responses_callback, dispatcher),
+            content_type='application/json',
+            match=[functools.partial(_responses_matcher, dispatcher)],
+        )
+
+
+def _responses_matcher(dispatcher, request):
+    if not dispatcher.matches(request):
+        return False, 'no stripe_mock route'
+    return True, ''
+
+
+def _responses_callback(dispatcher, request):
+    response = dispatcher.dispatch(request)
+    if response is None:  # routes changed since the match
+        raise requests.ConnectionError(
+            'No stripe_mock route for {} {}'.format(
+                request.method, request.url))
+    for listener in listeners:
+        listener(request)
+    status, headers, body = response
+    if isinstance(body, JSONList):
+        body = body_reader(body)
+    return status, headers, body
+
+
+def _callback_handler(cb):
+
+    def handler(request):
+        status, headers, body = cb(request)
+        return status, headers, encode_json(body)
+
+    return handler
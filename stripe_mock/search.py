@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""Stripe search query language and an inverted index to run it against.
+
+Supports the subset of https://stripe.com/docs/search#search-query-language
+that the mock's resources can answer:
+
+- ``field:'value'`` exact match, ``field~'value'`` substring match
+- ``field>10``, ``field<10``, ``field>=10``, ``field<=10`` numeric comparison
+- ``metadata['key']:'value'`` metadata lookups
+- ``-field:'value'`` negation
+- clauses joined by whitespace / ``AND``, or by ``OR`` (not both)
+"""
+import heapq
+import itertools
+import re
+import threading
+from collections import namedtuple
+
+from .records import peek
+
+#: maximum number of clauses stripe accepts in a query
+MAX_CLAUSES = 10
+
+Clause = namedtuple('Clause', ['field', 'operator', 'value', 'negated'])
+Query = namedtuple('Query', ['clauses', 'conjunction'])
+# what searches read of a SearchIndex, see SearchIndex._snapshot
+_Version = namedtuple('_Version', ['objects', 'postings', 'order'])
+
+_TOKEN_RE = re.compile(
+    r"""
+    \s*(?:
+        (?P<keyword>AND|OR)(?=\s)
+      | (?P<negate>-)?
+        (?P<field>
+            metadata\[(?P<mq>['"])(?P<key>(?:\\.|(?!(?P=mq)).)*)(?P=mq)\]
+          | \w+
+        )
+        (?P<operator>>=|<=|:|~|>|<)
+        (?P<value>
+            (?P<vq>['"])(?P<string>(?:\\.|(?!(?P=vq)).)*)(?P=vq)
+          | (?P<number>-?\d+(?:\.\d+)?)
+          | (?P<null>null)
+        )
+    )
+    """,
+    re.VERBOSE,
+)
+_UNESCAPE_RE = re.compile(r'\\(.)')
+
+
+class SearchQueryError(ValueError):
+
+    """Raised when a search query can't be parsed."""
+    pass
+
+
+def _unescape(value):
+    return _UNESCAPE_RE.sub(r'\1', value)
+
+
+def parse_query(query):
+    """Parse a stripe search query into a :class:`Query`.
+
+    Metadata fields are normalized to ``'metadata.{key}'``.
+
+    :param query: search query, e.g. ``email:'a@b.com' AND status:'active'``
+    :type query: string
+    :raises: :class:`SearchQueryError` on malformed queries
+    :rtype: :class:`Query`
+    """
+    clauses = []
+    conjunctions = set()
+    pos = 0
+    query = query.strip()
+    expect_clause = True
+
+    while pos < len(query):
+        match = _TOKEN_RE.match(query, pos)
+        if match is None or match.end() == pos:
+            raise SearchQueryError(
+                'Could not parse query at position {}: {}'.format(
+                    pos, query[pos:]))
+        pos = match.end()
+
+        if match.group('keyword'):
+            if expect_clause:
+                raise SearchQueryError(
+                    'Unexpected {} in query'.format(match.group('keyword')))
+            conjunctions.add(match.group('keyword'))
+            expect_clause = True
+            continue
+
+        if not expect_clause:  # bare whitespace is an implicit AND
+            conjunctions.add('AND')
+
+        if match.group('key') is not None:
+            field = 'metadata.{}'.format(_unescape(match.group('key')))
+        else:
+            field = match.group('field')
+
+        operator = match.group('operator')
+        if match.group('string') is not None:
+            value = _unescape(match.group('string'))
+        elif match.group('number') is not None:
+            number = match.group('number')
+            value = float(number) if '.' in number else int(number)
+        else:
+            value = None
+
+        if operator in ('>', '<', '>=', '<=') and \
+                not isinstance(value, (int, float)):
+            raise SearchQueryError(
+                'Operator {} requires a numeric value for {}'.format(
+                    operator, field))
+        if operator == '~' and not isinstance(value, str):
+            raise SearchQueryError(
+                'Operator ~ requires a string value for {}'.format(field))
+
+        clauses.append(
+            Clause(field, operator, value, bool(match.group('negate'))))
+        expect_clause = False
+
+    if not clauses or expect_clause and conjunctions:
+        raise SearchQueryError('Query is incomplete: {}'.format(query))
+    if len(conjunctions) > 1:
+        raise SearchQueryError('Cannot combine AND and OR in the same query')
+    if len(clauses) > MAX_CLAUSES:
+        raise SearchQueryError(
+            'Query cannot have more than {} clauses'.format(MAX_CLAUSES))
+
+    return Query(clauses, conjunctions.pop() if conjunctions else 'AND')
+
+
+def _field_value(obj, field):
+    if field.startswith('metadata.'):
+        return (peek(obj, 'metadata') or {}).get(field[len('metadata.'):])
+    return peek(obj, field)
+
+
+def _match_clause(obj, clause):
+    value = _field_value(obj, clause.field)
+    if clause.operator == ':':
+        return value == clause.value
+    if clause.operator == '~':
+        return isinstance(value, str) and clause.value in value
+    if not isinstance(value, (int, float)):
+        return False
+    if clause.operator == '>':
+        return value > clause.value
+    if clause.operator == '<':
+        return value < clause.value
+    if clause.operator == '>=':
+        return value >= clause.value
+    return value <= clause.value
+
+
+class SearchIndex(object):
+
+    """Inverted index over a store of stripe objects.
+
+    Every ``metadata`` key/value pair is indexed, as well as each field
+    named in ``fields``. Postings are sets of object ids, so exact-match
+    clauses resolve by set intersection/union; other operators only scan
+    the objects left after the indexed clauses have narrowed them down.
+
+    Objects are kept by reference, so the index must be refreshed via
+    :meth:`add` whenever a stored object is updated in place.
+
+    A search reads the version of the objects and postings current when
+    it starts, while :meth:`add` and :meth:`remove` go on: a version a
+    search read is copied by the next write instead of being changed.
+
+    :param fields: top-level object fields to index, e.g. ``('email',)``
+    :type fields: tuple[string]
+    """
+
+    def __init__(self, fields=()):
+        self.fields = tuple(fields)
+        # objects and postings by id, insertion order of the object ids
+        self._version = _Version({}, {}, {})
+        # whether a search read the version, which writes then copy
+        self._shared = False
+        # postings copied since, which writes may change
+        self._owned = set()
+        self._terms = {}
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._version.objects)
+
+    @property
+    def objects(self):
+        """Indexed objects by id, as of the last write.
+
+        :rtype: dict
+        """
+        return self._version.objects
+
+    @property
+    def postings(self):
+        """Ids of the objects by (field, value), as of the last write.
+
+        :rtype: dict
+        """
+        return self._version.postings
+
+    def _snapshot(self):
+        """Return the current version, for a search to read."""
+        with self._lock:
+            self._shared = True
+            return self._version
+
+    def _writable(self):
+        """Return the version writes may change, a copy of the current one
+        if a search read it."""
+        if self._shared:
+            objects, postings, order = self._version
+            self._version = _Version(
+                dict(objects), dict(postings), dict(order))
+            self._shared = False
+            self._owned = set()
+        return self._version
+
+    def _posting(self, version, term):
+        """Return the ids of a term's posting, that writes may change."""
+        if term not in self._owned:
+            ids = version.postings.get(term)
+            version.postings[term] = set() if ids is None else set(ids)
+            self._owned.add(term)
+        return version.postings[term]
+
+    def _object_terms(self, obj):
+        terms = [(field, peek(obj, field)) for field in self.fields]
+        for key, value in (peek(obj, 'metadata') or {}).items():
+            terms.append(('metadata.{}'.format(key), value))
+        return [(field, value) for field, value in terms if value is not None]
+
+    def add(self, obj):
+        """Index (or re-index) an object.
+
+        :param obj: stripe object, must have an ``id``
+        :type obj: dict
+        """
+        object_id = obj['id']
+        terms = self._object_terms(obj)
+        with self._lock:
+            version = self._writable()
+            if object_id in self._terms:
+                self._unindex(version, object_id)
+            else:
+                version.order[object_id] = self._counter
+                self._counter += 1
+
+            for term in terms:
+                try:
+                    self._posting(version, term).add(object_id)
+                except TypeError:  # unhashable value, e.g. a nested dict
+                    continue
+            self._terms[object_id] = terms
+            version.objects[object_id] = obj
+
+    def remove(self, object_id):
+        """Drop an object from the index, if present.
+
+        :param object_id: id of stripe object
+        :type object_id: string
+        """
+        with self._lock:
+            if object_id not in self._terms:
+                return
+            version = self._writable()
+            self._unindex(version, object_id)
+            del self._terms[object_id]
+            del version.order[object_id]
+            del version.objects[object_id]
+
+    def _unindex(self, version, object_id):
+        for term in self._terms[object_id]:
+            try:
+                if term not in version.postings:
+                    continue
+            except TypeError:
+                continue
+            ids = self._posting(version, term)
+            ids.discard(object_id)
+            if not ids:
+                del version.postings[term]
+                self._owned.discard(term)
+
+    def _is_indexed(self, clause):
+        return clause.operator == ':' and clause.value is not None and (
+            clause.field in self.fields or
+            clause.field.startswith('metadata.'))
+
+    def _clause_ids(self, version, clause, candidates=None):
+        objects = version.objects
+        if self._is_indexed(clause):
+            try:
+                ids = version.postings.get(
+                    (clause.field, clause.value), set())
+            except TypeError:
+                ids = set()
+        else:
+            pool = objects if candidates is None else candidates
+            ids = {
+                object_id for object_id in pool
+                if _match_clause(objects[object_id], clause)
+            }
+        if clause.negated:
+            pool = objects.keys() if candidates is None else candidates
+            return set(pool) - ids
+        return ids if candidates is None else ids & candidates
+
+    def match(self, query):
+        """Return the set of object ids matching a query.
+
+        :param query: query string or already parsed query
+        :type query: string or :class:`Query`
+        :rtype: set[string]
+        """
+        return self._match(self._snapshot(), query)
+
+    def _match(self, version, query):
+        if not isinstance(query, Query):
+            query = parse_query(query)
+
+        if query.conjunction == 'OR':
+            ids = set()
+            for clause in query.clauses:
+                ids |= self._clause_ids(version, clause)
+            return ids
+
+        # resolve cheap, selective posting lookups first
+        clauses = sorted(
+            query.clauses,
+            key=lambda c: not self._is_indexed(c) or c.negated)
+        ids = None
+        for clause in clauses:
+            ids = self._clause_ids(version, clause, ids)
+            if not ids:
+                break
+        return ids
+
+    def search(self, query, limit=10, page=None):
+        """Run a query and return one page of matching objects.
+
+        Results come back in insertion order. ``page`` is the opaque cursor
+        returned as ``next_page`` of the previous call.
+
+        :param query: stripe search query
+        :type query: string
+        :param limit: page size
+        :type limit: int
+        :param page: cursor from a previous page
+        :type page: string or None
+        :returns: (objects on page, total matches, next page cursor or None)
+        :rtype: (list[dict], int, string or None)
+        """
+        try:
+            offset = int(page) if page else 0
+        except ValueError:
+            raise SearchQueryError('Invalid page: {}'.format(page))
+
+        version = self._snapshot()
+        objects = version.objects
+        ids = self._match(version, query)
+        end = offset + limit
+        if (end + 1) * len(objects) < len(ids) * len(ids):
+            # dense result: walking the store in insertion order reaches
+            # the page sooner than ranking every match
+            window = list(
+                itertools.islice(
+                    (i for i in objects if i in ids), end + 1))
+        else:
+            window = heapq.nsmallest(
+                end + 1, ids, key=version.order.__getitem__)
+        data = [objects[object_id] for object_id in window[offset:end]]
+        next_page = str(end) if len(window) > end else None
+        return data, len(ids), next_page
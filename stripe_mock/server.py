@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Serve a :class:`StripeMockAPI` over HTTP, for clients outside the process.
+
+Requests are answered by :meth:`StripeMockAPI.dispatch`, from the same
+routes :meth:`StripeMockAPI.sync` registers for in-process tests, so both
+modes answer identically. Point a client at it with e.g.
+``stripe.api_base = 'http://127.0.0.1:12111'``.
+"""
+import http.server
+
+from .encoding import encode_json, iter_body
+from .patterns import API_BASE
+from .response_callbacks import unrecognized_request_url
+from .router import MockRequest
+
+#: the port stripe's own stripe-mock listens on
+DEFAULT_PORT = 12111
+
+
+class StripeMockRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    """Answer requests from the routes of the server's API."""
+
+    protocol_version = 'HTTP/1.1'
+    quiet = False
+
+    def do_GET(self):
+        self._relay('GET')
+
+    def do_POST(self):
+        self._relay('POST')
+
+    def do_DELETE(self):
+        self._relay('DELETE')
+
+    def _relay(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        request = MockRequest(
+            method,
+            '{}{}'.format(API_BASE, self.path),
+            dict(self.headers.items()),
+            self.rfile.read(length) if length else None,
+        )
+
+        response = self.server.api.dispatch(request)
+        if response is None:
+            status, _, body = unrecognized_request_url(method, self.path)
+            body = encode_json(body)
+        else:
+            status, _, body = response
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        # list bodies are written a chunk at a time
+        for chunk in iter_body(body):
+            self.wfile.write(chunk)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+class StripeMockServer(http.server.ThreadingHTTPServer):
+
+    """Threaded HTTP server for a :class:`StripeMockAPI`.
+
+    The API's routes are built on start; call :meth:`StripeMockAPI.refresh`
+    to pick up objects added later.
+
+    :param api: the mock whose stores are served
+    :type api: :class:`StripeMockAPI`,
+        :class:`~stripe_mock.accounts.ConnectedAccounts` or
+        :class:`~stripe_mock.faults.FaultInjector`; injected latency
+        only holds up the connection's own thread
+    :param address: (host, port) to listen on
+    :type address: (string, int)
+    :param workers: render the responses across this many processes
+    :type workers: int
+    """
+
+    daemon_threads = True
+    # load tests open connections in bursts; the default backlog is 5
+    request_queue_size = 128
+
+    def __init__(self, api, address=('127.0.0.1', DEFAULT_PORT),
+                 handler_class=StripeMockRequestHandler, workers=None):
+        super().__init__(address, handler_class)
+        self.api = api
+        api.refresh(workers=workers)
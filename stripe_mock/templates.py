@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""Byte-level templates of the :mod:`~stripe_mock.fake` factories.
+
+Most of a ``fake_*`` payload is constant; only the ids passed to the
+factory, and the fields overridden through its keyword arguments, change.
+A :class:`ResponseTemplate` encodes the factory's output once, with slots
+where the ids go, so rendering an object fills the slots and joins bytes
+instead of building a dict and encoding it::
+
+    TEMPLATES['customer'].render('cus_123', email='a@example.com')
+
+The result is byte-identical to
+``encode_json(fake_customer('cus_123', email='a@example.com'))``. Run
+``python -m stripe_mock bench-render`` for the speedup.
+
+Templates are for responses built from factory arguments, e.g. passed to
+:func:`stripe_mock.helpers.add_response` directly. :meth:`StripeMockAPI.sync`
+doesn't use them: it encodes stored objects, not factory arguments, and
+telling which fields of a stored object still hold their default costs
+about as much as encoding them. Fixtures from
+:mod:`stripe_mock.generate`, which override most fields, encode faster
+with :func:`~stripe_mock.encoding.encode_json` alone.
+
+The factories generated from the OpenAPI spec (see
+:mod:`stripe_mock.codegen`) are compiled on first use rather than on
+import, there being one per resource of the spec.
+"""
+import json
+import re
+
+from .encoding import encode_json
+from .fake import (
+    fake_coupon,
+    fake_customer,
+    fake_customer_discount,
+    fake_customer_source,
+    fake_customer_source_bank_account,
+    fake_customer_source_card,
+    fake_plan,
+    fake_subscription,
+)
+from .generated import FACTORIES
+
+_ITEM_SEPARATOR = b', '
+# ids json encodes as is
+_PLAIN_STRING_RE = re.compile(r'[ !#-\[\]-~]*$')
+
+
+def _marker(i):
+    return '\x00stripe_mock:slot{}\x00'.format(i)
+
+
+def _string_body(value):
+    """Encoded string without its quotes, as it appears inside a string."""
+    if _PLAIN_STRING_RE.match(value):
+        return value.encode('ascii')
+    return json.dumps(value)[1:-1].encode('utf-8')
+
+
+def _split(encoded, markers):
+    """Split encoded json into literal bytes and slot numbers."""
+    pieces = [encoded]
+    for i, marker in enumerate(markers):
+        split = []
+        for piece in pieces:
+            if not isinstance(piece, bytes):
+                split.append(piece)
+                continue
+            parts = piece.split(marker)
+            for part in parts[:-1]:
+                split.extend((part, i))
+            split.append(parts[-1])
+        pieces = split
+    return tuple(piece for piece in pieces if piece != b'')
+
+
+class ResponseTemplate(object):
+
+    """A ``fake_*`` factory compiled to encoded json with slots.
+
+    :param factory: the factory, taking the ids as positional arguments
+    :type factory: callable
+    :param arity: number of positional (id) arguments
+    :type arity: int
+    :raises: :class:`ValueError` if the factory transforms its arguments
+        in a way slots can't reproduce
+    """
+
+    def __init__(self, factory, arity):
+        self.factory = factory
+        self.arity = arity
+
+        markers = [_marker(i) for i in range(arity)]
+        encoded_markers = [_string_body(marker) for marker in markers]
+        sample = factory(*markers)
+
+        #: (key, encoded '"key": ' prefix, pieces of the default item)
+        self.fields = []
+        for key, value in sample.items():
+            prefix = encode_json(key) + b': '
+            self.fields.append((
+                key,
+                prefix,
+                _merge(
+                    (prefix, ) + _split(encode_json(value), encoded_markers)),
+            ))
+        self.keys = frozenset(sample)
+
+        # the whole default object, for renders without overrides
+        pieces = [b'{']
+        for i, (_, _, item_pieces) in enumerate(self.fields):
+            if i:
+                pieces.append(_ITEM_SEPARATOR)
+            pieces.extend(item_pieces)
+        pieces.append(b'}')
+        self.pieces = _merge(pieces)
+
+        probe = tuple('probe_"é{}'.format(i) for i in range(arity))
+        if self.render(*probe) != encode_json(factory(*probe)):
+            raise ValueError(
+                '{} can not be compiled to a template'.format(
+                    factory.__name__))
+
+    def render(self, *args, **overrides):
+        """Return the encoded factory output for args and overrides.
+
+        Falls back to calling the factory for ids that aren't strings.
+
+        :rtype: bytes
+        """
+        if len(args) != self.arity:
+            return encode_json(self.factory(*args, **overrides))
+        values = []
+        for arg in args:
+            if type(arg) is not str:
+                return encode_json(self.factory(*args, **overrides))
+            values.append(_string_body(arg))
+
+        if not overrides:
+            return b''.join([
+                piece if type(piece) is bytes else values[piece]
+                for piece in self.pieces
+            ])
+
+        out = []
+        for key, prefix, item_pieces in self.fields:
+            if key in overrides:
+                out.append(prefix + encode_json(overrides[key]))
+            elif len(item_pieces) == 1:
+                out.append(item_pieces[0])
+            else:
+                out.append(b''.join([
+                    piece if type(piece) is bytes else values[piece]
+                    for piece in item_pieces
+                ]))
+        for key, value in overrides.items():
+            if key not in self.keys:
+                out.append(encode_json(key) + b': ' + encode_json(value))
+        return b'{' + _ITEM_SEPARATOR.join(out) + b'}'
+
+
+def _merge(pieces):
+    """Join runs of literal bytes, leaving the slot numbers in between."""
+    merged = []
+    for piece in pieces:
+        if type(piece) is bytes and merged and type(merged[-1]) is bytes:
+            merged[-1] += piece
+        else:
+            merged.append(piece)
+    return tuple(merged)
+
+
+#: template by the ``object`` field of the objects they render
+TEMPLATES = {
+    'bank_account': ResponseTemplate(fake_customer_source_bank_account, 2),
+    'card': ResponseTemplate(fake_customer_source_card, 2),
+    'coupon': ResponseTemplate(fake_coupon, 1),
+    'customer': ResponseTemplate(fake_customer, 1),
+    'discount': ResponseTemplate(fake_customer_discount, 2),
+    'plan': ResponseTemplate(fake_plan, 1),
+    'source': ResponseTemplate(fake_customer_source, 2),
+    'subscription': ResponseTemplate(fake_subscription, 2),
+}
+
+
+# templates of the generated factories, compiled on first use
+_GENERATED_TEMPLATES = {}
+
+
+def template(object_type):
+    """Return the template of an object type.
+
+    :param object_type: e.g. 'customer', see :data:`TEMPLATES`, or a
+        resource of :data:`stripe_mock.generated.FACTORIES`
+    :type object_type: string
+    :raises: :class:`KeyError` for unknown object types
+    :rtype: :class:`ResponseTemplate`
+    """
+    response_template = TEMPLATES.get(object_type)
+    if response_template is None:
+        response_template = _GENERATED_TEMPLATES.get(object_type)
+    if response_template is None:
+        response_template = _GENERATED_TEMPLATES[object_type] = (
+            ResponseTemplate(FACTORIES[object_type], 1))
+    return response_template
+
+
+def render(object_type, *args, **overrides):
+    """Render a stripe object of the given type through its template.
+
+    :param object_type: e.g. 'customer', see :func:`template`
+    :type object_type: string
+    :rtype: bytes
+    """
+    return template(object_type).render(*args, **overrides)
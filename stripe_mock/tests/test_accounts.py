@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+
+import pytest
+import responses
+import stripe
+
+from ..accounts import ConnectedAccounts
+from ..router import MockRequest
+
+CUSTOMER_URL = 'https://api.stripe.com/v1/customers/{}'
+
+
+def _add_plan(api, account_id):
+    api.add_plan('basic_{}'.format(account_id))
+
+
+@responses.activate
+def test_connected_accounts():
+    accounts = ConnectedAccounts(fixture=_add_plan)
+    accounts.platform.add_customer('cus_platform')
+    accounts['acct_1'].add_customer('cus_1')
+    accounts['acct_2'].add_customer('cus_2')
+    accounts.sync()
+
+    assert stripe.Customer.retrieve('cus_platform').id == 'cus_platform'
+    assert stripe.Customer.retrieve('cus_1', stripe_account='acct_1').id == (
+        'cus_1')
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Customer.retrieve('cus_1', stripe_account='acct_2')
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Customer.retrieve('cus_1')
+
+    # created on first request, with the fixture
+    plans = stripe.Plan.list(stripe_account='acct_3')
+    assert [p.id for p in plans.data] == ['basic_acct_3']
+    assert 'acct_3' in accounts
+
+
+def test_dispatch_and_eviction():
+    accounts = ConnectedAccounts(max_accounts=2)
+    accounts['acct_1'].add_customer('cus_1')
+    accounts['acct_2']
+    accounts['acct_1']  # most recently used
+    accounts['acct_3']
+    assert list(accounts.accounts) == ['acct_1', 'acct_3']
+
+    request = MockRequest(
+        'GET', CUSTOMER_URL.format('cus_1'), {'stripe-account': 'acct_1'})
+    assert accounts.dispatch(request)[0] == 200
+    assert accounts.dispatch(request._replace(headers={}))[0] == 404
+
+    assert accounts.evict('acct_1')
+    assert not accounts.evict('acct_1')
+    assert accounts.dispatch(request)[0] == 404
+    assert accounts['acct_1'].customers == []
+
+
+def test_concurrent_use_and_eviction():
+    accounts = ConnectedAccounts(max_accounts=2)
+    errors = []
+
+    def use(offset):
+        try:
+            for i in range(2000):
+                account_id = 'acct_{}'.format((i + offset) % 3)
+                accounts.account(account_id)
+                accounts.evict(account_id)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=use, args=(i, )) for i in range(4)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads as often as possible
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+    assert len(accounts.accounts) <= 2
+
+
+def test_compact_partitions():
+    accounts = ConnectedAccounts()
+    first = accounts['acct_1']
+    second = accounts['acct_2']
+    first.add_customer('cus_1')
+    second.add_customer('cus_1')
+
+    assert first.compact
+    assert first.customers[0] is not second.customers[0]
+    # unset fields read the one shared template
+    assert type(first.customers[0])._template is type(
+        second.customers[0])._template
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+
+import pytest
+import responses
+import stripe
+
+from .. import router
+from ..budget import BudgetExceeded, CallCounter, route_name
+from ..mock_api import StripeMockAPI
+
+BASE = 'https://api.stripe.com'
+
+
+@pytest.mark.parametrize('method, path, name', [
+    ('GET', '/v1/customers/cus_1', 'customer_retrieve'),
+    ('GET', '/v1/customers?limit=3', 'customer_list'),
+    ('GET', '/v1/customers/search?query=x', 'customer_search'),
+    ('POST', '/v1/customers', 'customer_create'),
+    ('POST', '/v1/customers/cus_1', 'customer_update'),
+    ('DELETE', '/v1/subscriptions/sub_1', 'subscription_delete'),
+    ('GET', '/v1/customers/cus_1/sources?object=card',
+     'customer_source_list'),
+    ('DELETE', '/v1/customers/cus_1/discount', 'customer_discount_delete'),
+    ('GET', '/v1/subscription_items/si_1/usage_record_summaries',
+     'subscription_item_usage_record_summary_list'),
+    ('GET', '/v1/checkout/sessions/cs_1', 'checkout_session_retrieve'),
+    ('POST', '/v1/invoices/in_1/pay', 'invoice_pay'),
+    ('GET', '/', 'get'),
+])
+def test_route_name(method, path, name):
+    assert route_name(method, BASE + path) == name
+
+
+@responses.activate
+@pytest.mark.parametrize('auto_sync', [False, True])
+def test_call_counter(auto_sync):
+    api = StripeMockAPI(auto_sync=auto_sync)
+    api.add_customer('cus_1')
+    api.add_customer('cus_2')
+    api.sync()
+
+    with CallCounter() as calls:
+        for customer in stripe.Customer.list():
+            stripe.Customer.retrieve(customer.id)
+        with pytest.raises(stripe.error.InvalidRequestError):
+            stripe.Customer.retrieve('cus_nope')
+    stripe.Customer.list()
+    assert router.listeners == []
+
+    assert calls.counts == {'customer_list': 1, 'customer_retrieve': 3}
+    assert calls.total == 4
+    assert calls.format_counts(1) == 'customer_retrieve=3'
+    calls.check(total=4, customer_list=1)
+    assert calls.overruns(total=3, customer_retrieve=1, plan_list=0) == [
+        ('customer_retrieve', 3, 1), ('total', 4, 3)]
+    with pytest.raises(BudgetExceeded) as e:
+        calls.check(customer_retrieve=2)
+    assert e.value.overruns == [('customer_retrieve', 3, 2)]
+    calls.reset()
+    assert calls.total == 0
+
+
+PLUGIN_TESTS = '''
+import pytest
+import responses
+import stripe
+
+from stripe_mock.mock_api import StripeMockAPI
+
+stripe.api_key = 'sk_test'
+
+
+@pytest.fixture
+def api():
+    responses.start()
+    api = StripeMockAPI()
+    for i in range(3):
+        api.add_customer('cus_{}'.format(i))
+    api.sync()
+    yield api
+    responses.stop()
+    responses.reset()
+
+
+@pytest.mark.stripe_budget(customer_retrieve=1)
+def test_n_plus_one(api):
+    for customer in stripe.Customer.list():
+        stripe.Customer.retrieve(customer.id)
+
+
+@pytest.mark.stripe_budget(total=1)
+def test_within_budget(api, stripe_calls):
+    stripe.Customer.list()
+    assert stripe_calls.counts == {'customer_list': 1}
+
+
+def test_no_calls():
+    pass
+'''
+
+
+def test_plugin(tmp_path):
+    (tmp_path / 'test_billing.py').write_text(PLUGIN_TESTS)
+    process = subprocess.run(
+        [sys.executable, '-m', 'pytest', '-p', 'stripe_mock.pytest_plugin',
+         '-p', 'no:cacheprovider', '--rootdir', str(tmp_path),
+         str(tmp_path)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        env=dict(os.environ, PYTHONPATH=':'.join(sys.path)),
+    )
+    output = process.stdout
+    assert process.returncode == 1, output
+    assert '1 failed, 2 passed' in output
+    assert ('Stripe call budget exceeded: customer_retrieve made 3 calls, '
+            'budget 1') in output
+    report = output.split('most stripe calls')[1].splitlines()
+    assert report[1].split() == [
+        '4', 'test_billing.py::test_n_plus_one',
+        '(customer_retrieve=3,', 'customer_list=1)']
+    assert report[2].split() == [
+        '1', 'test_billing.py::test_within_budget', '(customer_list=1)']
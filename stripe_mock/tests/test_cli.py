@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import urllib.request
+
+from ..cli import deep_sizeof, main, percentiles
+from ..dataset import load_dataset, read_dataset
+from ..mock_api import StripeMockAPI
+from ..server import StripeMockRequestHandler, StripeMockServer
+
+
+def test_generate_and_stats(tmp_path, capsys):
+    path = str(tmp_path / 'fixture.jsonl.gz')
+    main(['generate', path, '-n', '20', '--subscriptions', '2'])
+    objects = list(read_dataset(path))
+    assert sum(1 for obj in objects if obj['object'] == 'customer') == 20
+
+    main(['stats', path])
+    out = capsys.readouterr().out
+    assert 'subscriptions             40' in out
+    assert 'subscription' in out.split('resource')[1]
+
+
+def test_bench(tmp_path, capsys):
+    path = str(tmp_path / 'fixture.jsonl')
+    folded = str(tmp_path / 'bench.folded')
+    main(['generate', path, '-n', '5'])
+    main([
+        'bench', path, '--requests', '3', '--list-requests', '1',
+        '--workers', '2', '--profile', folded
+    ])
+    out = capsys.readouterr().out
+    assert 'customer.retrieve' in out
+    assert 'subscription.list' in out
+    assert '    render' in out
+    with open(folded) as f:
+        assert any(line.startswith('sync;refresh;render;pool ') for line in f)
+
+
+def test_bench_render(capsys):
+    main(['bench-render', '--number', '10'])
+    out = capsys.readouterr().out
+    assert 'template us' in out
+    assert 'subscription' in out
+
+
+def test_serve(tmp_path):
+    path = str(tmp_path / 'fixture.jsonl')
+    main(['generate', path, '-n', '3'])
+    api = StripeMockAPI()
+    load_dataset(api, path)
+    customer_id = api.customers[0]['id']
+
+    class QuietHandler(StripeMockRequestHandler):
+        quiet = True
+
+    server = StripeMockServer(api, ('127.0.0.1', 0), QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = 'http://127.0.0.1:{}/v1/customers/{}'.format(
+            server.server_address[1], customer_id)
+        with urllib.request.urlopen(url) as response:
+            assert json.loads(response.read().decode('utf-8'))['id'] == \
+                customer_id
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_helpers():
+    assert percentiles(list(range(100)), (50, 99)) == [50, 99]
+    shared = {'a': 1}
+    seen = set()
+    first = deep_sizeof([shared], seen)
+    assert deep_sizeof([shared], seen) < first
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import calendar
+from datetime import datetime
+
+import pytest
+
+from ..clock import TestClock, add_interval
+from ..fake import fake_subscription
+
+
+def _ts(*args):
+    return calendar.timegm(datetime(*args).utctimetuple())
+
+
+def test_add_interval():
+    assert add_interval(_ts(2018, 1, 31), 'month') == _ts(2018, 2, 28)
+    assert add_interval(_ts(2018, 1, 15), 'month', 3) == _ts(2018, 4, 15)
+    assert add_interval(_ts(2016, 2, 29), 'year') == _ts(2017, 2, 28)
+    assert add_interval(_ts(2018, 1, 1), 'week', 2) == _ts(2018, 1, 15)
+
+
+def test_clock_renews_subscriptions():
+    clock = TestClock(_ts(2018, 1, 1))
+    subscription = fake_subscription(
+        'cus_ok',
+        'sub_ok',
+        current_period_start=_ts(2018, 1, 1),
+        current_period_end=_ts(2018, 2, 1),
+    )
+    clock.schedule(subscription)
+
+    assert clock.advance(_ts(2018, 1, 20)) == []
+    assert clock.advance(_ts(2019, 1, 1)) == [subscription]
+    assert subscription['current_period_start'] == _ts(2019, 1, 1)
+    assert subscription['current_period_end'] == _ts(2019, 2, 1)
+
+    with pytest.raises(ValueError):
+        clock.advance(_ts(2018, 6, 1))
+
+
+def test_clock_trial_and_cancel():
+    clock = TestClock(_ts(2018, 1, 1))
+    subscription = fake_subscription(
+        'cus_ok',
+        'sub_ok',
+        status='trialing',
+        trial_end=_ts(2018, 1, 15),
+    )
+    # canceled when the trial ends, not after a period
+    trial = fake_subscription(
+        'cus_ok',
+        'sub_trial',
+        status='trialing',
+        trial_end=_ts(2018, 1, 15),
+        cancel_at_period_end=True,
+    )
+    clock.schedule(subscription)
+    clock.schedule(trial)
+
+    clock.advance(_ts(2018, 1, 16))
+    assert subscription['status'] == 'active'
+    assert subscription['current_period_end'] == _ts(2018, 2, 15)
+    assert trial['status'] == 'canceled'
+    assert trial['ended_at'] == _ts(2018, 1, 15)
+
+    subscription['cancel_at_period_end'] = True
+    clock.advance(_ts(2018, 3, 1))
+    assert subscription['status'] == 'canceled'
+    assert subscription['ended_at'] == _ts(2018, 2, 15)
+    assert len(clock) == 0
+
+
+def test_clock_unstored_plan():
+    clock = TestClock(_ts(2018, 1, 1))
+    subscription = fake_subscription(
+        'cus_ok',
+        'sub_ok',
+        plan='gold',
+        current_period_start=_ts(2018, 1, 1),
+        current_period_end=_ts(2018, 2, 1),
+    )
+    clock.schedule(subscription)
+    clock.advance(_ts(2018, 2, 2))
+    assert subscription['current_period_end'] == _ts(2018, 3, 1)
+
+
+def test_clock_reschedule():
+    clock = TestClock(_ts(2018, 1, 1))
+    subscription = fake_subscription(
+        'cus_ok', 'sub_ok', current_period_end=_ts(2018, 2, 1))
+    clock.schedule(subscription)
+
+    subscription['status'] = 'canceled'
+    clock.schedule(subscription)
+    assert clock.advance(_ts(2018, 3, 1)) == []
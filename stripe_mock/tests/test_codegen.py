@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from .. import codegen
+from ..cli import main
+from ..encoding import encode_json
+from ..generated import FACTORIES, fake_price
+from ..templates import render
+
+SPEC = {
+    'components': {
+        'schemas': {
+            'widget': {
+                'properties': {
+                    'created': {'format': 'unix-time', 'type': 'integer'},
+                    'currency': {'format': 'currency', 'type': 'string'},
+                    'id': {'type': 'string'},
+                    'object': {'enum': ['widget'], 'type': 'string'},
+                    'owner': {
+                        'anyOf': [{'type': 'string'},
+                                  {'$ref': '#/components/schemas/widget'}],
+                        'nullable': True,
+                    },
+                    'parts': {'items': {'type': 'string'}, 'type': 'array'},
+                    'size': {'$ref': '#/components/schemas/size'},
+                    'status': {'enum': ['new', 'used'], 'type': 'string'},
+                },
+                'type': 'object',
+                'x-resourceId': 'widget',
+            },
+            'size': {
+                'properties': {
+                    'inner': {'$ref': '#/components/schemas/size'},
+                    'width': {'type': 'number'},
+                },
+                'type': 'object',
+            },
+        },
+    },
+    'info': {'version': '2017-08-15'},
+    'paths': {
+        '/v1/widgets': {'get': {'responses': {'200': {'content': {
+            'application/json': {'schema': {'properties': {'data': {
+                'items': {'$ref': '#/components/schemas/widget'},
+            }}}},
+        }}}}},
+        '/v1/widgets/{widget}': {'get': {'responses': {'200': {'content': {
+            'application/json': {
+                'schema': {'$ref': '#/components/schemas/widget'},
+            },
+        }}}}},
+        '/v1/widgets/{widget}/parts': {'get': {'responses': {}}},
+    },
+}
+
+
+def test_default_object():
+    assert codegen.default_object(SPEC, 'widget', 'wdg_1') == {
+        'created': codegen.DEFAULT_TIMESTAMP,
+        'currency': 'usd',
+        'id': 'wdg_1',
+        'object': 'widget',
+        'owner': None,
+        'parts': [],
+        # self references stop at the first nesting
+        'size': {'inner': None, 'width': 0.0},
+        'status': 'new',
+    }
+
+
+def test_routes():
+    assert codegen.routes(SPEC) == [
+        ('GET', '/v1/widgets', 'widget', 'list'),
+        ('GET', '/v1/widgets/{widget}', 'widget', 'retrieve'),
+    ]
+
+
+def test_generate():
+    namespace = {}
+    exec(codegen.generate(SPEC), namespace)
+    assert namespace['FACTORIES'] == {'widget': namespace['fake_widget']}
+    widget = namespace['fake_widget']('wdg_1', status='used')
+    assert widget['status'] == 'used' and widget['id'] == 'wdg_1'
+    # each call gets its own mutable defaults
+    assert namespace['fake_widget']('wdg_2')['size'] is not widget['size']
+
+
+def test_generated_module_up_to_date():
+    with open(codegen.OUTPUT_PATH) as f:
+        assert f.read() == codegen.generate(codegen.load_spec())
+
+
+def test_cli(tmp_path, capsys):
+    output = str(tmp_path / 'generated.py')
+    with pytest.raises(SystemExit):
+        main(['codegen', '--output', output, '--check'])
+    main(['codegen', '--output', output])
+    main(['codegen', '--output', output, '--check'])
+    assert capsys.readouterr().out.endswith('up to date\n')
+
+
+def test_generated_templates():
+    assert 'tax_rate' in FACTORIES
+    assert render('price', 'price_1', unit_amount=5) == encode_json(
+        fake_price('price_1', unit_amount=5))
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+import responses
+import stripe
+
+from ..clock import DEFAULT_FROZEN_TIME, add_interval
+from ..discounts import CouponRedemptionError
+from ..encoding import encode_json
+from ..mock_api import StripeMockAPI
+from ..server import StripeMockRequestHandler, StripeMockServer
+
+
+def _api(compact=False, **coupon_kwargs):
+    api = StripeMockAPI(compact=compact)
+    api.add_coupon('half', **coupon_kwargs)
+    for i in range(3):
+        api.add_customer('cus_{}'.format(i))
+        api.add_subscription('cus_{}'.format(i), 'sub_{}'.format(i))
+    return api
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_apply_coupon(compact):
+    api = _api(compact, max_redemptions=2, duration='repeating',
+               duration_in_months=3)
+    coupon = api.coupons[0]
+
+    discount = api.apply_coupon('half', 'cus_0', 'sub_0')
+    assert discount['coupon'] is coupon
+    assert discount['subscription'] == 'sub_0'
+    assert discount['end'] == add_interval(discount['start'], 'month', 3)
+    assert api.find_subscription('sub_0')['discount'] is discount
+    assert api.subscription_discounts == {'sub_0': discount}
+
+    api.apply_coupon('half', 'cus_1')
+    assert api.customers[1]['discount']['subscription'] is None
+    assert coupon['times_redeemed'] == 2
+    assert not coupon['valid']
+
+    # rendered from the coupon, not a copy of it
+    rendered = json.loads(encode_json(api.find_subscription('sub_0')))
+    assert rendered['discount']['coupon']['times_redeemed'] == 2
+
+    with pytest.raises(CouponRedemptionError) as e:
+        api.apply_coupon('half', 'cus_2')
+    assert str(e.value) == 'Coupon half has reached its max_redemptions'
+    with pytest.raises(CouponRedemptionError):
+        api.apply_coupon('nope', 'cus_2')
+    with pytest.raises(KeyError):
+        api.apply_coupon('half', 'cus_nope')
+
+    assert api.remove_discount('cus_1') is not None
+    assert api.customers[1]['discount'] is None
+    assert api.remove_discount('cus_1') is None
+    assert [e['type'] for e in api.events.events][-3:] == [
+        'customer.discount.created',
+        'customer.discount.created',
+        'customer.discount.deleted',
+    ]
+
+
+@responses.activate
+def test_redeem_by():
+    api = _api(redeem_by=DEFAULT_FROZEN_TIME + 10)
+    api.apply_coupon('half', 'cus_0')
+    api.sync()
+    api.advance_clock(DEFAULT_FROZEN_TIME + 11)
+    with pytest.raises(CouponRedemptionError) as e:
+        api.apply_coupon('half', 'cus_1')
+    assert str(e.value) == 'Coupon expired: half'
+    assert api.coupons[0]['valid'] is False
+    # the coupon, and the discounts embedding it, are served invalid
+    assert stripe.Coupon.retrieve('half').valid is False
+    assert stripe.Customer.retrieve('cus_0').discount.coupon.valid is False
+
+
+@responses.activate
+def test_coupon_requests():
+    api = _api(max_redemptions=2)
+    api.sync()
+
+    customer = stripe.Customer.modify('cus_0', coupon='half')
+    assert customer.discount.coupon.times_redeemed == 1
+    subscription = stripe.Subscription.modify('sub_1', coupon='half')
+    assert subscription.discount.coupon.id == 'half'
+
+    # retrieves of the updated objects and the coupon see the redemptions
+    assert stripe.Coupon.retrieve('half').times_redeemed == 2
+    assert stripe.Subscription.retrieve('sub_1').discount.subscription == (
+        'sub_1')
+    assert stripe.Customer.retrieve('cus_0').discount.customer == 'cus_0'
+    # as do the earlier discounts of the coupon
+    assert stripe.Customer.retrieve(
+        'cus_0').discount.coupon.times_redeemed == 2
+    listed = {c.id: c for c in stripe.Customer.list()}
+    assert listed['cus_0'].discount.coupon.times_redeemed == 2
+
+    with pytest.raises(stripe.error.InvalidRequestError) as e:
+        stripe.Customer.modify('cus_2', coupon='half')
+    assert e.value.param == 'coupon'
+    # only coupons are applied, other updates are refused
+    with pytest.raises(stripe.error.InvalidRequestError) as e:
+        stripe.Subscription.modify(
+            'sub_2', coupon='', metadata={'plan': 'gold'})
+    assert e.value.param == 'metadata[plan]'
+    with pytest.raises(stripe.error.InvalidRequestError) as e:
+        stripe.Customer.modify('cus_0', email='new@example.com')
+    assert e.value.param == 'email'
+    assert stripe.Customer.retrieve('cus_0').email != 'new@example.com'
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Customer.modify('cus_nope', coupon='half')
+
+    stripe.Customer.delete_discount('cus_0')
+    assert stripe.Customer.retrieve('cus_0').discount is None
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Customer.delete_discount('cus_0')
+
+
+def test_concurrent_redemptions():
+    api = StripeMockAPI()
+    api.add_coupon('half', max_redemptions=10)
+    for i in range(40):
+        api.add_customer('cus_{}'.format(i))
+
+    class QuietHandler(StripeMockRequestHandler):
+        quiet = True
+
+    server = StripeMockServer(api, ('127.0.0.1', 0), QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    statuses = []
+
+    def redeem(i):
+        request = urllib.request.Request(
+            'http://127.0.0.1:{}/v1/customers/cus_{}'.format(
+                server.server_address[1], i),
+            data=b'coupon=half',
+            method='POST',
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                statuses.append(response.status)
+        except urllib.error.HTTPError as e:
+            statuses.append(e.code)
+
+    try:
+        threads = [
+            threading.Thread(target=redeem, args=(i, )) for i in range(40)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert statuses.count(200) == 10
+    assert statuses.count(400) == 30
+    assert api.coupons[0]['times_redeemed'] == 10
+    assert len(api.customer_discounts) == 10
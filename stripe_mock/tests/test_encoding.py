@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from .. import encoding
+from ..encoding import (
+    FragmentCache,
+    JSONList,
+    body_reader,
+    encode_json,
+    encode_subscription,
+    iter_body,
+)
+from ..fake import (
+    fake_customer,
+    fake_customer_list,
+    fake_plan,
+    fake_subscription,
+)
+from ..records import compact, to_json_default
+
+
+@pytest.mark.parametrize('count', [0, 1, 3, 200])
+def test_json_list(count, monkeypatch):
+    monkeypatch.setattr(encoding, 'CHUNK_SIZE', 4096)
+    customers = [
+        compact(fake_customer('cus_{}'.format(i), email='ü{}@x.io'.format(i)))
+        for i in range(count)
+    ]
+    expected = json.dumps(
+        fake_customer_list(customers), default=to_json_default).encode()
+
+    body = JSONList(
+        fake_customer_list(customers), [encode_json(c) for c in customers])
+
+    assert len(body) == len(expected)
+    assert body.getvalue() == expected
+    chunks = list(iter_body(body))
+    assert b''.join(chunks) == expected
+    assert all(len(chunk) < 4096 * 2 for chunk in chunks)
+    if count == 200:
+        assert len(chunks) > 1
+    assert body_reader(body).read() == expected
+
+
+def test_bytes_body():
+    assert list(iter_body(b'{}')) == [b'{}']
+    assert body_reader(b'{"a": 1}').read() == b'{"a": 1}'
+
+
+@pytest.mark.parametrize('make', [dict, compact])
+def test_encode_subscription(make):
+    plan = make(fake_plan('pro', amount=2900, metadata={'tier': 'ü'}))
+    subscription = fake_subscription('cus_1', 'sub_1', plan=plan)
+    subscription['items']['data'][0]['plan'] = plan
+    subscription = make(subscription)
+    plans = FragmentCache()
+
+    assert encode_subscription(subscription, plans) == encode_json(
+        subscription)
+    assert plans.get(plan) is plans.get(plan)
+
+    plan['amount'] = 3900
+    plans.invalidate('pro')
+    encoded = json.loads(encode_subscription(subscription, plans))
+    assert encoded['plan']['amount'] == 3900
+    assert encoded['items']['data'][0]['plan']['amount'] == 3900
+
+    no_plan = make(fake_subscription('cus_1', 'sub_2', plan=None))
+    assert encode_subscription(no_plan, plans) == encode_json(no_plan)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import http.server
+import json
+import threading
+
+import pytest
+
+from ..events import EventLog, WebhookDispatcher, sign_payload
+from ..fake import fake_customer
+from ..mock_api import StripeMockAPI
+
+
+def test_event_log_page():
+    log = EventLog()
+    for idx in range(5):
+        log.append('customer.created', fake_customer('cus_{}'.format(idx)))
+    log.append('plan.created', {'id': 'plan_ok'})
+
+    data, has_more = log.page(limit=2)
+    assert [e['type'] for e in data] == ['plan.created', 'customer.created']
+    assert has_more
+
+    data, has_more = log.page(limit=10, starting_after=data[-1]['id'])
+    assert [e['data']['object']['id'] for e in data] == [
+        'cus_3', 'cus_2', 'cus_1', 'cus_0'
+    ]
+    assert not has_more
+
+    data, has_more = log.page(limit=2, ending_before=data[-1]['id'])
+    assert [e['data']['object']['id'] for e in data] == ['cus_2', 'cus_1']
+    assert has_more
+
+    data, _ = log.page(event_type='customer.*')
+    assert len(data) == 5
+
+    with pytest.raises(KeyError):
+        log.page(starting_after='evt_unknown')
+
+
+def test_event_log_snapshot():
+    log = EventLog()
+    customer = fake_customer('cus_ok')
+    event = log.append('customer.created', customer)
+    customer['email'] = 'changed@local.com'
+    assert event['data']['object']['email'] == 'tony@local.com'
+
+    log.enabled = False
+    assert log.append('customer.updated', customer) is None
+    assert len(log) == 1
+
+
+def _webhook_server(received):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            received.append((json.loads(body.decode('utf-8')),
+                             self.headers['Stripe-Signature'], body))
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_webhook_dispatcher():
+    received = []
+    server = _webhook_server(received)
+
+    log = EventLog()
+    url = 'http://127.0.0.1:{}/hooks'.format(server.server_address[1])
+    try:
+        with WebhookDispatcher(
+                url, max_workers=2, max_pending=5,
+                signing_secret='whsec_test') as hooks:
+            log.listeners.append(hooks.submit)
+            for idx in range(20):
+                log.append('customer.created',
+                           fake_customer('cus_{}'.format(idx)))
+            hooks.join()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert hooks.delivered == 20
+    assert hooks.failed == 0
+    assert len({event['id'] for event, _, _ in received}) == 20
+
+    event, signature, body = received[0]
+    timestamp = int(signature.split(',')[0][len('t='):])
+    assert signature == sign_payload(body, 'whsec_test', timestamp)
+
+
+def test_webhook_dispatcher_compact():
+    received = []
+    server = _webhook_server(received)
+    api = StripeMockAPI(compact=True)
+    url = 'http://127.0.0.1:{}/hooks'.format(server.server_address[1])
+    try:
+        with WebhookDispatcher(url, max_workers=1) as hooks:
+            api.events.listeners.append(hooks.submit)
+            api.add_customer('cus_1')
+            api.add_plan('basic')
+            api.add_subscription('cus_1', 'sub_1', plan='basic')
+            # not encodable: counted as failed, and join() still returns
+            hooks.submit({'id': 'evt_bad', 'data': object()})
+            hooks.join()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert (hooks.delivered, hooks.failed) == (3, 1)
+    event = received[2][0]
+    assert event['type'] == 'customer.subscription.created'
+    assert event['data']['object']['items']['data'][0]['plan']['id'] == \
+        'basic'
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import random
+import time
+
+import pytest
+import requests
+import responses
+
+from ..faults import (
+    EmpiricalLatency,
+    FaultInjector,
+    FaultProfile,
+    FixedLatency,
+    NormalLatency,
+    TokenBucket,
+)
+from ..mock_api import StripeMockAPI
+from ..router import MockRequest
+from ..transports import AiohttpSession, httpx_transport
+
+CUSTOMER_URL = 'https://api.stripe.com/v1/customers/{}'
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _api():
+    api = StripeMockAPI()
+    api.add_customer('cus_1')
+    return api
+
+
+def _request(key='sk_test_1'):
+    return MockRequest(
+        'GET', CUSTOMER_URL.format('cus_1'),
+        {'Authorization': 'Bearer {}'.format(key)})
+
+
+def test_latencies():
+    rng = random.Random(0)
+    assert FixedLatency(0.2).sample(rng) == 0.2
+    assert min(
+        NormalLatency(0.01, 0.5, minimum=0.005).sample(rng)
+        for _ in range(100)) == 0.005
+
+    latency = EmpiricalLatency([(0.1, 90), (1.5, 10)])
+    samples = [latency.sample(rng) for _ in range(2000)]
+    assert set(samples) == {0.1, 1.5}
+    assert 150 < samples.count(1.5) < 250
+    assert EmpiricalLatency([0.3]).sample(rng) == 0.3
+    with pytest.raises(ValueError):
+        EmpiricalLatency([])
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(2, 3, clock=clock)
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+    clock.now = 0.5
+    assert [bucket.take() for _ in range(2)] == [True, False]
+    clock.now = 100
+    assert sum(bucket.take() for _ in range(10)) == 3
+
+
+def test_rate_limit_per_api_key():
+    clock = FakeClock()
+    injector = FaultInjector(
+        _api(), FaultProfile(rate_limit=(1, 2), clock=clock))
+
+    statuses = [injector.dispatch(_request())[0] for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    assert injector.dispatch(_request('sk_test_2'))[0] == 200
+
+    clock.now = 1
+    assert injector.dispatch(_request())[0] == 200
+
+
+def test_route_latency_and_errors():
+    profile = FaultProfile(
+        latency=FixedLatency(0.5),
+        routes=[('GET', r'/v1/customers/cus_1$', FixedLatency(2))],
+        error_rate=1,
+        error_statuses=(503, ),
+    )
+    delay, respond = FaultInjector(_api(), profile).plan(_request())
+    assert delay == 2
+    assert respond()[0] == 503
+
+    delay, _ = FaultInjector(_api(), profile).plan(
+        MockRequest('GET', CUSTOMER_URL.format('cus_2')))
+    assert delay == 0.5
+
+
+@responses.activate
+def test_sync():
+    injector = FaultInjector(
+        _api(), FaultProfile(error_rate=0.5, seed=1))
+    injector.sync()
+
+    statuses = {
+        requests.get(CUSTOMER_URL.format('cus_1')).status_code
+        for _ in range(20)
+    }
+    assert statuses & {500, 502, 503}
+    assert 200 in statuses
+    response = requests.get(CUSTOMER_URL.format('cus_2'))
+    assert response.json()['error']['message'] == 'No such customer: cus_2'
+
+
+def test_async_delays_do_not_block():
+    httpx = pytest.importorskip('httpx')
+    injector = FaultInjector(
+        _api(), FaultProfile(latency=FixedLatency(0.2)))
+
+    async def run():
+        async with httpx.AsyncClient(
+                transport=httpx_transport(injector)) as client:
+            with_httpx = await asyncio.gather(*[
+                client.get(CUSTOMER_URL.format('cus_1')) for _ in range(20)
+            ])
+        async with AiohttpSession(injector) as session:
+            with_aiohttp = await asyncio.gather(*[
+                session.get(CUSTOMER_URL.format('cus_1')) for _ in range(20)
+            ])
+        return with_httpx, with_aiohttp
+
+    start = time.monotonic()
+    with_httpx, with_aiohttp = asyncio.run(run())
+    assert time.monotonic() - start < 1.5
+    assert {r.status_code for r in with_httpx} == {200}
+    assert {r.status for r in with_aiohttp} == {200}
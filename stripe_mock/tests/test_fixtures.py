@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from unittest import mock
+
+import pytest
+import responses
+import stripe
+
+from ..fake import fake_customer
+from ..fixtures import Changes, FixtureError, FixtureFiles, read_fixture
+from ..mock_api import StripeMockAPI
+
+PLANS = """\
+- {object: plan, id: gold, amount: 2900}
+- {object: plan, id: silver, amount: 900}
+"""
+
+
+def _write(path, content):
+    """Write a fixture file, with a new modification time."""
+    stat = os.stat(str(path)) if path.exists() else None
+    path.write_text(content)
+    if stat is not None:
+        os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def _customers(email='a@example.com', plan='gold', extra=()):
+    return json.dumps([
+        {'object': 'customer', 'id': 'cus_a', 'email': email},
+        {'object': 'customer', 'id': 'cus_b'},
+        {'object': 'subscription', 'id': 'sub_a', 'customer': 'cus_a',
+         'plan': plan},
+        {'object': 'card', 'id': 'card_b', 'customer': 'cus_b'},
+    ] + list(extra))
+
+
+@pytest.fixture
+def files(tmp_path):
+    plans = tmp_path / 'plans.yaml'
+    customers = tmp_path / 'customers.json'
+    _write(plans, PLANS)
+    _write(customers, _customers())
+    return plans, customers
+
+
+def test_read_fixture(tmp_path, files):
+    assert [obj['id'] for obj in read_fixture(files[0])] == [
+        'gold', 'silver']
+    for name, content in [
+            ('bad.txt', '[]'),
+            ('bad.json', '[{"id": "x"}]'),
+            ('bad.yaml', '{object: nope, id: x}'),
+            ('bad.yml', '{object: subscription, id: sub_x}'),
+    ]:
+        _write(tmp_path / name, content)
+        with pytest.raises(FixtureError):
+            read_fixture(tmp_path / name)
+
+
+@responses.activate
+def test_reload(files):
+    api = StripeMockAPI(auto_sync=True)
+    fixtures = FixtureFiles(api, files)
+    reloads = []
+    fixtures.listeners.append(lambda path, changes: reloads.append(changes))
+    assert fixtures.load() == 6
+    assert reloads[1].added == [
+        ('customer', 'cus_a'), ('customer', 'cus_b'),
+        ('subscription', 'sub_a'), ('card', 'card_b')]
+    assert api.find_subscription('sub_a')['plan'] is api.plans[0]
+    api.sync()
+    assert stripe.Customer.retrieve('cus_a').email == 'a@example.com'
+    assert fixtures.poll() == {}
+
+    # a changed field, another plan and a new object
+    events = len(api.events.events)
+    _write(files[1], _customers(
+        email='b@example.com', plan='silver',
+        extra=[{'object': 'product', 'id': 'prod_1', 'name': 'Widget'}]))
+    assert fixtures.poll() == {str(files[1]): Changes(
+        [('product', 'prod_1')],
+        [('customer', 'cus_a'), ('subscription', 'sub_a')], [])}
+    assert [e['type'] for e in api.events.events[events:]] == [
+        'product.created',
+        'customer.updated',
+        'customer.subscription.updated',
+    ]
+    assert stripe.Customer.retrieve('cus_a').email == 'b@example.com'
+    assert stripe.Subscription.retrieve('sub_a').plan.id == 'silver'
+    assert api.objects['product']['prod_1']['name'] == 'Widget'
+
+    _write(files[1], json.dumps([
+        {'object': 'customer', 'id': 'cus_a'},
+        {'object': 'subscription', 'id': 'sub_a', 'customer': 'cus_b',
+         'plan': 'silver'},
+    ]))
+    # a dropped field, removed objects and a subscription moved to
+    # another customer
+    changes = fixtures.poll()[str(files[1])]
+    assert changes.added == [('subscription', 'sub_a')]
+    assert changes.updated == [('customer', 'cus_a')]
+    assert changes.removed == [
+        ('customer', 'cus_b'), ('card', 'card_b'), ('product', 'prod_1'),
+        ('subscription', 'sub_a')]
+    assert api.find_customer('cus_a')['email'] == fake_customer(
+        'cus_a')['email']
+    assert [c.id for c in stripe.Customer.list()] == ['cus_a']
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Customer.retrieve('cus_b')
+    assert api.objects['product'] == {}
+    # its new customer was removed, as the file says
+    assert api.orphans() == [
+        (('subscription', 'sub_a'), ('customer', 'cus_b'))]
+
+
+def test_errors(files):
+    api = StripeMockAPI()
+    fixtures = FixtureFiles(api, files)
+    fixtures.load()
+
+    # an invalid file is retried on the next poll, its objects are kept
+    _write(files[1], '[{"object": "customer"')
+    assert fixtures.poll() == {}
+    assert str(files[1]) in fixtures.errors
+    assert len(api.customers) == 2
+    assert fixtures.poll() == {}
+
+    # plans can't be removed
+    _write(files[0], '- {object: plan, id: gold, amount: 2900}\n')
+    fixtures.poll()
+    assert isinstance(fixtures.errors[str(files[0])], FixtureError)
+    assert len(api.plans) == 2
+
+    _write(files[0], PLANS.replace(': 900', ': 1900'))
+    _write(files[1], _customers())
+    assert set(fixtures.poll()) == set(map(str, files))
+    assert fixtures.errors == {}
+    assert [plan['amount'] for plan in api.plans] == [2900, 1900]
+
+
+def test_failed_reload(files):
+    api = StripeMockAPI()
+    fixtures = FixtureFiles(api, files)
+    fixtures.load()
+    api.add_invoice('cus_a', 'in_1')
+
+    # checked before anything is applied
+    _write(files[1], _customers(extra=[
+        {'object': 'customer', 'id': 'cus_2'},
+        {'object': 'invoice', 'id': 'in_2', 'customer': 'cus_2',
+         'created': '2024-01-01'},
+    ]))
+    assert fixtures.poll() == {}
+    assert isinstance(fixtures.errors[str(files[1])], FixtureError)
+    assert api.find_customer('cus_2') is None
+
+    # and undone if applying it fails
+    _write(files[1], json.dumps([
+        {'object': 'customer', 'id': 'cus_a', 'email': 'b@example.com'},
+        {'object': 'customer', 'id': 'cus_2'},
+        {'object': 'subscription', 'id': 'sub_a', 'customer': 'cus_a',
+         'plan': 'gold'},
+        {'object': 'card', 'id': 'card_2', 'customer': 'cus_2'},
+        {'object': 'product', 'id': 'prod_1'},
+    ]))
+    with mock.patch.object(api, 'add_object', side_effect=RuntimeError):
+        assert fixtures.poll() == {}
+    assert isinstance(fixtures.errors[str(files[1])], RuntimeError)
+    assert [c['id'] for c in api.customers] == ['cus_a', 'cus_b']
+    assert api.find_customer('cus_a')['email'] == 'a@example.com'
+    assert [s['id'] for s in api.sources_list] == ['card_b']
+
+    # retried on the next poll
+    assert fixtures.poll()[str(files[1])].added == [
+        ('customer', 'cus_2'), ('card', 'card_2'), ('product', 'prod_1')]
+    assert str(files[1]) not in fixtures.errors
+    assert api.find_customer('cus_a')['email'] == 'b@example.com'
+    assert api.find_customer('cus_b') is None
+
+
+def test_start_stop(files):
+    api = StripeMockAPI()
+    fixtures = FixtureFiles(api, files)
+    fixtures.load()
+    reloaded = []
+    fixtures.listeners.append(lambda path, changes: reloaded.append(path))
+    fixtures.start(interval=0.01)
+    _write(files[1], _customers(email='b@example.com'))
+    for _ in range(500):
+        if reloaded:
+            break
+        fixtures._stop.wait(0.01)
+    fixtures.stop()
+    fixtures.stop()
+    assert reloaded == [str(files[1])]
+    assert api.find_customer('cus_a')['email'] == 'b@example.com'
+
+
+def test_watch_survives_errors(files):
+    api = StripeMockAPI()
+    fixtures = FixtureFiles(api, files)
+    fixtures.load()
+    reloaded = []
+
+    def listener(path, changes):
+        reloaded.append(path)
+        if len(reloaded) == 1:
+            raise RuntimeError('listener failed')
+
+    def wait(count):
+        for _ in range(500):
+            if len(reloaded) >= count:
+                break
+            fixtures._stop.wait(0.01)
+
+    fixtures.listeners.append(listener)
+    fixtures.start(interval=0.01)
+    try:
+        _write(files[1], _customers(email='b@example.com'))
+        wait(1)
+        _write(files[1], _customers(email='c@example.com'))
+        wait(2)
+    finally:
+        fixtures.stop()
+    assert reloaded == [str(files[1])] * 2
+    assert isinstance(fixtures.errors[None], RuntimeError)
+    assert api.find_customer('cus_a')['email'] == 'c@example.com'
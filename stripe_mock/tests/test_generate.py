@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from ..generate import DEFAULT_PLANS, generate_objects, populate
+from ..mock_api import StripeMockAPI
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+def test_generate_objects(use_numpy):
+    if use_numpy:
+        pytest.importorskip('numpy')
+
+    objects = list(
+        generate_objects(
+            50, subscriptions=2, sources=3, seed=7, batch_size=20,
+            use_numpy=use_numpy))
+    by_type = {}
+    for obj in objects:
+        by_type.setdefault(obj['object'], []).append(obj)
+
+    assert len(by_type['plan']) == len(DEFAULT_PLANS)
+    assert len(by_type['customer']) == 50
+    assert len(by_type['subscription']) == 100
+    assert len(by_type['card']) + len(by_type.get('bank_account', [])) == 150
+    assert len({obj['id'] for obj in objects}) == len(objects)
+    assert len({c['email'] for c in by_type['customer']}) == 50
+
+    again = list(
+        generate_objects(
+            50, subscriptions=2, sources=3, seed=7, batch_size=20,
+            use_numpy=use_numpy))
+    assert again == objects
+
+
+def test_generate_ids_match_across_backends():
+    pytest.importorskip('numpy')
+    ids = []
+    for use_numpy in (False, True):
+        ids.append([
+            obj['id']
+            for obj in generate_objects(5, seed=3, use_numpy=use_numpy)
+            if obj['object'] in ('customer', 'subscription')
+        ])
+    assert ids[0] == ids[1]
+
+
+def test_populate():
+    s = StripeMockAPI()
+    count = populate(s, 30, subscriptions=2, sources=1, seed=1)
+
+    assert count == len(DEFAULT_PLANS) + 30 * 4
+    assert len(s.customers) == 30
+    assert len(s.subscriptions) == 60
+    assert len(s.sources_list) == 30
+    assert len(s.customer_index.match("metadata['region']~''")) == 30
+    assert len(s.events) == 0
+
+
+def test_generate_invoices():
+    s = StripeMockAPI(compact=True)
+    populate(s, 40, subscriptions=2, sources=1, seed=5, invoices=3)
+
+    subscriptions = {sub['id']: sub for sub in s.subscriptions}
+    assert len(s.invoices) == len(s.charges) > 0
+    line_ids = set()
+    for invoice in s.invoices:
+        subscription = subscriptions[invoice['subscription']]
+        assert subscription['status'] != 'trialing'
+        assert invoice['created'] >= subscription['created']
+        line = invoice['lines']['data'][0]
+        assert line['plan'] is subscription['plan']
+        # the invoice's period is the period billed, as its lines'
+        assert (invoice['period_start'], invoice['period_end']) == (
+            line['period']['start'], line['period']['end'])
+        assert invoice['period_end'] > invoice['period_start']
+        line_ids.add(line['id'])
+        charge = s.charges.get(invoice['charge'])
+        assert charge['invoice'] == invoice['id']
+        assert charge['paid'] == invoice['paid']
+
+    assert len(line_ids) == len(s.invoices)
+
+    data, _ = s.invoices.page(limit=100)
+    assert [i['created'] for i in data] == sorted(
+        (i['created'] for i in data), reverse=True)
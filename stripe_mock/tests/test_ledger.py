@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import pytest
+import responses
+import stripe
+
+from ..ledger import BalanceLedger, LedgerError
+from ..mock_api import StripeMockAPI
+
+
+def _transaction(transaction_id, amount, created, customer='cus_1'):
+    return {
+        'amount': amount,
+        'created': created,
+        'customer': customer,
+        'id': transaction_id,
+    }
+
+
+def test_balance_ledger():
+    ledger = BalanceLedger()
+    assert ledger.balance('cus_1') == 0
+    for i, (amount, created) in enumerate(
+            [(500, 10), (-200, 20), (-200, 20), (1000, 40)]):
+        ledger.append(_transaction('txn_{}'.format(i), amount, created))
+    ledger.append(_transaction('txn_other', 7, 5, customer='cus_2'))
+
+    assert [ledger.get('txn_{}'.format(i))['ending_balance']
+            for i in range(4)] == [500, 300, 100, 1100]
+    assert ledger.balance('cus_1') == 1100
+    assert [ledger.balance('cus_1', at) for at in (9, 10, 19, 20, 39, 40)] \
+        == [0, 500, 500, 100, 100, 1100]
+    assert ledger.balance('cus_2', 4) == 0
+    assert ledger.count('cus_1') == 4
+    assert len(ledger) == 5
+
+    with pytest.raises(LedgerError):
+        ledger.append(_transaction('txn_0', 1, 50))
+    with pytest.raises(LedgerError):
+        ledger.append(_transaction('txn_old', 1, 39))
+
+    data, has_more = ledger.page('cus_1', limit=3)
+    assert [t['id'] for t in data] == ['txn_3', 'txn_2', 'txn_1']
+    assert has_more
+    data, has_more = ledger.page('cus_1', limit=3, starting_after='txn_1')
+    assert [t['id'] for t in data] == ['txn_0']
+    assert not has_more
+    data, has_more = ledger.page('cus_1', limit=2, ending_before='txn_0')
+    assert [t['id'] for t in data] == ['txn_2', 'txn_1']
+    assert has_more
+    with pytest.raises(KeyError):
+        ledger.page('cus_1', starting_after='txn_other')
+
+    # the ledger opens at the balance the customer had
+    ledger.append(
+        _transaction('txn_3_0', 100, 5, customer='cus_3'),
+        opening_balance=500)
+    ledger.append(
+        _transaction('txn_3_1', 100, 6, customer='cus_3'),
+        opening_balance=900)
+    assert ledger.get('txn_3_0')['ending_balance'] == 600
+    assert ledger.balance('cus_3') == 700
+    assert ledger.balance('cus_3', 4) == 500
+
+    ledger.discard('cus_1')
+    assert 'txn_0' not in ledger
+    assert ledger.balance('cus_1') == 0
+    assert len(ledger) == 3
+
+
+@responses.activate
+@pytest.mark.parametrize('auto_sync', [False, True])
+def test_balance_transaction_requests(auto_sync):
+    api = StripeMockAPI(auto_sync=auto_sync)
+    api.add_customer('cus_1')
+    api.add_customer('cus_2')
+    first = api.add_balance_transaction('cus_1', 1500)
+    api.advance_clock(api.clock.frozen_time + 100)
+    api.sync()
+
+    credit = stripe.Customer.create_balance_transaction(
+        'cus_1', amount=-2000, currency='usd', description='Refund',
+        metadata={'order': '42'})
+    assert credit.id == 'cbtxn_1_1'
+    assert credit.ending_balance == -500
+    assert credit.created == first['created'] + 100
+    assert stripe.Customer.retrieve('cus_1').balance == -500
+    assert api.customer_balance('cus_1') == -500
+    assert api.customer_balance('cus_1', at=first['created']) == 1500
+
+    transactions = stripe.Customer.list_balance_transactions(
+        'cus_1', limit=1)
+    assert [t.id for t in transactions] == ['cbtxn_1_1']
+    assert transactions.has_more
+    transactions = stripe.Customer.list_balance_transactions(
+        'cus_1', starting_after='cbtxn_1_1')
+    assert [t.id for t in transactions] == ['cbtxn_1_0']
+    assert stripe.Customer.list_balance_transactions('cus_2').data == []
+    for limit in (0, 101, 'x'):
+        with pytest.raises(stripe.error.InvalidRequestError) as e:
+            stripe.Customer.list_balance_transactions('cus_1', limit=limit)
+        assert e.value.param == 'limit'
+
+    transaction = stripe.Customer.modify_balance_transaction(
+        'cus_1', 'cbtxn_1_1', metadata={'note': 'x'})
+    assert transaction.metadata.to_dict() == {'order': '42', 'note': 'x'}
+    assert transaction.description == 'Refund'
+    assert stripe.Customer.retrieve_balance_transaction(
+        'cus_1', 'cbtxn_1_1').metadata['note'] == 'x'
+
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Customer.retrieve_balance_transaction('cus_2', 'cbtxn_1_1')
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Customer.create_balance_transaction('cus_1', amount=1)
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Customer.create_balance_transaction(
+            'cus_nope', amount=1, currency='usd')
+    with pytest.raises(LedgerError):
+        api.update_balance_transaction('cbtxn_1_1', amount=1)
+    with pytest.raises(LedgerError):
+        api.add_balance_transaction('cus_1', 1, created=0)
+
+    api.delete_customer('cus_1')
+    assert len(api.balance_transactions) == 0
+
+    api.add_customer('cus_3', balance=500)
+    assert api.add_balance_transaction('cus_3', 100)['ending_balance'] == 600
+    assert api.find_customer('cus_3')['balance'] == 600
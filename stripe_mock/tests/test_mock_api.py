@@ -1,10 +1,19 @@
 # -*- coding: utf-8 -*-
+import json
+import sys
+import threading
+from unittest import mock
+
 import pytest
 
+import requests
 import responses
 import stripe
 
+from ..fake import fake_plan, fake_subscription
 from ..mock_api import StripeMockAPI
+from ..parallel import update_bodies
+from ..router import MockRequest
 
 
 @responses.activate
@@ -94,6 +103,21 @@ def test_sources():
         stripe.Source.retrieve(source_404_id)
 
 
+@responses.activate
+@pytest.mark.parametrize('auto_sync', [False, True])
+def test_delete_last_source(auto_sync):
+    s = StripeMockAPI(auto_sync=auto_sync)
+    s.add_customer('cus_a')
+    s.add_source_card('cus_a', 'card_a')
+    s.sync()
+    assert len(stripe.Customer.list_sources('cus_a')) == 1
+
+    s.delete_source('cus_a', 'card_a')
+    assert stripe.Customer.list_sources('cus_a').data == []
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Customer.retrieve_source('cus_a', 'card_a')
+
+
 @responses.activate
 def test_cards():
     s = StripeMockAPI()
@@ -119,6 +143,36 @@ def test_cards():
         customer.sources.retrieve(source_404_id)
 
 
+@responses.activate
+def test_typed_source_lists():
+    s = StripeMockAPI(auto_sync=True)
+    s.add_customer('cus_a')
+    s.add_customer('cus_b')
+    s.add_source_card('cus_a', 'card_a')
+    s.add_source_bank_account('cus_a', 'ba_a')
+    s.add_source_card('cus_b', 'card_b')
+    s.sync()
+
+    def ids(customer_id, object_type):
+        customer = stripe.Customer.retrieve(customer_id)
+        return [
+            source.id for source in customer.sources.list(object=object_type)]
+
+    assert ids('cus_a', 'card') == ['card_a']
+    assert ids('cus_a', 'bank_account') == ['ba_a']
+    assert ids('cus_b', 'card') == ['card_b']
+    assert ids('cus_b', 'bank_account') == []
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Customer.retrieve_source('cus_b', 'card_a')
+
+    s.delete_source('cus_a', 'card_a')
+    assert ids('cus_a', 'card') == []
+    assert ids('cus_a', 'bank_account') == ['ba_a']
+    s.delete_source('cus_a', 'ba_a')
+    assert ids('cus_a', 'bank_account') == []
+    assert ids('cus_b', 'card') == ['card_b']
+
+
 @responses.activate
 def test_coupon():
     s = StripeMockAPI()
@@ -135,3 +189,407 @@ def test_coupon():
     message = 'No such coupon: {}'.format(coupon_404_id)
     with pytest.raises(stripe.error.InvalidRequestError, message=message):
         stripe.Coupon.retrieve(coupon_404_id)
+
+
+@responses.activate
+def test_search():
+    s = StripeMockAPI()
+    s.add_customer('cus_a', metadata={'team': 'billing'})
+    s.add_customer('cus_b', metadata={'team': 'growth'})
+    s.add_subscription('cus_a', 'sub_a', status='trialing')
+    s.sync()
+
+    # objects added after sync() are searchable too
+    s.add_customer('cus_c', metadata={'team': 'billing'})
+
+    result = requests.get(
+        '{}/v1/customers/search'.format(stripe.api_base),
+        params={'query': "metadata['team']:'billing'", 'limit': 1},
+    ).json()
+    assert result['object'] == 'search_result'
+    assert result['total_count'] == 2
+    assert [c['id'] for c in result['data']] == ['cus_a']
+    assert result['has_more']
+
+    result = requests.get(
+        '{}/v1/customers/search'.format(stripe.api_base),
+        params={
+            'query': "metadata['team']:'billing'",
+            'page': result['next_page'],
+        },
+    ).json()
+    assert [c['id'] for c in result['data']] == ['cus_c']
+
+    result = requests.get(
+        '{}/v1/subscriptions/search'.format(stripe.api_base),
+        params={'query': "status:'trialing'"},
+    ).json()
+    assert [sub['id'] for sub in result['data']] == ['sub_a']
+
+    response = requests.get(
+        '{}/v1/customers/search'.format(stripe.api_base),
+        params={'query': "metadata['team']:"},
+    )
+    assert response.status_code == 400
+
+
+def test_advance_clock():
+    s = StripeMockAPI(frozen_time=1513273056)
+    s.add_subscription('cus_a', 'sub_a')
+    s.add_subscription('cus_b', 'sub_b', cancel_at_period_end=True)
+
+    changed = s.advance_clock(1513273056 + 40 * 86400)
+    assert {sub['id'] for sub in changed} == {'sub_a', 'sub_b'}
+    assert s.subscription_index.match("status:'canceled'") == {'sub_b'}
+    assert s.subscription_index.match("status:'active'") == {'sub_a'}
+
+
+@responses.activate
+def test_events():
+    s = StripeMockAPI()
+    s.add_customer('cus_a')
+    s.add_customer('cus_a', email='new@local.com')
+    s.add_customer('cus_a', email='new@local.com')  # no change, no event
+    s.add_subscription('cus_a', 'sub_a')
+    s.sync()
+
+    events = stripe.Event.list()
+    assert [e.type for e in events.data] == [
+        'customer.subscription.created',
+        'customer.updated',
+        'customer.created',
+    ]
+    assert events.data[1].data.previous_attributes.email == 'tony@local.com'
+
+    event = stripe.Event.retrieve(events.data[0].id)
+    assert event.data.object.id == 'sub_a'
+
+    events = stripe.Event.list(limit=1, starting_after=events.data[0].id)
+    assert events.data[0].type == 'customer.updated'
+    assert events.has_more
+
+
+@responses.activate
+def test_compact():
+    s = StripeMockAPI(compact=True)
+    s.add_customer('cus_a', metadata={'team': 'billing'})
+    s.add_subscription('cus_a', 'sub_a')
+    s.add_source_card('cus_a', 'card_a')
+    s.sync()
+
+    customer = stripe.Customer.retrieve('cus_a')
+    assert customer.metadata.team == 'billing'
+    assert len(customer.subscriptions.list()) == 1
+    assert stripe.Subscription.retrieve('sub_a').plan.id == 'develtech_999'
+    assert s.customer_index.match("metadata['team']:'billing'") == {'cus_a'}
+
+
+@responses.activate
+@pytest.mark.parametrize('compact', [False, True])
+def test_subscription_plan_reference(compact):
+    s = StripeMockAPI(compact=compact)
+    s.add_plan('pro', amount=2900)
+    s.add_subscription('cus_a', 'sub_a', plan='pro')
+    loaded = fake_subscription('cus_b', 'sub_b', plan=fake_plan('pro'))
+    loaded['items']['data'][0]['plan'] = fake_plan('pro')
+    s.bulk_load([loaded])
+
+    plan = s.plans[0]
+    for sub in s.subscriptions:
+        assert sub['plan'] is plan
+        assert sub['items']['data'][0]['plan'] is plan
+
+    s.add_plan('pro', amount=4900)
+    s.sync()
+    for subscription_id in ('sub_a', 'sub_b'):
+        subscription = stripe.Subscription.retrieve(subscription_id)
+        assert subscription.plan.amount == 4900
+        assert subscription['items'].data[0].plan.amount == 4900
+
+
+@responses.activate
+def test_auto_sync():
+    s = StripeMockAPI(auto_sync=True)
+    s.add_customer('cus_a')
+    s.add_subscription('cus_a', 'sub_a')
+    s.sync()
+
+    with mock.patch('stripe_mock.mock_api.render_bodies') as render, \
+            mock.patch('stripe_mock.mock_api.update_bodies',
+                       wraps=update_bodies) as update:
+        s.add_customer('cus_b', email='b@example.com')
+        s.add_subscription('cus_b', 'sub_b')
+        s.add_source_card('cus_b', 'card_b')
+        s.add_plan('pro', amount=2900)
+
+        assert stripe.Customer.retrieve('cus_b').email == 'b@example.com'
+        assert len(stripe.Customer.list()) == 2
+        assert len(stripe.Subscription.list()) == 2
+        assert stripe.Subscription.retrieve('sub_b').customer == 'cus_b'
+        assert stripe.Customer.retrieve_source('cus_b', 'card_b').id == (
+            'card_b')
+        assert stripe.Plan.retrieve('pro').amount == 2900
+        # each change publishes the routes of its customer
+        assert update.call_count == 3
+        assert not render.called
+
+        # the customer's own list is re-rendered, not the others'
+        s.add_subscription('cus_a', 'sub_c')
+        assert len(stripe.Customer.retrieve('cus_a').subscriptions) == 2
+        assert stripe.Subscription.retrieve('sub_c').customer == 'cus_a'
+        assert update.call_args[0][2] == {'cus_a'}
+        assert not render.called
+
+
+@responses.activate
+def test_auto_sync_failure():
+    s = StripeMockAPI(auto_sync=True)
+    s.add_customer('cus_a')
+    s.sync()
+
+    with mock.patch('stripe_mock.mock_api.update_bodies',
+                    side_effect=RuntimeError):
+        with pytest.raises(RuntimeError):
+            s.add_customer('cus_a', email='a@example.com')
+    # requests are answered from the last version published...
+    assert stripe.Customer.retrieve('cus_a').email != 'a@example.com'
+    # ...and what failed to update is updated by the next change
+    s.add_plan('pro')
+    assert stripe.Customer.retrieve('cus_a').email == 'a@example.com'
+    assert stripe.Plan.retrieve('pro').id == 'pro'
+
+    s.add_customer('cus_a', email='b@example.com')
+    with mock.patch('stripe_mock.mock_api.render_bodies',
+                    side_effect=RuntimeError):
+        with pytest.raises(RuntimeError):
+            s.refresh()
+    assert stripe.Customer.retrieve('cus_a').email == 'b@example.com'
+
+
+@responses.activate
+@pytest.mark.parametrize('compact', [False, True])
+def test_invoices_and_charges(compact):
+    s = StripeMockAPI(compact=compact)
+    s.add_plan('pro', amount=2900)
+    s.add_subscription('cus_a', 'sub_a', plan='pro')
+    s.add_subscription('cus_b', 'sub_b', plan='pro', billing='send_invoice')
+    invoice, charge = s.invoice_subscription('sub_a', 'in_a1')
+    # the invoice's period is the period billed, as its lines'
+    subscription = s.find_subscription('sub_a')
+    assert (invoice['period_start'], invoice['period_end']) == (
+        subscription['current_period_start'],
+        subscription['current_period_end'])
+    assert invoice['lines']['data'][0]['period'] == {
+        'end': invoice['period_end'], 'start': invoice['period_start']}
+    s.advance_clock(s.clock.frozen_time + 40 * 86400)
+    s.invoice_subscription('sub_a', 'in_a2')
+    open_invoice, no_charge = s.invoice_subscription('sub_b', 'in_b1')
+    s.add_charge('cus_b', 'ch_manual', amount=500)
+    s.sync()
+
+    assert invoice['total'] == 2900
+    assert invoice['lines']['data'][0]['plan'] is s.plans[0]
+    assert charge['invoice'] == 'in_a1'
+    assert open_invoice['status'] == 'open' and no_charge is None
+
+    retrieved = stripe.Invoice.retrieve('in_a1')
+    assert retrieved.charge == 'ch_a1'
+    assert retrieved.lines.data[0].plan.id == 'pro'
+    assert stripe.Charge.retrieve('ch_a1').amount == 2900
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Invoice.retrieve('in_nope')
+
+    assert [i.id for i in stripe.Invoice.list()] == [
+        'in_b1', 'in_a2', 'in_a1']
+    assert [i.id for i in stripe.Invoice.list(customer='cus_a')] == [
+        'in_a2', 'in_a1']
+    assert [i.id for i in stripe.Invoice.list(
+        created={'lt': invoice['created'] + 1})] == ['in_a1']
+    assert [c.id for c in stripe.Charge.list(customer='cus_b')] == [
+        'ch_manual']
+
+    page = stripe.Invoice.list(limit=1)
+    assert page.has_more
+    assert [i.id for i in page.auto_paging_iter()] == [
+        'in_b1', 'in_a2', 'in_a1']
+
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Invoice.list(created={'gte': 'soon'})
+    assert [e['type'] for e in s.events.events][-3:] == [
+        'invoice.payment_succeeded', 'invoice.created', 'charge.succeeded']
+
+
+@responses.activate
+def test_generated_objects():
+    s = StripeMockAPI()
+    s.add_object('product', 'prod_a', name='Basic')
+    s.add_object('product', 'prod_b', name='Pro')
+    s.add_object('price', 'price_a', product='prod_a', unit_amount=900)
+    s.sync()
+    # request-time routes, no sync needed
+    s.add_object('product', 'prod_a', active=True)
+    s.add_object('checkout.session', 'cs_a', customer='cus_a')
+
+    assert stripe.Product.retrieve('prod_a').active is True
+    assert stripe.Price.retrieve('price_a').unit_amount == 900
+    assert stripe.checkout.Session.retrieve('cs_a').customer == 'cus_a'
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Product.retrieve('prod_nope')
+    assert [p.id for p in stripe.Product.list()] == ['prod_b', 'prod_a']
+    page = stripe.Product.list(limit=1, starting_after='prod_b')
+    assert [p.id for p in page] == ['prod_a'] and not page.has_more
+    assert stripe.checkout.Session.list().url == '/v1/checkout/sessions'
+    assert stripe.TaxRate.list().data == []
+
+    assert [e['type'] for e in s.events.events] == [
+        'product.created',
+        'product.created',
+        'price.created',
+        'product.updated',
+        'checkout.session.created',
+    ]
+    with pytest.raises(ValueError):
+        s.add_object('customer', 'cus_a')
+    with pytest.raises(ValueError):
+        s.add_object('payout', 'po_a')
+
+
+def _json(response):
+    return json.loads(b''.join(response[2]) if not isinstance(
+        response[2], bytes) else response[2])
+
+
+def test_router_versions():
+    api = StripeMockAPI(auto_sync=True)
+    for i in range(20):
+        api.add_customer('cus_{}'.format(i))
+    customers = 'https://api.stripe.com/v1/customers'
+    done = threading.Event()
+    errors = []
+
+    def read():
+        while not done.is_set():
+            # a version answers consistently: the customers it lists exist
+            router = api.current_router()
+            page = _json(router.dispatch(
+                MockRequest('GET', '{}?limit=100'.format(customers))))
+            for customer in page['data']:
+                status, _, _ = router.dispatch(MockRequest(
+                    'GET', '{}/{}'.format(customers, customer['id'])))
+                if status != 200:
+                    errors.append(customer['id'])
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    held = api.current_router()
+    for i in range(20, 80):
+        api.add_customer('cus_{}'.format(i))
+        api.delete_customer('cus_{}'.format(i - 20))
+        api.current_router()
+    done.set()
+    for reader in readers:
+        reader.join()
+
+    assert errors == []
+    assert held.dispatch(
+        MockRequest('GET', '{}/cus_0'.format(customers)))[0] == 200
+    assert api.dispatch(
+        MockRequest('GET', '{}/cus_0'.format(customers)))[0] == 404
+    assert len(_json(api.dispatch(MockRequest(
+        'GET', '{}?limit=100'.format(customers))))['data']) == 20
+
+
+def test_concurrent_writers():
+    api = StripeMockAPI(auto_sync=True)
+    api.add_customer('cus_0')
+    api.sync()
+    base = 'https://api.stripe.com/v1'
+    writing = threading.Event()
+    writing.set()
+    errors = []
+
+    def write(writer):
+        try:
+            for i in range(150):
+                customer_id = 'cus_w{}_{}'.format(writer, i)
+                api.add_customer(customer_id)
+                api.add_subscription(
+                    customer_id, 'sub_w{}_{}'.format(writer, i))
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            while writing.is_set():
+                for url in ('customers', 'subscriptions',
+                            'customers/cus_0/subscriptions'):
+                    api.dispatch(MockRequest(
+                        'GET', '{}/{}?limit=100'.format(base, url)))
+        except Exception as e:
+            errors.append(e)
+
+    writers = [threading.Thread(target=write, args=(i, )) for i in range(2)]
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)  # interleave writes with updates
+    try:
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        writing.clear()
+        for thread in readers:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert errors == []
+    subscriptions = _json(api.dispatch(MockRequest(
+        'GET', '{}/subscriptions'.format(base))))
+    assert len(subscriptions['data']) == 300
+
+
+def test_readers_skip_changes_under_way():
+    api = StripeMockAPI(auto_sync=True)
+    api.add_customer('cus_a', email='a@example.com')
+    api.sync()
+    url = 'https://api.stripe.com/v1/customers'
+    answers = []
+
+    def read():
+        answers.append(api.dispatch(MockRequest(
+            'GET', '{}/cus_a'.format(url)))[0])
+        answers.append(api.dispatch(MockRequest(
+            'GET', '{}/cus_b'.format(url)))[0])
+        answers.append(len(_json(api.dispatch(MockRequest(
+            'GET', '{}/search?query={}'.format(
+                url, "email:'b@example.com'"))))['data']))
+
+    with api.batch():
+        api.add_customer('cus_b', email='b@example.com')
+        # answered from the last version published, without waiting for
+        # the batch; searches read the index as of its last write
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(5)
+        assert answers == [200, 404, 1]
+    assert api.dispatch(MockRequest(
+        'GET', '{}/cus_b'.format(url)))[0] == 200
+
+
+@responses.activate
+@pytest.mark.parametrize('list_objects', [
+    lambda limit: stripe.Customer.search(query="email:'x'", limit=limit),
+    lambda limit: stripe.Event.list(limit=limit),
+    lambda limit: stripe.Invoice.list(limit=limit),
+    lambda limit: stripe.Product.list(limit=limit),
+])
+def test_invalid_list_limit(list_objects):
+    s = StripeMockAPI()
+    s.sync()
+    assert list(list_objects(3)) == []
+    for limit in (0, 101, 'x'):
+        with pytest.raises(stripe.error.InvalidRequestError) as e:
+            list_objects(limit)
+        assert e.value.param == 'limit'
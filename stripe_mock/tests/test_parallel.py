@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from ..encoding import JSONList
+from ..generate import populate
+from ..mock_api import StripeMockAPI
+from ..parallel import render_bodies
+
+
+def _bodies(router):
+    return {
+        key: (status, body.getvalue() if isinstance(body, JSONList) else body)
+        for key, (status, body) in router.responses.items()
+    }
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_parallel_build_router(compact):
+    api = StripeMockAPI(compact=compact)
+    populate(api, 40, subscriptions=2, sources=2, seed=5)
+    api.add_coupon('15-off')
+
+    serial = _bodies(api.build_router())
+    assert serial == _bodies(api.build_router(workers=3))
+    assert len(serial) > 200
+
+
+def test_render_bodies():
+    api = StripeMockAPI()
+    populate(api, 10, seed=1)
+
+    bodies = render_bodies(api, workers=2)
+    assert len(bodies['customers']) == 10
+    assert len(bodies['plans']) == len(api.plans)
+    assert list(bodies['subscriptions']) == list(api.customer_subscriptions)
+    assert sorted(bodies['sources']) == sorted(api.sources)
+    assert render_bodies(StripeMockAPI(), workers=2)['customers'] == []
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import pstats
+
+import pytest
+import requests
+import responses
+
+from ..mock_api import StripeMockAPI
+from ..profiling import Profiler, span
+
+
+def test_span_nesting():
+    profiler = Profiler()
+    ended = []
+    profiler.listeners.append(
+        lambda stack, wall, allocated: ended.append(stack))
+
+    for _ in range(2):
+        with profiler.span('outer'):
+            with profiler.span('inner'):
+                [object() for _ in range(1000)]
+    with span(None, 'ignored'):
+        pass
+
+    stats = profiler.stats()
+    assert [s.stack for s in stats] == [('outer', ), ('outer', 'inner')]
+    assert [s.calls for s in stats] == [2, 2]
+    assert stats[0].wall >= stats[1].wall
+    assert ended[:2] == [('outer', 'inner'), ('outer', )]
+
+    # own time of each stack, adding up to the total
+    folded = dict(line.rsplit(' ', 1) for line in profiler.folded())
+    assert sum(int(value) for value in folded.values()) <= int(
+        stats[0].wall * 1e6)
+    assert 'outer;inner' in folded
+    with pytest.raises(ValueError):
+        list(profiler.folded('cpu'))
+
+    profiler.reset()
+    assert profiler.stats() == []
+
+
+def test_tracemalloc():
+    profiler = Profiler(tracemalloc=True)
+    with profiler.span('allocate'):
+        kept = [bytes(1000) for _ in range(100)]
+    assert profiler.stats()[0].allocated >= 100 * 1000
+    assert list(profiler.folded('allocated'))[0].startswith('allocate ')
+    del kept
+
+
+@responses.activate
+def test_api_phases(tmp_path):
+    profiler = Profiler(cprofile=True)
+    api = StripeMockAPI(auto_sync=True, profiler=profiler)
+    api.add_customer('cus_a')
+    api.add_source_card('cus_a', 'card_a')
+    api.sync()
+    api.add_subscription('cus_a', 'sub_a')
+    requests.get('https://api.stripe.com/v1/customers/cus_a')
+
+    stacks = {s.stack for s in profiler.stats()}
+    for stack in (
+            ('sync', 'refresh', 'render', 'group_sources'),
+            ('sync', 'refresh', 'render', 'customers'),
+            ('sync', 'refresh', 'route', 'subscriptions'),
+            ('sync', 'install'),
+            ('update', ),
+            ('dispatch', 'resolve'),
+            ('dispatch', 'respond'),
+    ):
+        assert stack in stacks
+
+    path = str(tmp_path / 'sync.folded')
+    profiler.write_folded(path)
+    with open(path) as f:
+        assert any(line.startswith('sync;install ') for line in f)
+
+    functions = pstats.Stats(profiler.cprofile).stats
+    assert any(name == 'render_bodies' for _, _, name in functions)
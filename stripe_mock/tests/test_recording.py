@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import requests
+import responses
+
+from ..mock_api import StripeMockAPI
+from ..recording import Recorder, load_recording, read_recording
+
+BASE = 'https://api.stripe.com/v1'
+
+
+def _source_api():
+    api = StripeMockAPI()
+    api.add_plan('basic')
+    api.add_coupon('half')
+    for i in range(3):
+        customer_id = 'cus_{}'.format(i)
+        api.add_customer(customer_id, email='c{}@example.com'.format(i))
+        api.add_subscription(customer_id, 'sub_{}'.format(i))
+        api.add_source_card(customer_id, 'card_{}'.format(i))
+    return api
+
+
+@responses.activate
+def test_record_and_replay(tmp_path):
+    path = str(tmp_path / 'traffic.jsonl.gz')
+    source = _source_api()
+    source.sync()
+
+    with Recorder(path) as recorder:
+        session = requests.Session()
+        session.hooks['response'].append(recorder.requests_hook)
+        session.get('{}/customers'.format(BASE))
+        session.get('{}/customers/cus_0'.format(BASE))
+        for i in range(3):
+            session.get('{}/customers/cus_{}/sources'.format(BASE, i))
+        session.get('{}/subscriptions'.format(BASE))
+        session.get('{}/plans'.format(BASE))
+        session.get('{}/coupons/half'.format(BASE))
+        session.get('{}/customers/cus_nope'.format(BASE))
+        session.post(
+            '{}/customers/cus_1'.format(BASE), data={'coupon': 'half'})
+
+        # a later state, and a deletion, win over earlier responses
+        updated = dict(source.customers[2], email='late@example.com')
+        recorder.record('POST', '{}/customers/cus_2'.format(BASE), 200,
+                        updated, {'email': 'late@example.com'})
+        recorder.record(
+            'DELETE', '{}/customers/cus_1/sources/card_1'.format(BASE), 200,
+            {'id': 'card_1', 'object': 'card', 'deleted': True})
+
+    exchanges = list(read_recording(path))
+    assert len(exchanges) == 12
+    assert exchanges[8]['status'] == 404
+    assert exchanges[9]['request'] == {'coupon': 'half'}
+
+    api = StripeMockAPI(compact=True)
+    assert load_recording(api, path) == 10
+    assert [c['id'] for c in api.customers] == ['cus_0', 'cus_1', 'cus_2']
+    assert api.customers[2]['email'] == 'late@example.com'
+    assert 'subscriptions' not in api.customers[0]
+    assert sorted(s['id'] for s in api.subscriptions) == [
+        'sub_0', 'sub_1', 'sub_2']
+    assert sorted(s['id'] for s in api.sources_list) == ['card_0', 'card_2']
+    assert [p['id'] for p in api.plans] == ['basic']
+    assert [c['id'] for c in api.coupons] == ['half']
+
+    api.sync()
+    response = requests.get('{}/customers/cus_1'.format(BASE))
+    assert response.json()['discount']['coupon']['id'] == 'half'
+    assert response.json()['subscriptions']['data'][0]['id'] == 'sub_1'
+    assert api.customer_index.search('email:"late@example.com"')[1] == 1
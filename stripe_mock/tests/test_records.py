@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import json
+import pickle
+
+import pytest
+
+from ..fake import fake_customer, fake_plan, fake_subscription
+from ..records import (
+    CustomerRecord,
+    PlanRecord,
+    as_dict,
+    compact,
+    peek,
+    to_json_default,
+)
+
+
+def test_record_mapping():
+    customer = fake_customer('cus_ok', email='a@local.com')
+    record = compact(customer)
+
+    assert isinstance(record, CustomerRecord)
+    assert record == customer
+    assert list(record) == list(customer)
+    assert record['email'] == 'a@local.com'
+
+    record['nickname'] = 'tony'  # not in the template
+    del record['shipping']
+    assert 'shipping' not in record
+    assert record.get('shipping') is None
+    assert record['nickname'] == 'tony'
+    assert len(record) == len(customer)
+
+    with pytest.raises(KeyError):
+        record['shipping']
+
+    assert pickle.loads(pickle.dumps(record)) == record
+
+
+def test_record_defaults_are_shared_not_modified():
+    first = compact(fake_customer('cus_1'))
+    second = compact(fake_customer('cus_2'))
+    assert first['currency'] is CustomerRecord._template['currency']
+
+    first['metadata']['tier'] = 'gold'
+    assert second['metadata'] == {}
+    assert CustomerRecord._template['metadata'] == {}
+
+
+def test_record_nested_objects():
+    plan = fake_plan('gold', amount=5000)
+    subscription = compact(fake_subscription('cus_ok', 'sub_ok', plan=plan))
+    assert isinstance(subscription['plan'], PlanRecord)
+    assert peek(subscription, 'plan')['amount'] == 5000
+
+    rendered = json.loads(json.dumps(subscription, default=to_json_default))
+    assert rendered == json.loads(
+        json.dumps(fake_subscription('cus_ok', 'sub_ok', plan=plan)))
+    assert as_dict(subscription)['plan'] == subscription['plan']
+
+
+def test_to_json_default():
+    with pytest.raises(TypeError):
+        json.dumps(object(), default=to_json_default)
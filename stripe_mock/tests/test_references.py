@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import pytest
+import responses
+import stripe
+
+from ..mock_api import StripeMockAPI
+from ..references import ReferenceIndex, ReferenceIntegrityError
+
+
+def test_reference_index():
+    index = ReferenceIndex()
+    index.set(('subscription', 'sub_1'), [
+        ('customer', 'cus_1'), ('plan', 'gold'), ('plan', 'gold')])
+    index.set(('card', 'card_1'), [('customer', 'cus_1')])
+    assert len(index) == 3
+    assert index.referrers(('customer', 'cus_1')) == [
+        ('subscription', 'sub_1'), ('card', 'card_1')]
+
+    # replacing drops the references no longer made
+    index.set(('subscription', 'sub_1'), [
+        ('customer', 'cus_1'), ('plan', 'silver')])
+    assert index.referrers(('plan', 'gold')) == []
+    assert index.targets(('subscription', 'sub_1')) == (
+        ('customer', 'cus_1'), ('plan', 'silver'))
+
+    assert index.dangling(lambda target: target[0] == 'customer') == [
+        (('subscription', 'sub_1'), ('plan', 'silver'))]
+    index.discard(('subscription', 'sub_1'))
+    index.discard(('subscription', 'sub_1'))
+    assert index.dangling(lambda target: False) == [
+        (('card', 'card_1'), ('customer', 'cus_1'))]
+
+
+def _api(compact=False):
+    api = StripeMockAPI(compact=compact)
+    api.add_plan('gold')
+    api.add_coupon('half')
+    for customer_id in ('cus_a', 'cus_b'):
+        api.add_customer(customer_id)
+        api.add_subscription(
+            customer_id, 'sub_{}'.format(customer_id), plan='gold')
+    api.add_source_card('cus_a', 'card_a')
+    api.add_source('cus_a', 'src_a')
+    api.apply_coupon('half', 'cus_a')
+    api.apply_coupon('half', 'cus_a', 'sub_cus_a')
+    return api
+
+
+@responses.activate
+@pytest.mark.parametrize('compact', [False, True])
+def test_delete_customer(compact):
+    api = _api(compact)
+    assert api.references.referrers(('plan', 'gold')) == [
+        ('subscription', 'sub_cus_a'), ('subscription', 'sub_cus_b')]
+    api.validate()
+
+    api.sync()
+    customer = api.delete_customer('cus_a')
+    assert customer['id'] == 'cus_a'
+    assert [c['id'] for c in api.customers] == ['cus_b']
+    assert [s['id'] for s in api.subscriptions] == ['sub_cus_b']
+    assert api.sources_list == []
+    assert api.customer_discounts == api.subscription_discounts == {}
+    assert api.references.referrers(('customer', 'cus_a')) == []
+    assert api.references.referrers(('coupon', 'half')) == []
+    assert [e['type'] for e in api.events.events][-6:] == [
+        'customer.discount.deleted',
+        'customer.subscription.deleted',
+        'customer.source.deleted',
+        'customer.source.deleted',
+        'customer.discount.deleted',
+        'customer.deleted',
+    ]
+    with pytest.raises(KeyError):
+        api.delete_customer('cus_a')
+
+    # the routes are brought up to date in place
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Customer.retrieve('cus_a')
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Subscription.retrieve('sub_cus_a')
+    assert [c.id for c in stripe.Customer.list()] == ['cus_b']
+    assert [s.id for s in stripe.Subscription.list()] == ['sub_cus_b']
+    assert stripe.Customer.retrieve('cus_b').id == 'cus_b'
+
+    # positions of the customers after it move up
+    api.auto_sync = True
+    for customer_id in ('cus_c', 'cus_d', 'cus_e'):
+        api.add_customer(customer_id)
+    api.delete_customer('cus_c')
+    assert [api.customer_position(c['id']) for c in api.customers] == [
+        0, 1, 2]
+    assert api.customer_position('cus_c') is None
+    api.add_customer('cus_e', email='e@example.com')
+    assert api.find_customer('cus_e') is api.customers[2]
+    assert stripe.Customer.retrieve('cus_e').email == 'e@example.com'
+    assert [c.id for c in stripe.Customer.list()] == [
+        'cus_b', 'cus_d', 'cus_e']
+
+
+@responses.activate
+def test_delete_requests():
+    api = _api()
+    api.sync()
+
+    subscription = stripe.Subscription.cancel('sub_cus_b')
+    assert subscription.status == 'canceled'
+    assert api.find_subscription('sub_cus_b') is None
+    assert stripe.Customer.retrieve('cus_b').subscriptions.data == []
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Subscription.cancel('sub_cus_b')
+
+    assert stripe.Customer.delete('cus_a').deleted
+    with pytest.raises(stripe.error.InvalidRequestError):
+        stripe.Customer.delete('cus_a')
+    assert [c.id for c in stripe.Customer.list()] == ['cus_b']
+    assert api.subscriptions == []
+
+
+def test_orphans():
+    api = _api()
+    api.add_subscription('cus_nope', 'sub_nope', plan='gold')
+    api.add_source_card('cus_nope', 'card_nope')
+    assert api.orphans() == [
+        (('subscription', 'sub_nope'), ('customer', 'cus_nope')),
+        (('card', 'card_nope'), ('customer', 'cus_nope')),
+    ]
+    with pytest.raises(ReferenceIntegrityError) as e:
+        api.validate()
+    assert len(e.value.orphans) == 2
+
+    # deletes what references a customer that was never added
+    assert api.delete_customer('cus_nope') is None
+    api.validate()
+
+
+def test_pending_plan():
+    api = _api()
+    api.add_customer('cus_1')
+    api.add_subscription('cus_1', 'sub_1', plan='platinum')
+    subscription = api.find_subscription('sub_1')
+    item, = subscription['items']['data']
+    assert item['plan'] == 'platinum'
+    assert api.orphans() == [
+        (('subscription', 'sub_1'), ('plan', 'platinum')),
+    ]
+
+    api.add_plan('platinum', amount=500)
+    api.validate()
+    subscription = api.find_subscription('sub_1')
+    assert subscription['plan']['amount'] == 500
+    item, = subscription['items']['data']
+    assert item['plan'] is subscription['plan']
+
+    api.add_plan('platinum', amount=700)
+    assert api.find_subscription('sub_1')['plan']['amount'] == 700
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import re
+
+import pytest
+
+from ..router import MockRequest, Router
+
+BASE = 'https://api.stripe.com/v1/customers'
+
+
+def _router():
+    router = Router()
+    router.add_response(
+        'GET', '{}/cus_1/sources'.format(BASE), {'all': 1}, 200)
+    router.add_callback(
+        'GET',
+        re.compile(r'{}/(\w+)/sources\?object=(\w+)$'.format(BASE)),
+        lambda request: (200, {}, {'filtered': 1}),
+    )
+    router.add_callback(
+        'GET',
+        re.compile(r'{}/(\w+)'.format(BASE)),
+        lambda request: (404, {}, {'error': 1}),
+    )
+    return router
+
+
+def test_dispatch():
+    router = _router()
+
+    assert router.dispatch(
+        MockRequest('GET', '{}/cus_1/sources'.format(BASE))) == (
+            200, {}, b'{"all": 1}')
+    # the query string is ignored by fixed responses...
+    assert router.dispatch(
+        MockRequest('GET', '{}/cus_1/sources?limit=3'.format(BASE))) == (
+            200, {}, b'{"all": 1}')
+    # ...unless a pattern matches into it
+    assert router.dispatch(
+        MockRequest('GET', '{}/cus_1/sources?object=card'.format(BASE))) == (
+            200, {}, b'{"filtered": 1}')
+    # ...unless a fixed response answers the exact query
+    router.add_response(
+        'GET', '{}/cus_1/sources?object=card'.format(BASE), {'cards': 1}, 200)
+    assert router.dispatch(
+        MockRequest('GET', '{}/cus_1/sources?object=card'.format(BASE))) == (
+            200, {}, b'{"cards": 1}')
+    assert router.dispatch(
+        MockRequest('GET', '{}/cus_2/sources?object=card'.format(BASE))) == (
+            200, {}, b'{"filtered": 1}')
+    assert router.dispatch(
+        MockRequest('GET', '{}/cus_2'.format(BASE)))[0] == 404
+
+    assert router.dispatch(MockRequest('POST', BASE)) is None
+    assert router.dispatch(
+        MockRequest('GET', 'https://api.stripe.com/v1/plans')) is None
+    assert router.methods == ['GET']
+
+
+def test_versions():
+    router = _router().freeze()
+    with pytest.raises(RuntimeError):
+        router.add_response('GET', BASE, {}, 200)
+
+    draft = router.copy()
+    draft.add_response('GET', '{}/cus_1/sources'.format(BASE), {'v': 2}, 200)
+    draft.add_response('GET', '{}/cus_2/sources'.format(BASE), {'v': 2}, 200)
+    new = draft.freeze()
+    # the old version still answers as before
+    assert router.dispatch(
+        MockRequest('GET', '{}/cus_1/sources'.format(BASE)))[2] == \
+        b'{"all": 1}'
+    assert new.dispatch(
+        MockRequest('GET', '{}/cus_1/sources'.format(BASE)))[2] == \
+        b'{"v": 2}'
+
+    draft = new.copy()
+    draft.remove_response('GET', '{}/cus_1/sources'.format(BASE))
+    newest = draft.freeze()
+    assert newest.dispatch(
+        MockRequest('GET', '{}/cus_1/sources'.format(BASE)))[0] == 404
+    assert sorted(newest.responses) == [
+        ('GET', '{}/cus_2/sources'.format(BASE))]
+    assert len(new.responses) == 2
+
+
+def test_version_layers():
+    router = Router().freeze()
+    for i in range(1000):
+        router = router.copy()
+        router.add_response('GET', '{}/cus_{}'.format(BASE, i), {}, 200)
+        router.freeze()
+        # merged as they pile up, into logarithmically many
+        assert len(router._layers) <= (i + 1).bit_length()
+    assert len(router.responses) == 1000
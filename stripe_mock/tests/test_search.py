@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+
+import pytest
+
+from ..fake import fake_customer, fake_subscription
+from ..search import SearchIndex, SearchQueryError, parse_query
+
+
+def test_parse_query():
+    query = parse_query(
+        "email:'tony@local.com' AND -metadata['plan']:\"pro\" created>10")
+    assert query.conjunction == 'AND'
+    assert [c.field for c in query.clauses] == [
+        'email', 'metadata.plan', 'created'
+    ]
+    assert query.clauses[1].negated
+    assert query.clauses[2].operator == '>'
+    assert query.clauses[2].value == 10
+
+
+@pytest.mark.parametrize('query', [
+    '',
+    "email:'a' AND",
+    "email:'a' AND status:'b' OR status:'c'",
+    'created>soon',
+    "email:'unterminated",
+])
+def test_parse_query_invalid(query):
+    with pytest.raises(SearchQueryError):
+        parse_query(query)
+
+
+def test_search_index():
+    index = SearchIndex(fields=('email', ))
+    for idx in range(30):
+        index.add(
+            fake_customer(
+                'cus_{}'.format(idx),
+                email='c{}@local.com'.format(idx % 3),
+                metadata={'tier': 'gold' if idx % 2 else 'free'},
+            ))
+
+    assert len(index.match("email:'c0@local.com'")) == 10
+    assert len(index.match("metadata['tier']:'gold'")) == 15
+    assert len(index.match(
+        "email:'c0@local.com' AND metadata['tier']:'gold'")) == 5
+    assert len(index.match(
+        "email:'c0@local.com' OR metadata['tier']:'gold'")) == 20
+    assert len(index.match("-metadata['tier']:'gold'")) == 15
+    assert len(index.match("email~'c1'")) == 10
+
+    data, total_count, next_page = index.search(
+        "metadata['tier']:'free'", limit=4)
+    assert [c['id'] for c in data] == ['cus_0', 'cus_2', 'cus_4', 'cus_6']
+    assert total_count == 15
+    data, _, next_page = index.search(
+        "metadata['tier']:'free'", limit=4, page=next_page)
+    assert data[0]['id'] == 'cus_8'
+
+    # re-indexing moves postings, removing drops them
+    index.add(fake_customer('cus_0', email='new@local.com'))
+    assert 'cus_0' not in index.match("email:'c0@local.com'")
+    assert index.match("email:'new@local.com'") == {'cus_0'}
+    index.remove('cus_0')
+    assert not index.match("email:'new@local.com'")
+
+
+def test_search_index_status():
+    index = SearchIndex(fields=('status', ))
+    index.add(fake_subscription('cus_ok', 'sub_1'))
+    index.add(fake_subscription('cus_ok', 'sub_2', status='canceled'))
+    assert index.match("status:'active'") == {'sub_1'}
+
+
+def test_search_while_indexing():
+    index = SearchIndex(fields=('email', ))
+
+    def customer(i):
+        return fake_customer(
+            'cus_{}'.format(i), email='c{}@local.com'.format(i % 3),
+            metadata={'tier': 'gold' if i % 2 else 'free'})
+
+    for i in range(200):
+        index.add(customer(i))
+    done = threading.Event()
+    errors = []
+
+    def search():
+        try:
+            while not done.is_set():
+                # scans of the objects, and rankings of the matches
+                data, total_count, _ = index.search(
+                    "email~'@' AND -metadata['tier']:'free'", limit=100)
+                assert len(data) == min(total_count, 100)
+                index.search("metadata['tier']:'gold'", limit=5)
+        except Exception as e:
+            errors.append(e)
+
+    searches = [threading.Thread(target=search) for _ in range(3)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)  # interleave searches with writes
+    try:
+        for thread in searches:
+            thread.start()
+        for i in range(200, 1500):
+            index.add(customer(i))
+            index.remove('cus_{}'.format(i - 150))
+    finally:
+        done.set()
+        for thread in searches:
+            thread.join()
+        sys.setswitchinterval(interval)
+
+    assert errors == []
+    assert len(index) == 200
+    assert len(index.match("metadata['tier']:'gold'")) == 100
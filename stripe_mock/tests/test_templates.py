@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+import requests
+import responses
+
+from ..fake import fake_customer, fake_plan
+from ..helpers import add_response
+from ..records import compact, to_json_default
+from ..templates import TEMPLATES, ResponseTemplate, render
+
+IDS = {
+    1: [('obj_1', ), ('ü"\\\n', ), ('', )],
+    2: [('cus_1', 'obj_1'), ('cus_ü', 'obj_"')],
+}
+OVERRIDES = [
+    {},
+    {'metadata': {'tier': 'pro'}},
+    {'id': 'overridden', 'livemode': True, 'extra': [1, None]},
+    {'created': 1, 'nested': compact(fake_plan('plan_1'))},
+]
+
+
+@pytest.mark.parametrize('object_type', sorted(TEMPLATES))
+@pytest.mark.parametrize('overrides', OVERRIDES)
+def test_render(object_type, overrides):
+    template = TEMPLATES[object_type]
+    for ids in IDS[template.arity]:
+        expected = json.dumps(
+            template.factory(*ids, **overrides),
+            default=to_json_default).encode('utf-8')
+        assert render(object_type, *ids, **overrides) == expected
+
+
+def test_render_fallback():
+    template = TEMPLATES['discount']
+    assert template.render('cus_1', None) == json.dumps(
+        template.factory('cus_1', None)).encode('utf-8')
+    assert TEMPLATES['customer'].render(None) == json.dumps(
+        fake_customer(None)).encode('utf-8')
+
+
+def test_uncompilable_factory():
+    with pytest.raises(ValueError):
+        ResponseTemplate(lambda object_id: {'id': object_id.upper()}, 1)
+
+
+@responses.activate
+def test_add_rendered_response():
+    url = 'https://api.stripe.com/v1/customers/cus_1'
+    add_response('GET', url, render('customer', 'cus_1'), 200)
+
+    assert requests.get(url).json() == fake_customer('cus_1')
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from ..timeindex import TimeIndex
+
+
+def _index():
+    index = TimeIndex()
+    # two customers, interleaved; in_3 and in_4 are created together
+    for i, created in enumerate([100, 200, 300, 400, 400, 500, 600]):
+        index.add({
+            'id': 'in_{}'.format(i),
+            'created': created,
+            'customer': 'cus_{}'.format(i % 2),
+        })
+    return index
+
+
+def _ids(page):
+    data, has_more = page
+    return [obj['id'] for obj in data], has_more
+
+
+def test_page():
+    index = _index()
+    assert len(index) == 7
+    assert _ids(index.page(limit=3)) == (['in_6', 'in_5', 'in_4'], True)
+    assert _ids(index.page(limit=3, starting_after='in_4')) == (
+        ['in_3', 'in_2', 'in_1'], True)
+    assert _ids(index.page(limit=3, starting_after='in_1')) == (
+        ['in_0'], False)
+    assert _ids(index.page(limit=2, ending_before='in_2')) == (
+        ['in_4', 'in_3'], True)
+    assert _ids(index.page(limit=2, ending_before='in_4')) == (
+        ['in_6', 'in_5'], False)
+
+    assert _ids(index.page(customer='cus_1')) == (
+        ['in_5', 'in_3', 'in_1'], False)
+    assert _ids(index.page(customer='cus_1', starting_after='in_4')) == (
+        ['in_3', 'in_1'], False)
+    assert _ids(index.page(customer='cus_nope')) == ([], False)
+
+    assert _ids(index.page(created=400)) == (['in_4', 'in_3'], False)
+    assert _ids(index.page(created={'gt': 200, 'lte': 500})) == (
+        ['in_5', 'in_4', 'in_3', 'in_2'], False)
+    assert _ids(index.page(limit=1, created={'gte': 200, 'lt': 400})) == (
+        ['in_2'], True)
+    assert _ids(index.page(
+        limit=2, created={'lt': 600}, starting_after='in_6')) == (
+            ['in_5', 'in_4'], True)
+
+    with pytest.raises(KeyError):
+        index.page(starting_after='in_nope')
+
+
+def test_reindex():
+    index = _index()
+    obj = index.get('in_0')
+    obj.update(created=700, customer='cus_1')
+    index.add(obj)
+    assert _ids(index.page(limit=1)) == (['in_0'], True)
+    assert _ids(index.page(customer='cus_0')) == (
+        ['in_6', 'in_4', 'in_2'], False)
+    assert [o['id'] for o in index][:2] == ['in_1', 'in_2']
+
+
+def test_versions():
+    index = _index()
+    entries = index._entries
+    # inserting out of order or removing publishes new lists...
+    index.add({'id': 'in_x', 'created': 150, 'customer': 'cus_0'})
+    index.add(dict(index.get('in_6'), created=50))
+    assert [entry[2]['id'] for entry in entries] == [
+        'in_{}'.format(i) for i in range(7)]
+    # ...appending doesn't disturb the prefix pages read
+    entries = index._entries
+    index.add({'id': 'in_y', 'created': 900, 'customer': 'cus_1'})
+    assert index._entries is entries
+    assert _ids(index.page(limit=2)) == (['in_y', 'in_5'], True)
+
+
+def test_extend():
+    index = _index()
+    index.extend(
+        {'id': 'in_x{}'.format(i), 'created': created, 'customer': 'cus_0'}
+        for i, created in enumerate([350, 50, 650]))
+    assert [o['created'] for o in index] == [
+        50, 100, 200, 300, 350, 400, 400, 500, 600, 650]
+    assert _ids(index.page(customer='cus_0', limit=2)) == (
+        ['in_x2', 'in_6'], True)
+    assert index.get('in_x1')['created'] == 50
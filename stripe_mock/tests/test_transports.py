@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from ..mock_api import StripeMockAPI
+from ..transports import AiohttpSession, httpx_transport
+
+BASE = 'https://api.stripe.com/v1'
+
+
+def _api():
+    api = StripeMockAPI()
+    for i in range(50):
+        api.add_customer('cus_{}'.format(i), email='c{}@example.com'.format(i))
+    return api
+
+
+def test_httpx_transport():
+    httpx = pytest.importorskip('httpx')
+    api = _api()
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx_transport(api)) as client:
+            return await asyncio.gather(*[
+                client.get('{}/customers/cus_{}'.format(BASE, i % 60))
+                for i in range(600)
+            ])
+
+    found = [r for r in asyncio.run(run()) if r.status_code == 200]
+    assert len(found) == 500
+    assert found[0].headers['content-type'] == 'application/json'
+    assert found[7].json()['id'] == 'cus_7'
+
+    with httpx.Client(transport=httpx_transport(api)) as client:
+        response = client.get('{}/customers/cus_nope'.format(BASE))
+        assert response.status_code == 404
+        assert response.json()['error']['message'] == (
+            'No such customer: cus_nope')
+
+        response = client.get('{}/payouts'.format(BASE))
+        assert response.status_code == 404
+        assert 'Unrecognized request URL' in (
+            response.json()['error']['message'])
+
+
+def test_aiohttp_session():
+    api = _api()
+
+    async def run():
+        async with AiohttpSession(api) as session:
+            responses = await asyncio.gather(*[
+                session.get('{}/customers/cus_{}'.format(BASE, i))
+                for i in range(50)
+            ])
+            async with session.get(
+                    '{}/customers/search'.format(BASE),
+                    params={'query': "email:'c3@example.com'"}) as response:
+                search = await response.json()
+            return responses, search
+
+    responses, search = asyncio.run(run())
+    assert [r.status for r in responses] == [200] * 50
+    assert asyncio.run(responses[9].json())['id'] == 'cus_9'
+    assert asyncio.run(responses[8].content.read()).startswith(b'{')
+    assert [c['id'] for c in search['data']] == ['cus_3']
+
+
+def test_stripe_async_client():
+    httpx = pytest.importorskip('httpx')
+    stripe = pytest.importorskip('stripe')
+    if not hasattr(stripe, 'HTTPXClient'):
+        pytest.skip('stripe has no async client')
+    api = _api()
+
+    http_client = stripe.HTTPXClient()
+    http_client._client_async = httpx.AsyncClient(
+        transport=httpx_transport(api))
+    client = stripe.StripeClient('sk_test_mock', http_client=http_client)
+
+    customer = asyncio.run(client.v1.customers.retrieve_async('cus_4'))
+    assert customer.email == 'c4@example.com'
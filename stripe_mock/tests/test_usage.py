@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import pytest
+import requests
+import responses
+
+from ..clock import add_interval
+from ..mock_api import StripeMockAPI
+from ..usage import UsageRecordError, UsageStore
+
+BASE = 'https://api.stripe.com/v1/subscription_items'
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+def test_aggregate(use_numpy):
+    if use_numpy:
+        pytest.importorskip('numpy')
+    store = UsageStore(use_numpy=use_numpy)
+    for quantity, timestamp in ((5, 10), (3, 25), (2, 12), (7, 10)):
+        store.append('si_a', quantity, timestamp)
+    # replaces the 5 and 7 at 10, not the 4 after it
+    store.append('si_a', 1, 10, action='set')
+    store.append('si_a', 4, 10)
+    store.extend('si_a', [6, 6], [31, 32])
+    assert store.count('si_a') == 8
+
+    boundaries = [0, 20, 30, 40, 50]
+    assert store.aggregate('si_a', boundaries) == [7, 3, 12, 0]
+    assert store.aggregate('si_a', boundaries, 'max') == [4, 3, 6, 0]
+    assert store.aggregate('si_a', boundaries, 'last_during_period') == [
+        2, 3, 6, 0]
+    assert store.aggregate('si_a', boundaries, 'last_ever') == [2, 3, 6, 6]
+    assert store.aggregate('si_nope', boundaries) == [0, 0, 0, 0]
+
+    with pytest.raises(UsageRecordError):
+        store.aggregate('si_a', boundaries, 'median')
+    with pytest.raises(UsageRecordError):
+        store.append('si_a', -1, 10)
+    with pytest.raises(UsageRecordError):
+        store.append('si_a', 1, 10, action='decrement')
+
+
+def _api():
+    s = StripeMockAPI()
+    s.add_plan('calls', usage_type='metered', aggregate_usage='sum')
+    s.add_plan('seats')
+    s.add_subscription('cus_a', 'sub_a', plan='calls', items={
+        'data': [{'id': 'si_calls', 'plan': 'calls', 'quantity': 1}],
+    })
+    subscription = s.find_subscription('sub_a')
+    subscription['start'] = add_interval(
+        subscription['current_period_start'], 'month', -1)
+    s.add_subscription('cus_a', 'sub_b', plan='seats', items={
+        'data': [{'id': 'si_seats', 'plan': 'seats', 'quantity': 1}],
+    })
+    return s
+
+
+@responses.activate
+def test_usage_requests():
+    s = _api()
+    subscription = s.find_subscription('sub_a')
+    now = s.clock.frozen_time
+    previous = add_interval(subscription['current_period_start'], 'month', -1)
+    s.add_usage_records('si_calls', [100, 50], [previous, previous + 60])
+    s.sync()
+
+    response = requests.post(
+        '{}/si_calls/usage_records'.format(BASE),
+        data={'quantity': 7, 'timestamp': now})
+    assert response.json()['quantity'] == 7
+    assert response.json()['subscription_item'] == 'si_calls'
+    requests.post(
+        '{}/si_calls/usage_records'.format(BASE),
+        data={'quantity': 3, 'timestamp': now, 'action': 'set'})
+    requests.post(
+        '{}/si_calls/usage_records'.format(BASE), data={'quantity': 2})
+
+    page = requests.get(
+        '{}/si_calls/usage_record_summaries'.format(BASE)).json()
+    assert [summary['total_usage'] for summary in page['data']] == [5, 150]
+    assert page['data'][0]['period'] == {
+        'start': subscription['current_period_start'],
+        'end': subscription['current_period_end'],
+    }
+
+    page = requests.get(
+        '{}/si_calls/usage_record_summaries'.format(BASE),
+        params={'limit': 1}).json()
+    assert page['has_more']
+    page = requests.get(
+        '{}/si_calls/usage_record_summaries'.format(BASE),
+        params={'limit': 1, 'starting_after': page['data'][0]['id']}).json()
+    assert [summary['total_usage'] for summary in page['data']] == [150]
+    assert not page['has_more']
+
+    response = requests.post(
+        '{}/si_seats/usage_records'.format(BASE), data={'quantity': 1})
+    assert response.status_code == 400
+    response = requests.post(
+        '{}/si_nope/usage_records'.format(BASE), data={'quantity': 1})
+    assert response.status_code == 404
+    response = requests.post(
+        '{}/si_calls/usage_records'.format(BASE), data={'quantity': 'x'})
+    assert response.json()['error']['param'] == 'quantity'
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Objects ordered by ``created``, for stripe's cursor paginated lists.
+
+``/v1/invoices`` and ``/v1/charges`` list newest first, filtered by a
+``created`` range and by customer, a page at a time. A :class:`TimeIndex`
+keeps its objects in a list sorted by (created, insertion order), and
+one such list per customer, so a page is two binary searches (the range
+and the cursor) and a slice: proportional to the page, not to the
+number of objects stored.
+
+Both lists hold the same ``(created, sequence, object)`` entries, so
+the per-customer lists cost a reference per object.
+
+Pages are read without locks. Writers only append to the lists in
+place, past the length a page reads up to; inserting elsewhere, or
+removing, publishes a new list instead, so a page comes from one
+consistent version of the index.
+"""
+import bisect
+import itertools
+import threading
+
+
+class TimeIndex(object):
+
+    """Stripe objects by id, ordered by ``created``, overall and per
+    customer.
+
+    Objects are kept by reference; call :meth:`add` again after changing
+    an object's ``created`` or ``customer``.
+    """
+
+    def __init__(self):
+        # (created, sequence, object), sorted
+        self._entries = []
+        self._customer_entries = {}
+        # (entry, customer id it's indexed under) by object id
+        self._by_id = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        """Iterate over the objects, oldest first."""
+        return (entry[2] for entry in list(self._entries))
+
+    def __contains__(self, object_id):
+        return object_id in self._by_id
+
+    def get(self, object_id):
+        """Return an object by id.
+
+        :raises: :class:`KeyError` if there's no such object
+        :rtype: dict
+        """
+        return self._by_id[object_id][0][2]
+
+    def add(self, obj):
+        """Store an object, or re-index one stored already.
+
+        :param obj: stripe object with ``id``, ``created`` and ``customer``
+        :type obj: dict
+        """
+        with self._lock:
+            customer_id = obj['customer']
+            previous = self._by_id.get(obj['id'])
+            if previous is not None:
+                entry, previous_customer_id = previous
+                if (entry[2] is obj and entry[0] == obj['created'] and
+                        previous_customer_id == customer_id):
+                    return
+                self._entries = _deleted(self._entries, entry)
+                self._customer_entries[previous_customer_id] = _deleted(
+                    self._customer_entries[previous_customer_id], entry)
+            entry = (obj['created'], next(self._sequence), obj)
+            self._by_id[obj['id']] = (entry, customer_id)
+            self._entries = _inserted(self._entries, entry)
+            self._customer_entries[customer_id] = _inserted(
+                self._customer_entries.get(customer_id, []), entry)
+
+    def extend(self, objects):
+        """Store many new objects at once, sorting once instead of
+        inserting one by one, e.g. for :meth:`StripeMockAPI.bulk_load`.
+
+        :param objects: stripe objects whose ids aren't stored yet
+        :type objects: iterable[dict]
+        """
+        with self._lock:
+            entries = list(self._entries)
+            customer_entries = {}
+            for obj in objects:
+                customer_id = obj['customer']
+                entry = (obj['created'], next(self._sequence), obj)
+                self._by_id[obj['id']] = (entry, customer_id)
+                entries.append(entry)
+                if customer_id not in customer_entries:
+                    customer_entries[customer_id] = list(
+                        self._customer_entries.get(customer_id, []))
+                customer_entries[customer_id].append(entry)
+            # appended runs are sorted already, which the sort detects
+            entries.sort()
+            self._entries = entries
+            for customer_id, appended in customer_entries.items():
+                appended.sort()
+                self._customer_entries[customer_id] = appended
+
+    def page(self, limit=10, starting_after=None, ending_before=None,
+             customer=None, created=None):
+        """Return one page of objects, newest first, like stripe's lists.
+
+        :param limit: page size
+        :type limit: int
+        :param starting_after: return objects older than this object id
+        :type starting_after: string
+        :param ending_before: return objects newer than this object id
+        :type ending_before: string
+        :param customer: only return this customer's objects
+        :type customer: string
+        :param created: an exact timestamp, or bounds by 'gt', 'gte',
+            'lt' and 'lte'
+        :type created: int or dict
+        :raises: :class:`KeyError` if a cursor is not a known object id
+        :returns: (objects, has_more)
+        :rtype: (list[dict], bool)
+        """
+        # the version of the list to read, up to its current length
+        if customer is None:
+            entries = self._entries
+        else:
+            entries = self._customer_entries.get(customer, [])
+        count = len(entries)
+        if not isinstance(created, dict):
+            created = {} if created is None else {
+                'gte': created,
+                'lte': created
+            }
+
+        def position(key):
+            return bisect.bisect_left(entries, key, 0, count)
+
+        low, high = 0, count
+        if 'gt' in created:
+            low = position((created['gt'] + 1, ))
+        if 'gte' in created:
+            low = max(low, position((created['gte'], )))
+        if 'lt' in created:
+            high = position((created['lt'], ))
+        if 'lte' in created:
+            high = min(high, position((created['lte'] + 1, )))
+
+        if ending_before is not None:
+            cursor = self._by_id[ending_before][0]
+            low = max(low, position((cursor[0], cursor[1] + 1)))
+            stop = min(high, low + limit)
+            data = [entry[2] for entry in entries[low:stop]]
+            data.reverse()
+            return data, stop < high
+
+        if starting_after is not None:
+            cursor = self._by_id[starting_after][0]
+            high = min(high, position(cursor[:2]))
+        start = max(low, high - limit)
+        data = [entry[2] for entry in entries[start:high]]
+        data.reverse()
+        return data, start > low
+
+
+def _inserted(entries, entry):
+    """Return the entries with one more: appended in place when it sorts
+    last, a new list otherwise."""
+    if not entries or entries[-1][:2] < entry[:2]:
+        entries.append(entry)
+        return entries
+    position = bisect.bisect_left(entries, entry[:2])
+    return entries[:position] + [entry] + entries[position:]
+
+
+def _deleted(entries, entry):
+    """Return a new list of the entries, but one."""
+    position = bisect.bisect_left(entries, entry[:2])
+    return entries[:position] + entries[position + 1:]
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""Serve a :class:`StripeMockAPI` to async HTTP clients, without sockets.
+
+:mod:`responses` only intercepts :mod:`requests`. For httpx, and stripe's
+async client on top of it, use :func:`httpx_transport`::
+
+    http_client = stripe.HTTPXClient()
+    http_client._client_async = httpx.AsyncClient(
+        transport=httpx_transport(api))
+    client = stripe.StripeClient('sk_test_...', http_client=http_client)
+
+For aiohttp, :class:`AiohttpSession` stands in for a
+:class:`aiohttp.ClientSession`, e.g. ``stripe.AIOHTTPClient(session=...)``.
+
+Both answer through :meth:`StripeMockAPI.dispatch`: every response is
+built in memory by plain function calls, so nothing awaits or blocks the
+event loop, however many coroutines are requesting at once. The latency
+of a :class:`~stripe_mock.faults.FaultInjector` is awaited with
+:func:`asyncio.sleep` by async clients, and slept by sync ones.
+"""
+import asyncio
+import json
+import time
+from urllib.parse import urlencode
+
+from .encoding import JSONList, encode_json, iter_body
+from .response_callbacks import unrecognized_request_url
+from .router import MockRequest
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+try:
+    from multidict import CIMultiDict
+except ImportError:  # pragma: no cover
+    CIMultiDict = dict
+
+
+def _plan(api, request):
+    """Return (delay, callable returning the response) of a request."""
+    if hasattr(api, 'plan'):
+        return api.plan(request)
+    return 0, lambda: api.dispatch(request)
+
+
+def _finish(request, response):
+    """Return (status, headers, body) of a dispatched request.
+
+    The body is bytes, or a :class:`~stripe_mock.encoding.JSONList` to
+    stream.
+    """
+    if response is None:
+        status, headers, body = unrecognized_request_url(
+            request.method, request.url)
+        body = encode_json(body)
+    else:
+        status, headers, body = response
+    headers = dict(headers)
+    headers.setdefault('Content-Type', 'application/json')
+    headers['Content-Length'] = str(len(body))
+    return status, headers, body
+
+
+def httpx_transport(api):
+    """Return an :class:`httpx.MockTransport` serving the API's stores.
+
+    Works for both :class:`httpx.Client` and :class:`httpx.AsyncClient`.
+
+    :param api: the mock whose stores are served, or a
+        :class:`~stripe_mock.faults.FaultInjector` in front of it
+    :type api: :class:`StripeMockAPI`
+    :rtype: :class:`httpx.MockTransport`
+    :raises: :class:`ImportError` if httpx isn't installed
+    """
+    if httpx is None:
+        raise ImportError('httpx is required for httpx_transport()')
+    return _HttpxTransport(api)
+
+
+def _httpx_response(request, respond):
+    status, headers, body = _finish(request, respond())
+    if isinstance(body, JSONList):
+        return httpx.Response(
+            status, headers=headers, stream=_HttpxStream(body))
+    return httpx.Response(status, headers=headers, content=body)
+
+
+if httpx is not None:
+
+    class _HttpxTransport(httpx.MockTransport):
+
+        """Answers through :func:`_plan`, sleeping or awaiting delays."""
+
+        def __init__(self, api):
+            super().__init__(None)
+            self.api = api
+
+        def _plan(self, request):
+            request = MockRequest(
+                request.method,
+                str(request.url),
+                dict(request.headers),
+                request.content,
+            )
+            return (request, ) + tuple(_plan(self.api, request))
+
+        def handle_request(self, request):
+            request.read()
+            request, delay, respond = self._plan(request)
+            if delay > 0:
+                time.sleep(delay)
+            return _httpx_response(request, respond)
+
+        async def handle_async_request(self, request):
+            await request.aread()
+            request, delay, respond = self._plan(request)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return _httpx_response(request, respond)
+
+    class _HttpxStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+
+        """Streams a list body to sync and async clients alike."""
+
+        def __init__(self, body):
+            self._body = body
+
+        def __iter__(self):
+            return iter(self._body)
+
+        async def __aiter__(self):
+            for chunk in self._body:
+                yield chunk
+
+
+class _StreamReader(object):
+
+    """The ``content`` of an :class:`AiohttpResponse`."""
+
+    def __init__(self, body):
+        self._chunks = iter_body(body)
+        self._pending = b''
+
+    async def read(self, n=-1):
+        if n < 0:
+            data = self._pending + b''.join(self._chunks)
+            self._pending = b''
+            return data
+        while len(self._pending) < n:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._pending += chunk
+        data, self._pending = self._pending[:n], self._pending[n:]
+        return data
+
+    async def iter_chunked(self, n):
+        while True:
+            data = await self.read(n)
+            if not data:
+                return
+            yield data
+
+
+class AiohttpResponse(object):
+
+    """The parts of :class:`aiohttp.ClientResponse` clients read."""
+
+    def __init__(self, method, url, status, headers, body):
+        self.method = method
+        self.url = url
+        self.status = status
+        self.headers = CIMultiDict(headers)
+        self.content = _StreamReader(body)
+        self._body = None
+
+    async def read(self):
+        if self._body is None:
+            self._body = await self.content.read()
+        return self._body
+
+    async def text(self, encoding='utf-8'):
+        return (await self.read()).decode(encoding)
+
+    async def json(self, **kwargs):
+        return json.loads(await self.read())
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise ValueError('{} error for {} {}'.format(
+                self.status, self.method, self.url))
+
+    def release(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class _RequestContext(object):
+
+    """Awaitable, or usable as ``async with``, like aiohttp's."""
+
+    def __init__(self, response):
+        self._response = response
+
+    def __await__(self):
+        return self._response.__await__()
+
+    async def __aenter__(self):
+        return await self._response
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class AiohttpSession(object):
+
+    """Stand-in for :class:`aiohttp.ClientSession` serving the API's stores.
+
+    :param api: the mock whose stores are served
+    :type api: :class:`StripeMockAPI`
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.closed = False
+
+    def request(self, method, url, params=None, data=None, headers=None,
+                **kwargs):
+        """Answer a request, ``await`` it or use it with ``async with``.
+
+        Other keyword arguments (timeout, proxy, ...) are ignored.
+        """
+        url = str(url)
+        if params:
+            url = '{}{}{}'.format(
+                url, '&' if '?' in url else '?', urlencode(params))
+        if isinstance(data, dict):
+            data = urlencode(data)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        request = MockRequest(
+            method.upper(), url, dict(headers or {}), data)
+        return _RequestContext(self._send(request))
+
+    async def _send(self, request):
+        delay, respond = _plan(self.api, request)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        status, headers, body = _finish(request, respond())
+        return AiohttpResponse(
+            request.method, request.url, status, headers, body)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    async def close(self):
+        self.closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""Metered usage records, stored as columns.
+
+Usage records arrive by the million, so they aren't stored as stripe
+objects: each subscription item has three typed arrays (timestamps,
+quantities and whether the record was an ``action=set``), appended to
+under a lock. A record is 17 bytes, and its stripe object is only built
+for the response to its creation.
+
+Usage summaries aggregate the records of each billing period the way
+the plan's ``aggregate_usage`` says ('sum', 'max', 'last_during_period'
+or 'last_ever'). With NumPy installed this is vectorized: records are
+sorted by timestamp (a no-op check when they arrive in order), and
+periods are cut out of the sorted columns with binary searches and
+prefix sums, instead of a Python loop per record.
+
+A ``set`` record replaces the records of the same timestamp received
+before it, as on stripe.
+"""
+import array
+import bisect
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+#: the ``aggregate_usage`` of metered plans
+AGGREGATIONS = ('sum', 'max', 'last_during_period', 'last_ever')
+#: the ``action`` of usage records
+ACTIONS = ('increment', 'set')
+
+
+class UsageRecordError(ValueError):
+
+    """Raised for usage records stripe would refuse."""
+    pass
+
+
+class _ItemUsage(object):
+
+    """Columns of one subscription item's usage records."""
+
+    __slots__ = ('timestamps', 'quantities', 'sets')
+
+    def __init__(self):
+        self.timestamps = array.array('q')
+        self.quantities = array.array('q')
+        self.sets = array.array('b')
+
+
+class UsageStore(object):
+
+    """Usage records of subscription items, append-only.
+
+    :param use_numpy: force (True) or avoid (False) NumPy aggregation,
+        defaults to using it when it's installed
+    :type use_numpy: bool
+    """
+
+    def __init__(self, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = np is not None
+        if use_numpy and np is None:
+            raise ImportError('numpy is required for use_numpy=True')
+        self.use_numpy = use_numpy
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of records, over all subscription items."""
+        return sum(len(usage.timestamps) for usage in self._items.values())
+
+    def count(self, item_id):
+        """Return the number of records of a subscription item.
+
+        :rtype: int
+        """
+        usage = self._items.get(item_id)
+        return 0 if usage is None else len(usage.timestamps)
+
+    def append(self, item_id, quantity, timestamp, action='increment'):
+        """Store a usage record.
+
+        :param item_id: id of the subscription item
+        :type item_id: string
+        :param quantity: usage quantity
+        :type quantity: int
+        :param timestamp: unix timestamp the usage occurred at
+        :type timestamp: int
+        :param action: 'increment', or 'set' to replace the usage recorded
+            at the same timestamp
+        :type action: string
+        :raises: :class:`UsageRecordError` for an unknown action or a
+            negative quantity
+        :returns: position of the record among the item's records
+        :rtype: int
+        """
+        if action not in ACTIONS:
+            raise UsageRecordError('Invalid action: {}'.format(action))
+        if quantity < 0:
+            raise UsageRecordError(
+                'Invalid quantity: must be a non-negative integer')
+        with self._lock:
+            usage = self._usage(item_id)
+            usage.timestamps.append(timestamp)
+            usage.quantities.append(quantity)
+            usage.sets.append(action == 'set')
+            return len(usage.timestamps) - 1
+
+    def extend(self, item_id, quantities, timestamps, action='increment'):
+        """Store many usage records of a subscription item at once.
+
+        :param quantities: usage quantities
+        :type quantities: iterable[int]
+        :param timestamps: unix timestamps, one per quantity
+        :type timestamps: iterable[int]
+        :returns: number of records stored
+        :rtype: int
+        """
+        if action not in ACTIONS:
+            raise UsageRecordError('Invalid action: {}'.format(action))
+        quantities = array.array('q', quantities)
+        timestamps = array.array('q', timestamps)
+        if len(quantities) != len(timestamps):
+            raise UsageRecordError(
+                'Got {} quantities for {} timestamps'.format(
+                    len(quantities), len(timestamps)))
+        if quantities and min(quantities) < 0:
+            raise UsageRecordError(
+                'Invalid quantity: must be a non-negative integer')
+        with self._lock:
+            usage = self._usage(item_id)
+            usage.timestamps.extend(timestamps)
+            usage.quantities.extend(quantities)
+            usage.sets.extend(
+                array.array('b', [action == 'set']) * len(quantities))
+        return len(quantities)
+
+    def _usage(self, item_id):
+        usage = self._items.get(item_id)
+        if usage is None:
+            usage = self._items[item_id] = _ItemUsage()
+        return usage
+
+    def aggregate(self, item_id, boundaries, aggregate_usage='sum'):
+        """Return the usage of a subscription item per period.
+
+        :param item_id: id of the subscription item
+        :type item_id: string
+        :param boundaries: ascending unix timestamps; period ``i`` runs
+            from ``boundaries[i]`` (included) to ``boundaries[i + 1]``
+        :type boundaries: list[int]
+        :param aggregate_usage: one of :data:`AGGREGATIONS`, None for 'sum'
+        :type aggregate_usage: string
+        :raises: :class:`UsageRecordError` for an unknown aggregation
+        :returns: usage of each period
+        :rtype: list[int]
+        """
+        aggregate_usage = aggregate_usage or 'sum'
+        if aggregate_usage not in AGGREGATIONS:
+            raise UsageRecordError(
+                'Invalid aggregate_usage: {}'.format(aggregate_usage))
+        periods = max(0, len(boundaries) - 1)
+
+        # copied under the lock, the arrays may be reallocated by appends
+        with self._lock:
+            usage = self._items.get(item_id)
+            if usage is None or not periods:
+                return [0] * periods
+            columns = (
+                usage.timestamps[:], usage.quantities[:], usage.sets[:])
+
+        if self.use_numpy:
+            return _aggregate_numpy(columns, boundaries, aggregate_usage)
+        return _aggregate_python(columns, boundaries, aggregate_usage)
+
+
+def _aggregate_numpy(columns, boundaries, aggregate_usage):
+    timestamps = np.frombuffer(columns[0], dtype=np.int64)
+    quantities = np.frombuffer(columns[1], dtype=np.int64)
+    sets = np.frombuffer(columns[2], dtype=np.int8).astype(bool)
+
+    if (np.diff(timestamps) < 0).any():
+        order = np.argsort(timestamps, kind='stable')
+        timestamps = timestamps[order]
+        quantities = quantities[order]
+        sets = sets[order]
+
+    if sets.any():
+        # keep the records at or after the last set of their timestamp
+        positions = np.arange(len(timestamps))
+        groups = np.cumsum(np.r_[True, timestamps[1:] != timestamps[:-1]]) - 1
+        last_sets = np.full(groups[-1] + 1, -1)
+        np.maximum.at(last_sets, groups[sets], positions[sets])
+        kept = positions >= last_sets[groups]
+        timestamps = timestamps[kept]
+        quantities = quantities[kept]
+
+    boundaries = np.asarray(boundaries, dtype=np.int64)
+    cuts = np.searchsorted(timestamps, boundaries, side='left')
+    starts, stops = cuts[:-1], cuts[1:]
+    present = stops > starts
+
+    if aggregate_usage == 'sum':
+        sums = np.concatenate(([0], np.cumsum(quantities)))
+        totals = sums[stops] - sums[starts]
+    elif aggregate_usage == 'max':
+        totals = np.zeros(len(starts), dtype=np.int64)
+        if present.any():
+            # reduceat over [start, stop) pairs; the padding keeps a stop
+            # at the end in range
+            padded = np.append(quantities, 0)
+            pairs = np.column_stack(
+                (starts[present], stops[present])).ravel()
+            totals[present] = np.maximum.reduceat(padded, pairs)[::2]
+    else:
+        # the last record before each period's stop
+        lasts = np.concatenate(([0], quantities))[stops]
+        if aggregate_usage == 'last_during_period':
+            totals = np.where(present, lasts, 0)
+        else:  # last_ever
+            totals = lasts
+    return totals.tolist()
+
+
+def _aggregate_python(columns, boundaries, aggregate_usage):
+    records = sorted(zip(columns[0], range(len(columns[0]))))
+    timestamps = [timestamp for timestamp, _ in records]
+    quantities = [columns[1][position] for _, position in records]
+    sets = [columns[2][position] for _, position in records]
+
+    if any(sets):
+        last_sets = {}
+        for position, timestamp in enumerate(timestamps):
+            if sets[position]:
+                last_sets[timestamp] = position
+        kept = [
+            position for position, timestamp in enumerate(timestamps)
+            if position >= last_sets.get(timestamp, -1)
+        ]
+        timestamps = [timestamps[position] for position in kept]
+        quantities = [quantities[position] for position in kept]
+
+    cuts = [
+        bisect.bisect_left(timestamps, boundary) for boundary in boundaries
+    ]
+    totals = []
+    for start, stop in zip(cuts[:-1], cuts[1:]):
+        if aggregate_usage == 'sum':
+            totals.append(sum(quantities[start:stop]))
+        elif aggregate_usage == 'max':
+            totals.append(max(quantities[start:stop], default=0))
+        elif aggregate_usage == 'last_during_period':
+            totals.append(quantities[stop - 1] if stop > start else 0)
+        else:  # last_ever
+            totals.append(quantities[stop - 1] if stop > 0 else 0)
+    return totals